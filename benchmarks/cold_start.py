@@ -0,0 +1,141 @@
+"""
+Cold start benchmark of the single-update entry point (serverless.py).
+
+Every run is a fresh interpreter that imports serverless, builds the
+application against a fake Bot API and processes /start, then a second
+update on the now warm instance. The first run fills the scratch stores
+(curriculum index, ...) the way an earlier deployment would have and is
+not counted. Fails (exit code 1) if the median cold start exceeds the
+budget or if modules that are off the hot path got imported.
+
+Usage:
+    python benchmarks/cold_start.py --runs 7
+    python benchmarks/cold_start.py --budget-ms 1000 --output results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from load_test import ROOT, fake_bot_api, git_commit, use_scratch_stores
+
+# Median milliseconds from the start of the import until the first update is
+# handled, excluding interpreter startup. About 460 ms measured
+# on a 4-core Linux VM; the budget leaves room for slower machines, not for
+# new eager imports
+BUDGET_MS = 900
+
+# Only imported when an update needs them (Q&A, a changed study plan, a refresh)
+LAZY_MODULES = ("numpy", "pypdf", "selenium", "requests", "bs4")
+
+
+def make_update(update_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "User"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+def measure(workdir):
+    """Run in a fresh interpreter: cold start one instance and print the timings as JSON."""
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import serverless
+
+    imported = time.perf_counter()
+    use_scratch_stores(workdir)
+    serverless.run(make_update(1, "/start"), request=fake_bot_api())
+    first_done = time.perf_counter()
+    serverless.run(make_update(2, "Start"))
+    second_done = time.perf_counter()
+
+    print(
+        json.dumps(
+            {
+                "import_ms": 1000 * (imported - started),
+                "cold_start_ms": 1000 * (first_done - started),
+                "warm_update_ms": 1000 * (second_done - first_done),
+                "lazy_modules_imported": [m for m in LAZY_MODULES if m in sys.modules],
+            }
+        )
+    )
+
+
+def run_once(workdir):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", workdir],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = 1000 * (time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="number of measured cold starts")
+    parser.add_argument(
+        "--budget-ms", type=float, default=BUDGET_MS, help="maximum median cold start"
+    )
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--measure", metavar="WORKDIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bot_cold_start_")
+    run_once(workdir)
+    runs = [run_once(workdir) for _ in range(args.runs)]
+
+    keys = ("import_ms", "cold_start_ms", "warm_update_ms", "process_ms")
+    medians = {key: statistics.median(r[key] for r in runs) for key in keys}
+    lazy_imported = sorted({m for r in runs for m in r["lazy_modules_imported"]})
+
+    print(f"{'':<18}{'median':>9}{'min':>9}{'max':>9}")
+    for key in keys:
+        values = [r[key] for r in runs]
+        print(f"{key:<18}{medians[key]:>9.1f}{min(values):>9.1f}{max(values):>9.1f}")
+    print(f"budget: cold_start_ms <= {args.budget_ms:.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "budget_ms": args.budget_ms,
+                    "medians": medians,
+                    "runs": runs,
+                },
+                f,
+                indent=2,
+            )
+
+    failed = False
+    if medians["cold_start_ms"] > args.budget_ms:
+        print(f"FAIL: cold start {medians['cold_start_ms']:.0f} ms is over the budget")
+        failed = True
+    if lazy_imported:
+        print(f"FAIL: imported during cold start: {', '.join(lazy_imported)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Load test of the bot's conversation flow with synthetic users.
+
+The real Application from main.py is built with a fake Bot API (no network)
+and synthetic users arrive as a Poisson process. Every user goes through
+/start -> Start -> Show Study Programs -> program -> download PDF.
+Latency is measured from putting an update into the application's update
+queue until all its handlers finished, so it includes queueing.
+
+Usage:
+    python benchmarks/load_test.py --users 2000 --rate 200 --output results.json
+    python benchmarks/load_test.py --users 2000 --rate 200 --compare results.json
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The flow of one user: (step name, handler, text)
+FLOW = [
+    ("start", "start", "/start"),
+    ("start_button", "start_conversation", "Start"),
+    ("show_programs", "show_programs", "Show Study Programs"),
+    ("select_program", "show_program_details", None),
+    ("download_pdf", "download_study_plan", "📄 Скачать учебный план"),
+]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean_ms": 1000 * sum(values) / len(values) if values else None,
+        "p50_ms": 1000 * percentile(values, 50) if values else None,
+        "p95_ms": 1000 * percentile(values, 95) if values else None,
+        "p99_ms": 1000 * percentile(values, 99) if values else None,
+        "max_ms": 1000 * values[-1] if values else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def use_scratch_stores(workdir, outbound_rate=None):
+    """Point every on-disk store to a scratch directory; call before main is imported."""
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    # The fake Bot API accepts any token, so a checkout without my_secrets.py works too
+    if "my_secrets" not in sys.modules and importlib.util.find_spec("my_secrets") is None:
+        sys.modules["my_secrets"] = types.SimpleNamespace(BOT_KEY="1:benchmark")
+
+    import config
+
+    config.DOCUMENT_CACHE_PATH = os.path.join(workdir, "file_ids.json")
+    config.PERSISTENCE_PATH = os.path.join(workdir, "bot_state.sqlite3")
+    config.CURRICULUM_INDEX_PATH = os.path.join(workdir, "curriculum.sqlite3")
+    config.STUDY_PLAN_SLICES_DIR = os.path.join(workdir, "slices")
+    config.SUBSCRIPTIONS_PATH = os.path.join(workdir, "subscriptions.sqlite3")
+    config.STUDY_PLAN_REFRESH_INTERVAL = None
+    config.METRICS_PORT = None
+    # The fake Bot API has no flood limits; throttle only when asked to
+    config.OUTGOING_MESSAGES_PER_SECOND = outbound_rate
+
+
+def prepare_environment(workdir, outbound_rate=None):
+    """Point every on-disk store to a scratch directory and import main."""
+    use_scratch_stores(workdir, outbound_rate)
+
+    import main
+
+    return main
+
+
+def fake_bot_api(delay=0):
+    """Return a Bot API stand-in (telegram.request.BaseRequest) answering after `delay` seconds."""
+    from telegram.request import BaseRequest
+
+    class FakeBotAPI(BaseRequest):
+        """Bot API stand-in answering every call after a fixed delay."""
+
+        message_ids = itertools.count(1)
+
+        def __init__(self, delay):
+            self.delay = delay
+            self.calls = defaultdict(int)
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        @property
+        def read_timeout(self):
+            return None
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            endpoint = url.rsplit("/", 1)[-1]
+            self.calls[endpoint] += 1
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            params = request_data.parameters if request_data else {}
+            if endpoint == "getMe":
+                result = {
+                    "id": 1,
+                    "is_bot": True,
+                    "first_name": "Benchmark",
+                    "username": "benchmark_bot",
+                }
+            elif endpoint.startswith(("send", "edit")):
+                result = {
+                    "message_id": next(self.message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": params.get("chat_id", 0), "type": "private"},
+                }
+                if endpoint == "sendDocument":
+                    result["document"] = {
+                        "file_id": "benchmark-file-id",
+                        "file_unique_id": "benchmark",
+                    }
+            else:
+                result = True
+            return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    return FakeBotAPI(delay)
+
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    workdir = tempfile.mkdtemp(prefix="bot_benchmark_")
+    main = prepare_environment(workdir, args.outbound_rate)
+
+    api = fake_bot_api(args.api_delay_ms / 1000)
+    app = main.build_application(request=api)
+
+    pending = {}
+
+    async def mark_done(update, context):
+        future = pending.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    # Runs after every other handler group has finished with the update
+    app.add_handler(TypeHandler(Update, mark_done), group=10**6)
+
+    update_ids = itertools.count(1)
+    program_names = [p.name for p in main.snapshot.catalog.programs]
+    latencies = defaultdict(list)
+    errors = 0
+
+    def make_update(chat_id, text):
+        message = {
+            "message_id": next(update_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(text)}
+            ]
+        return Update.de_json({"update_id": next(update_ids), "message": message}, app.bot)
+
+    async def user(chat_id):
+        nonlocal errors
+        for step, handler, text in FLOW:
+            text = text or random.choice(program_names)
+            update = make_update(chat_id, text)
+            future = asyncio.get_running_loop().create_future()
+            pending[update.update_id] = future
+            started = time.perf_counter()
+            await app.update_queue.put(update)
+            try:
+                finished = await asyncio.wait_for(future, args.timeout)
+            except asyncio.TimeoutError:
+                errors += 1
+                pending.pop(update.update_id, None)
+                return
+            latencies[(step, handler)].append(finished - started)
+            if args.think_time_ms:
+                await asyncio.sleep(random.expovariate(1000 / args.think_time_ms))
+
+    async with app:
+        await app.start()
+        await app.post_init(app)
+
+        started = time.perf_counter()
+        users = []
+        for chat_id in range(1, args.users + 1):
+            users.append(asyncio.create_task(user(chat_id)))
+            # Poisson arrivals
+            await asyncio.sleep(random.expovariate(args.rate))
+        await asyncio.gather(*users)
+        elapsed = time.perf_counter() - started
+
+        await app.stop()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "parameters": {
+            "users": args.users,
+            "arrival_rate": args.rate,
+            "think_time_ms": args.think_time_ms,
+            "api_delay_ms": args.api_delay_ms,
+            "concurrent_updates": main.CONCURRENT_UPDATES,
+            "outbound_rate": args.outbound_rate,
+        },
+        "elapsed_s": elapsed,
+        "updates": len(all_latencies),
+        "timeouts": errors,
+        "throughput_updates_per_s": len(all_latencies) / elapsed if elapsed else None,
+        "api_calls": dict(api.calls),
+        "overall": summarize(all_latencies),
+        "steps": {
+            step: {"handler": handler, **summarize(latencies[(step, handler)])}
+            for step, handler, _ in FLOW
+        },
+    }
+    return results
+
+
+def print_report(results):
+    print(
+        f"{results['updates']} updates in {results['elapsed_s']:.2f} s, "
+        f"{results['throughput_updates_per_s']:.1f} updates/s, "
+        f"{results['timeouts']} timeouts"
+    )
+    print(f"{'step':<16}{'handler':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    rows = list(results["steps"].items()) + [("overall", {"handler": "", **results["overall"]})]
+    for step, stats in rows:
+        if not stats["count"]:
+            continue
+        print(
+            f"{step:<16}{stats['handler']:<24}"
+            f"{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+        )
+
+
+def print_comparison(results, baseline):
+    """Print p50/p95 changes per step against results of an earlier run."""
+    print(f"Compared to {baseline.get('commit') or 'baseline'}:")
+    rows = list(results["steps"].items()) + [("overall", results["overall"])]
+    for step, stats in rows:
+        before = baseline["steps"].get(step) if step != "overall" else baseline["overall"]
+        if not before or not before.get("count") or not stats["count"]:
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms"):
+            change = 100 * (stats[key] - before[key]) / before[key]
+            changes.append(f"{key[:3]} {change:+.1f}%")
+        print(f"  {step:<16}{', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="number of synthetic users")
+    parser.add_argument("--rate", type=float, default=100.0, help="user arrivals per second")
+    parser.add_argument(
+        "--think-time-ms", type=float, default=0, help="mean pause between a user's steps"
+    )
+    parser.add_argument(
+        "--api-delay-ms", type=float, default=20, help="simulated Bot API round trip"
+    )
+    parser.add_argument(
+        "--outbound-rate",
+        type=float,
+        help="throttle outgoing messages to this many per second (default: no throttling)",
+    )
+    parser.add_argument("--timeout", type=float, default=30, help="per-update timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
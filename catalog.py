@@ -0,0 +1,266 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+from telegram import KeyboardButton, ReplyKeyboardMarkup
+
+# Button labels
+START_BUTTON = "Start"
+SHOW_PROGRAMS_BUTTON = "Show Study Programs"
+BACK_BUTTON = "◀️ Back to Start"
+DOWNLOAD_BUTTON = "📄 Скачать учебный план"
+PREVIEW_BUTTON = "👀 Первая страница плана"
+SEMESTER_BUTTON = "📑 План одного семестра"
+OTHER_PROGRAM_BUTTON = "🔄 Выбрать другую программу"
+ASK_BUTTON = "💬 Задать вопрос о программе"
+SUBSCRIBE_BUTTON = "🔔 Следить за изменениями"
+
+NO_DESCRIPTION = "Описание программы отсутствует."
+
+# Telegram message length limit
+MAX_MESSAGE_LENGTH = 4096
+
+# Label of the button for one semester's part of the study plan: "2 семестр"
+SEMESTER_LABEL = "{} семестр"
+SEMESTER_LABEL_RE = re.compile(r"^(\d+) семестр$")
+
+
+def normalize(text):
+    """Normalize a program name for lookups: case, ё/е, punctuation and spacing."""
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"[^\w]+", " ", text)
+    return " ".join(text.split())
+
+
+def truncate_message(text: str) -> str:
+    """Cut text to MAX_MESSAGE_LENGTH, ending it with "…" if it was longer."""
+    if len(text) <= MAX_MESSAGE_LENGTH:
+        return text
+    return text[: MAX_MESSAGE_LENGTH - 1] + "…"
+
+
+def _keyboard(*rows):
+    return ReplyKeyboardMarkup(
+        [[KeyboardButton(label) for label in row] for row in rows],
+        resize_keyboard=True,
+    )
+
+
+@dataclass(frozen=True)
+class Program:
+    """A study program with its prebuilt reply text."""
+
+    id: str
+    url: str
+    name: str
+    description: str
+    path_to_study_plan: str | None
+    aliases: tuple = ()
+    details_text: str = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self,
+            "details_text",
+            f"Подробнее о программе {self.name}:\n\n"
+            f"{self.description or NO_DESCRIPTION}\n\n"
+            f"Нажмите '{DOWNLOAD_BUTTON}' чтобы получить PDF документ с учебным планом, "
+            f"'{SEMESTER_BUTTON}' — курсы одного семестра.\n"
+            "Курсы семестра: /courses <семестр>, трудоемкость курса: /credits <название>.",
+        )
+
+
+# Fields of a program file: name -> (accepted types, required)
+PROGRAM_FIELDS = {
+    "url": (str, True),
+    "name": (str, True),
+    "aliases": (list, False),
+    "description": ((str, type(None)), False),
+    "path_to_study_plan": ((str, type(None)), False),
+}
+
+
+def _validate_program(info, file_path):
+    """Raise ValueError naming the file if a field is missing, unknown or of the wrong type."""
+    if not isinstance(info, dict):
+        raise ValueError(f"Invalid program file {file_path}: expected an object")
+    unknown = sorted(info.keys() - PROGRAM_FIELDS.keys())
+    if unknown:
+        raise ValueError(f"Invalid program file {file_path}: unknown field {unknown[0]!r}")
+    for key, (types, required) in PROGRAM_FIELDS.items():
+        if key not in info:
+            if required:
+                raise ValueError(f"Invalid program file {file_path}: {key!r} is missing")
+            continue
+        if not isinstance(info[key], types):
+            raise ValueError(
+                f"Invalid program file {file_path}: {key!r} has the wrong type "
+                f"{type(info[key]).__name__}"
+            )
+    for key in ("url", "name"):
+        if not info[key].strip():
+            raise ValueError(f"Invalid program file {file_path}: {key!r} is empty")
+    if not all(isinstance(alias, str) for alias in info.get("aliases", ())):
+        raise ValueError(f"Invalid program file {file_path}: 'aliases' must be a list of strings")
+
+
+class ProgramCatalog:
+    """
+    Read-only index of study programs built once at startup.
+
+    Every lookup a handler needs (program by button label or typed name,
+    program by id, keyboards and texts) is precomputed here, so handling a
+    message is a couple of dictionary lookups regardless of catalog size.
+    """
+
+    def __init__(self, programs):
+        self.programs = tuple(programs)
+        self.by_id = MappingProxyType({p.id: p for p in self.programs})
+
+        by_name = {}
+        for program in self.programs:
+            for alias in (program.id, *program.aliases):
+                by_name.setdefault(normalize(alias), program)
+        # Exact button labels always win over aliases
+        for program in self.programs:
+            by_name[program.name] = program
+            by_name[normalize(program.name)] = program
+        self.by_name = MappingProxyType(by_name)
+
+        programs_str = "\n".join(f"- {p.name}" for p in self.programs)
+        self.programs_text = (
+            f"Список программ:\n{programs_str}\n\n"
+            "Напишите название программы, чтобы узнать подробности."
+        )
+
+        self.start_keyboard = _keyboard([START_BUTTON])
+        self.welcome_keyboard = _keyboard([SHOW_PROGRAMS_BUTTON])
+        self.programs_keyboard = _keyboard(
+            *([p.name] for p in self.programs), [BACK_BUTTON]
+        )
+        self.program_keyboard = _keyboard(
+            [DOWNLOAD_BUTTON],
+            [PREVIEW_BUTTON, SEMESTER_BUTTON],
+            [ASK_BUTTON],
+            [SUBSCRIBE_BUTTON],
+            [BACK_BUTTON],
+            [OTHER_PROGRAM_BUTTON],
+        )
+        self.after_download_keyboard = _keyboard([OTHER_PROGRAM_BUTTON], [BACK_BUTTON])
+        # program ids -> keyboard offering just these programs
+        self._choice_keyboards = {}
+        # semesters -> keyboard offering their parts of a study plan
+        self._semester_keyboards = {}
+
+    @classmethod
+    def from_config(cls, study_programs):
+        """
+        Build the catalog from a mapping of program URL -> program info
+
+        Args:
+            study_programs: Mapping of program URL -> dict with name, description,
+                path_to_study_plan and optional aliases
+
+        Returns:
+            ProgramCatalog instance
+        """
+        programs = []
+        for url, info in study_programs.items():
+            name = info["name"]
+            aliases = [*info.get("aliases", ()), *name.split("/")]
+            programs.append(
+                Program(
+                    id=url.rstrip("/").rsplit("/", 1)[-1],
+                    url=url,
+                    name=name,
+                    description=info.get("description") or "",
+                    path_to_study_plan=info.get("path_to_study_plan"),
+                    aliases=tuple(a.strip() for a in aliases if a.strip()),
+                )
+            )
+        return cls(programs)
+
+    @classmethod
+    def from_directory(cls, path):
+        """
+        Build the catalog from a directory with one JSON file per program
+
+        Each file holds an object with url, name and optionally aliases,
+        description and path_to_study_plan. Programs are listed in file name order.
+
+        Args:
+            path: Directory with the program files
+
+        Returns:
+            ProgramCatalog instance
+
+        Raises:
+            ValueError: If a file is invalid or two files describe the same program
+        """
+        study_programs = {}
+        for filename in sorted(os.listdir(path)):
+            if not filename.endswith(".json"):
+                continue
+            file_path = os.path.join(path, filename)
+            try:
+                with open(file_path, encoding="utf-8") as f:
+                    info = json.load(f)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"Invalid program file {file_path}: {e!r}") from e
+            _validate_program(info, file_path)
+            url = info["url"]
+            if url in study_programs:
+                raise ValueError(f"{file_path}: program {url} is already defined")
+            study_programs[url] = info
+        return cls.from_config(study_programs)
+
+    def __len__(self):
+        return len(self.programs)
+
+    def choice_keyboard(self, program_ids):
+        """Return a keyboard with buttons for the given programs, built once per combination."""
+        key = tuple(program_ids)
+        keyboard = self._choice_keyboards.get(key)
+        if keyboard is None:
+            keyboard = _keyboard(
+                *([self.by_id[p].name] for p in key), [OTHER_PROGRAM_BUTTON], [BACK_BUTTON]
+            )
+            if len(self._choice_keyboards) < 1000:
+                self._choice_keyboards[key] = keyboard
+        return keyboard
+
+    def semester_keyboard(self, semesters):
+        """Return a keyboard with a button per semester and the full plan, built once per combination."""
+        key = tuple(semesters)
+        keyboard = self._semester_keyboards.get(key)
+        if keyboard is None:
+            keyboard = self._semester_keyboards[key] = _keyboard(
+                [SEMESTER_LABEL.format(s) for s in key],
+                [DOWNLOAD_BUTTON],
+                [OTHER_PROGRAM_BUTTON],
+            )
+        return keyboard
+
+    def find(self, text):
+        """Return the program matching a button label or typed name, or None."""
+        program = self.by_name.get(text)
+        if program is None:
+            program = self.by_name.get(normalize(text))
+        return program
+
+
+def directory_signature(path):
+    """Return a value that changes whenever a program file in `path` is added, removed or edited."""
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return None
+    return tuple(
+        sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in entries
+            if entry.name.endswith(".json")
+        )
+    )
@@ -0,0 +1,525 @@
+"""
+Multi-process mode: one front process receiving webhook updates and N worker processes.
+
+The front routes every update to a worker by consistent hashing of its
+chat id, so all updates of a chat go to the same worker, in order, and its
+conversation state stays in that worker's memory. Workers are local
+processes each running the full bot; they share the SQLite stores.
+
+When a worker is added or removed (or dies and is restarted), the hash
+ring changes and some chats move to another worker. Forwarding is paused,
+the workers finish their queued updates and write the moved chats' state
+to the database and forget it; the new owner loads it from there.
+
+Usage:
+    python cluster.py front --workers 4
+    kill -USR1 <front pid>    # add a worker
+    kill -USR2 <front pid>    # remove a worker
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import hmac
+import itertools
+import json
+import secrets
+import signal
+import subprocess
+import sys
+
+import httpx
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as WebApplication, RequestHandler
+
+# Seconds a worker may take to start (it builds the indexes before it's ready)
+WORKER_START_TIMEOUT = 120
+# Seconds a worker may take to finish its queued updates before a rebalance
+RELEASE_TIMEOUT = 60
+# Updates forwarded to a worker in one request
+FORWARD_BATCH_SIZE = 100
+
+
+def _hash(value):
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of worker names.
+
+    Each worker owns `replicas` points on the ring and a key belongs to the
+    first point after its hash. Adding or removing a worker only moves the
+    keys of that worker's points, about 1/N of all keys.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        self.nodes = tuple(sorted(set(nodes)))
+        points = sorted(
+            (_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        if not self._hashes:
+            raise LookupError("The hash ring has no nodes")
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+def chat_id_of(data):
+    """
+    Return the chat (or else user) id of a raw update, like Update.effective_chat
+
+    Args:
+        data: Update as decoded from Telegram's JSON
+
+    Returns:
+        The id, or None for updates without a chat or user
+    """
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return None
+
+
+# Worker process
+
+
+class _WorkerHandler(RequestHandler):
+    def initialize(self, worker):
+        self.worker = worker
+
+
+class _UpdatesHandler(_WorkerHandler):
+    async def post(self):
+        from telegram import Update
+
+        app = self.worker.app
+        for data in json.loads(self.request.body):
+            await app.update_queue.put(Update.de_json(data, app.bot))
+
+
+class _RingHandler(_WorkerHandler):
+    async def post(self):
+        nodes = json.loads(self.request.body)["nodes"]
+        released = await self.worker.rebalance(nodes)
+        self.write({"released": released})
+
+
+class _HealthHandler(_WorkerHandler):
+    def get(self):
+        self.write("ok")
+
+
+class Worker:
+    """One bot process serving the chats the front routes to it."""
+
+    def __init__(self, app, name):
+        self.app = app
+        self.name = name
+
+    async def rebalance(self, nodes):
+        """Release the chats this worker no longer owns on a ring of `nodes`; return their number."""
+        import main
+        from persistence import loaded_chat_ids, release_chats
+
+        ring = HashRing(nodes)
+        try:
+            # The front stopped forwarding; let the updates already here finish
+            await asyncio.wait_for(self.app.update_queue.join(), RELEASE_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"{self.name}: updates still running, releasing chats anyway")
+        moved = {
+            chat_id
+            for chat_id in loaded_chat_ids(self.app)
+            if self.name not in ring.nodes or ring.node_for(chat_id) != self.name
+        }
+        # Routing is by chat id, which in private chats is the user id
+        await release_chats(self.app, chat_ids=moved, user_ids=moved)
+        main.sessions.forget(moved)
+        return len(moved)
+
+    async def serve(self, port):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+
+        async with self.app:
+            await self.app.start()
+            await self.app.post_init(self.app)
+            server = HTTPServer(
+                WebApplication(
+                    [
+                        (r"/updates", _UpdatesHandler, {"worker": self}),
+                        (r"/ring", _RingHandler, {"worker": self}),
+                        (r"/health", _HealthHandler, {"worker": self}),
+                    ]
+                )
+            )
+            server.listen(port, "127.0.0.1")
+            print(f"{self.name} listening on 127.0.0.1:{port}")
+            await stop.wait()
+            server.stop()
+            await self.app.stop()
+        await self.app.post_shutdown(self.app)
+
+
+def run_worker(name, port, primary=False, metrics_port=None, bot_api_url=None):
+    """Run a worker process until it gets SIGTERM."""
+    if bot_api_url:
+        import config
+
+        config.BOT_API_BASE_URL = bot_api_url
+    import main
+
+    app = main.build_application(primary=primary, metrics_port=metrics_port)
+    asyncio.run(Worker(app, name).serve(port))
+
+
+# Front process
+
+
+class _TelegramHandler(RequestHandler):
+    def initialize(self, front, secret_token):
+        self.front = front
+        self.secret_token = secret_token
+
+    async def post(self):
+        token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") or ""
+        # Constant-time, so the token can't be guessed from response times
+        if self.secret_token and not hmac.compare_digest(
+            token.encode(), self.secret_token.encode()
+        ):
+            self.set_status(403)
+            return
+        try:
+            await self.front.route(json.loads(self.request.body))
+        except Exception as e:
+            # Telegram retries the update later
+            print(f"Error routing update: {e}")
+            self.set_status(500)
+
+
+class Front:
+    """Receives updates and routes them to worker processes it starts and supervises."""
+
+    def __init__(self, worker_port, metrics_port=None, bot_api_url=None, worker_command=None):
+        """
+        Args:
+            worker_port: Port of the first worker; the others get the next ports
+            metrics_port: Metrics port of the first worker, None disables metrics
+            bot_api_url: Bot API server URL passed to the workers (optional)
+            worker_command: Command line running this module's main(), the
+                worker's arguments are appended to it; by default this file
+                run by the current interpreter
+        """
+        self.worker_port = worker_port
+        self.metrics_port = metrics_port
+        self.bot_api_url = bot_api_url
+        # Unbuffered, so the workers' output shows up in the front's log right away
+        self.worker_command = list(worker_command or [sys.executable, "-u", __file__])
+        self.ring = HashRing()
+        self.processes = {}
+        self.ports = {}
+        self.queues = {}
+        self.forwarders = {}
+        self._indexes = itertools.count()
+        self._routing = asyncio.Event()
+        self._routing.set()
+        self._rebalance_lock = asyncio.Lock()
+        self._client = httpx.AsyncClient(timeout=RELEASE_TIMEOUT + 10)
+        self._stopping = False
+
+    def _url(self, name, path):
+        return f"http://127.0.0.1:{self.ports[name]}{path}"
+
+    async def _spawn(self, name):
+        """Start a worker process and wait until it answers."""
+        index = int(name.rsplit("-", 1)[1])
+        command = [*self.worker_command, "worker", "--name", name]
+        command += ["--port", str(self.ports[name])]
+        if index == 0:
+            command.append("--primary")
+        if self.metrics_port:
+            command += ["--metrics-port", str(self.metrics_port + index)]
+        if self.bot_api_url:
+            command += ["--bot-api-url", self.bot_api_url]
+        self.processes[name] = subprocess.Popen(command)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WORKER_START_TIMEOUT
+        while loop.time() < deadline:
+            if self.processes[name].poll() is not None:
+                raise RuntimeError(f"{name} exited with code {self.processes[name].returncode}")
+            try:
+                response = await self._client.get(self._url(name, "/health"))
+                if response.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+        raise RuntimeError(f"{name} did not start in {WORKER_START_TIMEOUT} s")
+
+    async def add_worker(self):
+        """Start a new worker and give it its share of the chats."""
+        index = next(self._indexes)
+        name = f"worker-{index}"
+        self.ports[name] = self.worker_port + index
+        await self._spawn(name)
+        self.queues[name] = asyncio.Queue()
+        self.forwarders[name] = asyncio.create_task(self._forward(name))
+        await self.rebalance((*self.ring.nodes, name))
+        print(f"{name} added, workers: {', '.join(self.ring.nodes)}")
+
+    async def remove_worker(self, name=None):
+        """Move a worker's chats to the others and stop it; the newest one by default."""
+        if len(self.ring.nodes) <= 1:
+            print("Not removing the last worker")
+            return
+        name = name or max(self.ring.nodes, key=lambda n: int(n.rsplit("-", 1)[1]))
+        await self.rebalance(tuple(n for n in self.ring.nodes if n != name))
+        await self._stop_worker(name)
+        print(f"{name} removed, workers: {', '.join(self.ring.nodes)}")
+
+    async def _stop_worker(self, name):
+        self.forwarders.pop(name).cancel()
+        del self.queues[name]
+        process = self.processes.pop(name)
+        process.terminate()
+        await asyncio.to_thread(process.wait)
+
+    async def rebalance(self, nodes):
+        """
+        Switch routing to a ring of `nodes`
+
+        Forwarding pauses while the workers finish the updates they already
+        have and release the chats that move away from them.
+        """
+        async with self._rebalance_lock:
+            self._routing.clear()
+            try:
+                # Everything accepted so far reaches its (old) worker first
+                await asyncio.gather(*(queue.join() for queue in self.queues.values()))
+                alive = [n for n in self.processes if self.processes[n].poll() is None]
+                responses = await asyncio.gather(
+                    *(
+                        self._client.post(self._url(n, "/ring"), json={"nodes": list(nodes)})
+                        for n in alive
+                    ),
+                    return_exceptions=True,
+                )
+                for name, response in zip(alive, responses):
+                    if isinstance(response, Exception):
+                        print(f"{name} did not release its chats: {response}")
+                self.ring = HashRing(nodes)
+            finally:
+                self._routing.set()
+
+    async def route(self, data):
+        """Hand an update to the worker owning its chat; return once the worker has it."""
+        await self._routing.wait()
+        key = chat_id_of(data)
+        name = self.ring.node_for(key if key is not None else data.get("update_id"))
+        future = asyncio.get_running_loop().create_future()
+        self.queues[name].put_nowait((data, future))
+        await future
+
+    async def _forward(self, name):
+        """Send queued updates to a worker in order, in batches."""
+        queue = self.queues[name]
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < FORWARD_BATCH_SIZE:
+                batch.append(queue.get_nowait())
+            try:
+                response = await self._client.post(
+                    self._url(name, "/updates"), json=[data for data, _ in batch]
+                )
+                response.raise_for_status()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def supervise(self):
+        """Restart workers that died, moving their chats to the others meanwhile."""
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for name, process in list(self.processes.items()):
+                if process.poll() is None or self._stopping:
+                    continue
+                print(f"{name} exited with code {process.returncode}, restarting")
+                others = tuple(n for n in self.ring.nodes if n != name)
+                if others:
+                    await self.rebalance(others)
+                try:
+                    await self._spawn(name)
+                except RuntimeError as e:
+                    print(e)
+                    continue
+                await self.rebalance((*others, name))
+
+    async def stop(self):
+        self._stopping = True
+        for name in list(self.processes):
+            await self._stop_worker(name)
+        await self._client.aclose()
+
+
+async def _serve_front(workers, listen, port, path, webhook_url, secret_token, front):
+    for _ in range(workers):
+        await front.add_worker()
+
+    server = HTTPServer(
+        WebApplication(
+            [
+                (
+                    rf"/{path.strip('/')}",
+                    _TelegramHandler,
+                    {"front": front, "secret_token": secret_token},
+                )
+            ]
+        )
+    )
+    server.listen(port, listen)
+    print(f"Front listening on {listen}:{port}/{path.strip('/')}")
+
+    if webhook_url:
+        from telegram import Bot, Update
+
+        from config import BOT_API_BASE_URL
+        from my_secrets import BOT_KEY
+
+        kwargs = {}
+        if BOT_API_BASE_URL:
+            kwargs["base_url"] = BOT_API_BASE_URL
+        async with Bot(BOT_KEY, **kwargs) as bot:
+            await bot.set_webhook(
+                webhook_url, secret_token=secret_token, allowed_updates=Update.ALL_TYPES
+            )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.create_task(front.add_worker()))
+    loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.create_task(front.remove_worker()))
+    supervisor = asyncio.create_task(front.supervise())
+
+    await stop.wait()
+    server.stop()
+    supervisor.cancel()
+    await front.stop()
+
+
+def run_front(
+    workers,
+    listen,
+    port,
+    path,
+    webhook_url=None,
+    secret_token=None,
+    worker_port=8600,
+    metrics_port=None,
+    bot_api_url=None,
+):
+    """
+    Run the front process with `workers` worker processes until SIGTERM/SIGINT
+
+    Args:
+        workers: Number of worker processes to start with
+        listen: Interface of the webhook server
+        port: Port of the webhook server
+        path: URL path of the webhook
+        webhook_url: Public URL registered with Telegram; None skips setWebhook
+            (e.g. for local tests posting updates directly)
+        secret_token: Token Telegram must send with updates (optional)
+        worker_port: Port of the first worker, the others use the following ports
+        metrics_port: Metrics port of the first worker, the others use the following ports
+        bot_api_url: Bot API server URL for the workers (optional)
+    """
+
+    if webhook_url and not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+
+    async def serve():
+        front = Front(worker_port, metrics_port=metrics_port, bot_api_url=bot_api_url)
+        await _serve_front(workers, listen, port, path, webhook_url, secret_token, front)
+
+    asyncio.run(serve())
+
+
+def main():
+    from config import (
+        CLUSTER_WORKERS,
+        CLUSTER_WORKER_PORT,
+        METRICS_PORT,
+        WEBHOOK_LISTEN,
+        WEBHOOK_PORT,
+        WEBHOOK_PATH,
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    front = commands.add_parser("front", help="receive updates and route them to workers")
+    front.add_argument("--workers", type=int, default=CLUSTER_WORKERS)
+    front.add_argument("--listen", default=WEBHOOK_LISTEN)
+    front.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    front.add_argument("--path", default=WEBHOOK_PATH)
+    front.add_argument("--worker-port", type=int, default=CLUSTER_WORKER_PORT)
+    front.add_argument("--metrics-port", type=int, default=METRICS_PORT)
+    front.add_argument("--bot-api-url", help="Bot API server for the workers")
+    front.add_argument(
+        "--webhook-url", help="register this URL with Telegram (default: don't)"
+    )
+
+    worker = commands.add_parser("worker", help="run one worker (started by the front)")
+    worker.add_argument("--name", required=True)
+    worker.add_argument("--port", type=int, required=True)
+    worker.add_argument("--primary", action="store_true")
+    worker.add_argument("--metrics-port", type=int)
+    worker.add_argument("--bot-api-url")
+
+    args = parser.parse_args()
+    if args.command == "front":
+        run_front(
+            args.workers,
+            args.listen,
+            args.port,
+            args.path,
+            webhook_url=args.webhook_url,
+            worker_port=args.worker_port,
+            metrics_port=args.metrics_port,
+            bot_api_url=args.bot_api_url,
+        )
+    else:
+        run_worker(
+            args.name,
+            args.port,
+            primary=args.primary,
+            metrics_port=args.metrics_port,
+            bot_api_url=args.bot_api_url,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from catalog import normalize, truncate_message
+from curriculum import ELECTIVE
+from qa import STEM_LENGTH, TfidfIndex, stems
+from search import synonym_variants, tokenize
+
+# Courses listed per section of a comparison, the largest first
+COURSES_SHOWN = 15
+
+# Similarity from which a course counts as matching the interests
+MATCH_THRESHOLD = 0.2
+
+# Programs and electives listed in a recommendation
+PROGRAMS_SHOWN = 5
+ELECTIVES_SHOWN = 10
+
+
+def _semesters(semesters):
+    return ", ".join(map(str, semesters)) + " сем."
+
+
+@dataclass(frozen=True)
+class PairComparison:
+    """Courses two programs share and don't, as column indexes of the course matrix."""
+
+    common: tuple
+    only_first: tuple
+    only_second: tuple
+    # Credits both plans give to common courses, divided by the credits of either plan
+    overlap: float
+
+
+class CourseComparison:
+    """
+    The courses of all programs' study plans as a program × course matrix.
+
+    Built once per set of plan versions; everything a comparison needs
+    (pairwise common and distinct courses, overlap) is computed with the
+    matrix, and the texts are kept once formatted. Interests are scored
+    against all course titles at once: one matrix-vector product of TF-IDF
+    vectors, then one more to sum the scores per program.
+    """
+
+    def __init__(self, programs, courses_by_program):
+        """
+        Args:
+            programs: Programs in catalog order
+            courses_by_program: Mapping of program id -> list of curriculum Course records
+        """
+        self.programs = tuple(programs)
+        self._row = {p.id: i for i, p in enumerate(self.programs)}
+
+        # Courses are matched across programs by normalized title
+        columns = {}
+        self.course_names = []
+        # (row, column) -> [credits, semesters, kinds]
+        details = {}
+        for row, program in enumerate(self.programs):
+            for course in courses_by_program.get(program.id, ()):
+                key = normalize(course.name)
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = len(self.course_names)
+                    self.course_names.append(course.name)
+                entry = details.setdefault((row, column), [0, set(), set()])
+                # A course offered in several semesters is listed once per semester,
+                # each time with the credits of the whole course
+                entry[0] = max(entry[0], course.credits)
+                entry[1].add(course.semester)
+                entry[2].add(course.kind)
+
+        # Credits of each course in each plan; zero-credit courses are only in `present`
+        shape = (len(self.programs), len(self.course_names))
+        self.credits = np.zeros(shape, dtype=np.float32)
+        self.present = np.zeros(shape, dtype=bool)
+        self.electives = np.zeros(shape, dtype=bool)
+        self._semesters = {}
+        for (row, column), (credits, semesters, kinds) in details.items():
+            self.credits[row, column] = credits
+            self.present[row, column] = True
+            self.electives[row, column] = kinds == {ELECTIVE}
+            self._semesters[row, column] = tuple(sorted(semesters))
+        present = self.present
+        self._plan_credits = self.credits.sum(axis=1)
+
+        # Pairwise tables for every pair of programs
+        self._pairs = {}
+        for a in range(len(self.programs)):
+            shared = np.minimum(self.credits[a], self.credits).sum(axis=1)
+            either = np.maximum(self.credits[a], self.credits).sum(axis=1)
+            overlap = np.divide(shared, either, out=np.zeros_like(shared), where=either > 0)
+            for b in range(a + 1, len(self.programs)):
+                self._pairs[a, b] = PairComparison(
+                    common=self._by_credits(present[a] & present[b], a),
+                    only_first=self._by_credits(present[a] & ~present[b], a),
+                    only_second=self._by_credits(present[b] & ~present[a], b),
+                    overlap=float(overlap[b]),
+                )
+        # (first, second) -> formatted comparison
+        self._texts = {}
+        self.summary_text = self._summary()
+
+        # TF-IDF vectors of course titles by word stems, one row per course column
+        self._titles = TfidfIndex(self.course_names, analyze=stems)
+
+    @classmethod
+    def build(cls, catalog, curriculum):
+        """Build the comparison of a ProgramCatalog's programs from a CurriculumIndex."""
+        return cls(
+            catalog.programs,
+            {program.id: curriculum.courses(program.id) for program in catalog.programs},
+        )
+
+    def _by_credits(self, mask, row):
+        columns = np.flatnonzero(mask)
+        order = np.argsort(-self.credits[row, columns], kind="stable")
+        return tuple(int(c) for c in columns[order])
+
+    def has_courses(self, program_id):
+        return bool(self.present[self._row[program_id]].any())
+
+    def pair(self, first_id, second_id):
+        """Return the PairComparison of two programs, common and distinct courses by credits."""
+        a, b = self._row[first_id], self._row[second_id]
+        if a < b:
+            return self._pairs[a, b]
+        pair = self._pairs[b, a]
+        return PairComparison(pair.common, pair.only_second, pair.only_first, pair.overlap)
+
+    def _course_lines(self, columns, row, other_row=None):
+        lines = []
+        for column in columns[:COURSES_SHOWN]:
+            line = f"- {self.course_names[column]} — {self.credits[row, column]:g} з.е."
+            if other_row is not None:
+                line += f" / {self.credits[other_row, column]:g} з.е."
+            else:
+                line += f", {_semesters(self._semesters[row, column])}"
+            lines.append(line)
+        if len(columns) > COURSES_SHOWN:
+            lines.append(f"… и ещё {len(columns) - COURSES_SHOWN}")
+        return lines
+
+    def compare_text(self, first_id, second_id):
+        """Return the comparison of two programs' study plans as a message."""
+        text = self._texts.get((first_id, second_id))
+        if text is not None:
+            return text
+
+        first = self.programs[self._row[first_id]]
+        second = self.programs[self._row[second_id]]
+        a, b = self._row[first_id], self._row[second_id]
+        pair = self.pair(first_id, second_id)
+        missing = [p.name for p in (first, second) if not self.has_courses(p.id)]
+        if missing:
+            text = "Учебный план не найден: " + ", ".join(f"«{name}»" for name in missing)
+        else:
+            common_credits = sum(self.credits[a, c] for c in pair.common)
+            lines = [
+                f"«{first.name}» и «{second.name}»: общих курсов {len(pair.common)} "
+                f"({common_credits:g} з.е. в первой программе), "
+                f"учебные планы совпадают на {100 * pair.overlap:.0f}%.",
+            ]
+            if pair.common:
+                lines += ["", "Общие курсы (з.е. в первой / во второй программе):"]
+                lines += self._course_lines(pair.common, a, b)
+            for program, row, columns in (
+                (first, a, pair.only_first),
+                (second, b, pair.only_second),
+            ):
+                if columns:
+                    lines += ["", f"Только в «{program.name}» ({len(columns)}):"]
+                    lines += self._course_lines(columns, row)
+            text = truncate_message("\n".join(lines))
+        self._texts[first_id, second_id] = text
+        return text
+
+    def _summary(self):
+        lines = ["Сходство учебных планов:"]
+        for (a, b), pair in self._pairs.items():
+            lines.append(
+                f"- «{self.programs[a].name}» и «{self.programs[b].name}»: "
+                f"общих курсов {len(pair.common)}, совпадение {100 * pair.overlap:.0f}%"
+            )
+        return truncate_message("\n".join(lines))
+
+    def score(self, text):
+        """
+        Score every course title against interests or background described in free text
+
+        Returns:
+            Array of cosine similarities, one per course column; all zeros
+            if no word of the text occurs in any course title
+        """
+        vector = self._titles.weigh(
+            (variant[:STEM_LENGTH], weight)
+            for token in tokenize(text)
+            for variant, weight in synonym_variants(token)
+        )
+        return self._titles.matrix @ vector
+
+    def recommend_text(self, text, program_id=None):
+        """
+        Recommend programs and electives for interests described in free text
+
+        Args:
+            text: Interests or background of the applicant
+            program_id: Program to pick electives in; the best matching one if None
+                or not in the comparison
+
+        Returns:
+            Message text
+        """
+        scores = self.score(text)
+        if not scores.any():
+            return (
+                "Не нашёл курсов по этим интересам. Попробуйте другие слова, "
+                "например названия дисциплин."
+            )
+
+        # Programs are ranked by the share of their credits weighted by similarity
+        fit = np.divide(
+            self.credits @ scores,
+            self._plan_credits,
+            out=np.zeros(len(self.programs), dtype=np.float32),
+            where=self._plan_credits > 0,
+        )
+        matching = self.present & (scores >= MATCH_THRESHOLD)
+        matching_counts = matching.sum(axis=1)
+        matching_credits = (self.credits * matching).sum(axis=1)
+        ranking = np.argsort(-fit, kind="stable")[:PROGRAMS_SHOWN]
+        lines = ["Программы по вашим интересам:"]
+        for place, row in enumerate(ranking, 1):
+            lines.append(
+                f"{place}. {self.programs[row].name} — подходящих курсов "
+                f"{matching_counts[row]} ({matching_credits[row]:g} з.е.)"
+            )
+
+        row = self._row.get(program_id)
+        if row is None:
+            row = int(ranking[0])
+        elective_scores = np.where(self.electives[row], scores, 0)
+        best = np.argsort(-elective_scores, kind="stable")[:ELECTIVES_SHOWN]
+        best = [int(c) for c in best if elective_scores[c] > 0]
+        if best:
+            lines += [
+                "",
+                f"Курсы по выбору программы «{self.programs[row].name}», которые подходят:",
+            ]
+            for column in best:
+                lines.append(
+                    f"- {self.course_names[column]} — {self.credits[row, column]:g} з.е., "
+                    f"{_semesters(self._semesters[row, column])}"
+                )
+        else:
+            lines += [
+                "",
+                f"Подходящих курсов по выбору в «{self.programs[row].name}» не нашлось.",
+            ]
+        return truncate_message("\n".join(lines))
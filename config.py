@@ -1,15 +1,85 @@
-from descripitions import AI_DESC, AI_PRODUCT
-
-# Porgram alias: path to study plan
-STUDY_PROGRAMS = {
-    "https://abit.itmo.ru/program/master/ai": {
-        "name": "Искусственный интеллект",
-        "description": AI_DESC,
-        "path_to_study_plan": "study_plans/ai.pdf",
-    },
-    "https://abit.itmo.ru/program/master/ai_product": {
-        "name": "Управление ИИ-продуктами/AI Product",
-        "description": AI_PRODUCT,
-        "path_to_study_plan": "study_plans/ai_product.pdf",
-    },
-}
+# Directory with one JSON file per study program (url, name, aliases,
+# description, path_to_study_plan). Programs are listed in file name order
+PROGRAMS_DIR = "programs"
+# Seconds between checks of PROGRAMS_DIR for changed files, None disables reloading
+PROGRAMS_RELOAD_INTERVAL = 5
+
+# Telegram file_ids of uploaded study plans, persisted across restarts
+DOCUMENT_CACHE_PATH = "study_plans/file_ids.json"
+
+# How the bot receives updates: "polling", "webhook" or "cluster"
+BOT_MODE = "polling"
+
+# Embedded webhook server. Telegram sends updates to WEBHOOK_URL, which must
+# be routed (usually by a reverse proxy) to WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "telegram"
+WEBHOOK_URL = None
+
+# BOT_MODE = "cluster": a front process receives the webhook and routes each
+# chat's updates to one of CLUSTER_WORKERS local worker processes, listening on
+# 127.0.0.1:CLUSTER_WORKER_PORT and the following ports
+CLUSTER_WORKERS = 4
+CLUSTER_WORKER_PORT = 8600
+
+# Number of updates handled in parallel; updates of one chat stay ordered
+CONCURRENT_UPDATES = 64
+
+# Bot API server, e.g. "http://127.0.0.1:8081/bot" for a local or fake server.
+# None means the official https://api.telegram.org
+BOT_API_BASE_URL = None
+
+# Outgoing message limits, kept below Telegram's flood limits. Replies to users
+# are sent before bulk messages. None for OUTGOING_MESSAGES_PER_SECOND disables throttling
+OUTGOING_MESSAGES_PER_SECOND = 30
+CHAT_MESSAGES_PER_SECOND = 1
+GROUP_MESSAGES_PER_MINUTE = 20
+# Messages a chat may get at once before its pacing starts
+CHAT_MESSAGE_BURST = 3
+
+# SQLite database with conversation states and user data
+PERSISTENCE_PATH = "bot_state.sqlite3"
+# Seconds between writes of changed conversations and user data
+PERSISTENCE_UPDATE_INTERVAL = 5
+# Seconds without updates after which a user's session expires: the selected
+# program is forgotten and the conversation starts over with a notice
+SESSION_TTL = 2 * 60 * 60
+# Bytes of memory for sessions and conversation states; beyond it the least
+# recently active ones are written to PERSISTENCE_PATH and dropped from memory
+SESSION_MEMORY_LIMIT = 256 * 2**20
+# Seconds between checks for idle sessions and the memory limit, None disables them
+SESSION_EVICTION_INTERVAL = 60
+
+# Seconds between automatic study plan refreshes, None disables them
+STUDY_PLAN_REFRESH_INTERVAL = 6 * 60 * 60
+# Study plans downloaded at the same time during a refresh
+STUDY_PLAN_REFRESH_WORKERS = 2
+
+# Seconds Telegram may serve inline query results ("@bot <query>") from its own cache
+INLINE_CACHE_TIME = 300
+
+# Subscriptions of chats to program updates and the progress of broadcasts
+SUBSCRIPTIONS_PATH = "subscriptions.sqlite3"
+# Chats notified concurrently by a broadcast; the rate limiter paces the actual sends
+BROADCAST_BATCH_SIZE = 50
+# Chats allowed to list, pause and resume broadcasts
+ADMIN_CHAT_IDS = ()
+
+# Courses extracted from the study plans, re-parsed when a PDF changes
+CURRICULUM_INDEX_PATH = "study_plans/curriculum.sqlite3"
+# Per-semester PDFs and first-page previews cut from the study plans, one
+# subdirectory per PDF version. Previews are images if pymupdf is installed
+STUDY_PLAN_SLICES_DIR = "study_plans/slices"
+
+# Chat model for questions about programs: any OpenAI-compatible server
+# (OpenAI, llama.cpp, Ollama, vLLM). An API key can be set as LLM_API_KEY in my_secrets.py
+LLM_BASE_URL = "http://127.0.0.1:8080/v1"
+LLM_MODEL = "local-model"
+
+# Prometheus metrics served on http://METRICS_LISTEN:METRICS_PORT/metrics, None disables them
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT = 9108
+# Updates taking longer than this many seconds get their stacks sampled and
+# served on /profile of the metrics server. None disables the profiler
+SLOW_UPDATE_PROFILE_THRESHOLD = None
@@ -0,0 +1,214 @@
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+from document_cache import content_hash
+
+REQUIRED = "required"
+ELECTIVE = "elective"
+
+# "1 Course name 3 108" or "1, 2, 3 Course name 1 36"
+COURSE_RE = re.compile(r"^(\d(?:\s*,\s*\d)*)\s+(.+?)\s+(\d+)\s+(\d+)$")
+# "Пул выборных дисциплин. 1 семестр 15 540"
+SECTION_RE = re.compile(r"^(\D.*?)\s+(\d+)\s+(\d+)$")
+
+ELECTIVE_MARKERS = ("выбор", "элективн", "факультатив")
+REQUIRED_MARKERS = ("обязательн", "гиа", "государственн")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    program TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS courses (
+    program TEXT NOT NULL,
+    semester INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    section TEXT NOT NULL,
+    credits INTEGER NOT NULL,
+    hours INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS courses_program_semester ON courses (program, semester);
+"""
+
+
+@dataclass(frozen=True)
+class Course:
+    """One course of a study plan in one semester."""
+
+    semester: int
+    name: str
+    kind: str
+    section: str
+    credits: int
+    hours: int
+
+
+def _kind(section, block):
+    lowered = section.lower()
+    if any(m in lowered for m in ELECTIVE_MARKERS):
+        return ELECTIVE
+    if any(m in lowered for m in REQUIRED_MARKERS):
+        return REQUIRED
+    # Sections without a marker inherit it from their block (e.g. "Блок 4. Факультативные ...")
+    if any(m in block.lower() for m in ELECTIVE_MARKERS):
+        return ELECTIVE
+    return REQUIRED
+
+
+def iter_courses(pages):
+    """
+    Extract the course table from the pages of an ITMO study plan
+
+    Args:
+        pages: Pages of the plan, e.g. pypdf's PdfReader(path).pages
+
+    Yields:
+        (page index, Course); a course taught in several semesters gets one per semester
+    """
+    block = ""
+    section = ""
+    for index, page in enumerate(pages):
+        for line in (page.extract_text() or "").splitlines():
+            line = " ".join(line.split())
+
+            match = COURSE_RE.match(line)
+            if match:
+                semesters, name, credits, hours = match.groups()
+                for semester in semesters.split(","):
+                    yield index, Course(
+                        semester=int(semester),
+                        name=name,
+                        kind=_kind(section, block),
+                        section=section,
+                        credits=int(credits),
+                        hours=int(hours),
+                    )
+                continue
+
+            match = SECTION_RE.match(line)
+            if match:
+                section = match.group(1)
+                if section.startswith("Блок"):
+                    block = section
+
+
+def parse_study_plan(pdf_path):
+    """
+    Extract the course table of an ITMO study plan PDF
+
+    Args:
+        pdf_path: Path to the study plan PDF
+
+    Returns:
+        List of Course records; a course taught in several semesters gets one per semester
+    """
+    # Imported here: plans are parsed only when a PDF changed, not on every start
+    from pypdf import PdfReader
+
+    return [course for _, course in iter_courses(PdfReader(pdf_path).pages)]
+
+
+class CurriculumIndex:
+    """
+    Parsed study plans of all programs in a SQLite file.
+
+    A plan is parsed once per PDF version: the index remembers the SHA-256
+    of the PDF each program's courses were extracted from and re-parses only
+    when the file in study_plans/ changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._hashes = dict(self._connection.execute("SELECT program, sha256 FROM plans"))
+        # program -> SHA-256 of a PDF that couldn't be parsed, tried again once it changes
+        self._broken = {}
+
+    def ensure(self, program, pdf_path):
+        """
+        Make sure the index holds the courses of the current version of a plan
+
+        Args:
+            program: Program id
+            pdf_path: Path to the program's study plan PDF
+
+        Returns:
+            True if the plan is indexed, False if the PDF doesn't exist or
+            can't be parsed
+        """
+        try:
+            sha256 = content_hash(pdf_path)
+        except FileNotFoundError:
+            return False
+        if self._hashes.get(program) == sha256:
+            return True
+        if self._broken.get(program) == sha256:
+            return False
+
+        try:
+            courses = parse_study_plan(pdf_path)
+        except Exception as e:
+            # pypdf raises all kinds of errors on damaged files
+            self._broken[program] = sha256
+            print(f"Study plan of {program} not indexed: {type(e).__name__}: {e}")
+            return False
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM courses WHERE program = ?", (program,))
+            self._connection.executemany(
+                "INSERT INTO courses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (program, c.semester, c.name, c.kind, c.section, c.credits, c.hours)
+                    for c in courses
+                ],
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO plans VALUES (?, ?)", (program, sha256)
+            )
+        self._hashes[program] = sha256
+        self._broken.pop(program, None)
+        return True
+
+    def sha256(self, program):
+        """Return the SHA-256 of the indexed version of a program's plan, or None."""
+        return self._hashes.get(program)
+
+    def _query(self, sql, params):
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [Course(*row) for row in rows]
+
+    def courses(self, program, semester=None):
+        """Return the courses of a program, optionally only those of one semester."""
+        columns = "semester, name, kind, section, credits, hours"
+        if semester is None:
+            return self._query(
+                f"SELECT {columns} FROM courses WHERE program = ? ORDER BY semester, rowid",
+                (program,),
+            )
+        return self._query(
+            f"SELECT {columns} FROM courses WHERE program = ? AND semester = ? ORDER BY rowid",
+            (program, semester),
+        )
+
+    def find(self, program, query):
+        """Return the courses of a program whose name contains the query (case-insensitive)."""
+        needle = query.lower().replace("ё", "е")
+        return [
+            c
+            for c in self.courses(program)
+            if needle in c.name.lower().replace("ё", "е")
+        ]
+
+    def semesters(self, program):
+        """Return the semesters a program has courses in."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT semester FROM courses WHERE program = ? ORDER BY semester",
+                (program,),
+            ).fetchall()
+        return [row[0] for row in rows]
@@ -0,0 +1,143 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cluster mode, one process uses the cache
+    fcntl = None
+
+
+def file_sha256(path, chunk_size=1 << 16):
+    """Return the hex SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# path -> ((mtime_ns, size), sha256), so files are only re-hashed when they change
+_hashes = {}
+
+
+def content_hash(path):
+    """Return the SHA-256 of a file, reusing the last value while the file is unchanged."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _hashes.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    digest = file_sha256(path)
+    _hashes[path] = (signature, digest)
+    return digest
+
+
+class DocumentCache:
+    """
+    Persistent map of program -> Telegram file_id of its uploaded study plan.
+
+    Telegram returns a file_id after the first upload of a document; sending
+    that id later costs no upload at all. Entries are stored together with the
+    SHA-256 of the PDF they were made from, so replacing a file in
+    study_plans/ invalidates its file_id automatically.
+
+    Several processes (cluster workers) may share the file: a change is
+    merged into the file's current contents under an exclusive lock on
+    `<path>.lock`, and entries written by other processes are picked up when
+    the file changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # program -> {"sha256": ..., "file_id": ...}
+        self._entries = {}
+        # (mtime_ns, size) of the file when it was last read
+        self._signature = None
+        self._load()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        self._signature = self._file_signature()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._entries = {}
+
+    def _reload_if_changed(self):
+        if self._file_signature() != self._signature:
+            self._load()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Hold the lock on the file against other processes, with the latest entries loaded."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Unlocked when the file is closed
+            self._load()
+            yield
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._signature = self._file_signature()
+
+    def get(self, program, pdf_path):
+        """
+        Get the cached file_id for a program's study plan
+
+        Args:
+            program: Program key
+            pdf_path: Path to the local PDF the file_id must correspond to
+
+        Returns:
+            The Telegram file_id or None if the PDF was never uploaded or changed since
+        """
+        with self._lock:
+            self._reload_if_changed()
+        entry = self._entries.get(program)
+        if not entry:
+            return None
+        if entry.get("sha256") != content_hash(pdf_path):
+            return None
+        return entry.get("file_id")
+
+    def put(self, program, pdf_path, file_id):
+        """Remember the file_id Telegram returned for a program's study plan."""
+        sha256 = content_hash(pdf_path)
+        with self._lock, self._file_lock():
+            self._entries[program] = {"sha256": sha256, "file_id": file_id}
+            self._save()
+
+    def invalidate(self, program, file_id=None):
+        """
+        Forget the file_id of a program, forcing a re-upload on the next send
+
+        Args:
+            program: Program key
+            file_id: The file_id found not to work; if another process has
+                stored a different one meanwhile, that one is kept
+        """
+        with self._lock, self._file_lock():
+            entry = self._entries.get(program)
+            if entry is None or (file_id is not None and entry.get("file_id") != file_id):
+                return
+            del self._entries[program]
+            self._save()
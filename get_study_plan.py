@@ -1,7 +1,12 @@
 import os
-import time
+import queue
+import shutil
+import tempfile
+import threading
 import urllib.parse
 from pathlib import Path
+
+import trio
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -12,54 +17,229 @@ from selenium.common.exceptions import (
     TimeoutException,
     NoSuchElementException,
     ElementNotInteractableException,
+    WebDriverException,
+)
+from study_plan_fetcher import (
+    create_session,
+    fetch_study_plan,
+    download_pdf,
+    write_atomically,
 )
 
+# List of possible selectors for the study plan download button
+BUTTON_SELECTORS = [
+    # Exact text match
+    "//button[text()='Скачать учебный план']",
+    # Contains text
+    "//button[contains(text(), 'Скачать учебный план')]",
+    # By class name
+    "//button[contains(@class, 'ButtonSimple_button__JbIQ5')]",
+    "//button[contains(@class, 'ButtonSimple_button_masterProgram__JK8b_')]",
+    # Broader search for buttons with similar text
+    "//button[contains(text(), 'учебный план')]",
+    "//a[contains(text(), 'Скачать учебный план')]",
+    "//a[contains(text(), 'учебный план')]",
+    # Generic download buttons
+    "//button[contains(text(), 'Скачать')]",
+    "//a[contains(text(), 'Скачать')]",
+]
+
+# Seconds after the click within which a download must begin
+DOWNLOAD_START_TIMEOUT = 5
+
+
+class BrowserSession:
+    """A warm headless Chrome with its own, initially empty download directory."""
+
+    def __init__(self):
+        self.download_dir = tempfile.mkdtemp(prefix="study_plan_")
+
+        chrome_options = Options()
+        prefs = {
+            "download.default_directory": self.download_dir,
+            "download.prompt_for_download": False,
+            "plugins.always_open_pdf_externally": True,  # Don't open PDF in browser
+        }
+        chrome_options.add_experimental_option("prefs", prefs)
+
+        # Add additional options for better automation
+        chrome_options.add_argument("--headless")  # Run in headless mode
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--window-size=1920,1080")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--disable-notifications")
+
+        self.driver = webdriver.Chrome(options=chrome_options)
+
+    def reset(self):
+        """Empty the download directory."""
+        for entry in os.scandir(self.download_dir):
+            os.remove(entry.path)
+
+    def download(self, start, timeout=30):
+        """
+        Start a download and wait until the browser reports it completed
+
+        Waits for the DevTools Browser.downloadWillBegin and
+        Browser.downloadProgress events on the driver's CDP connection, so
+        the end of the download is reported by Chrome rather than polled.
+
+        Args:
+            start: Function starting the download, e.g. clicking a button;
+                it's called once the events are being listened to
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            Path to the downloaded file or None if no download began within
+            DOWNLOAD_START_TIMEOUT seconds, was canceled or didn't finish in time
+        """
+        return trio.run(self._download, start, timeout)
+
+    async def _download(self, start, timeout):
+        deadline = trio.current_time() + timeout
+        async with self.driver.bidi_connection() as connection:
+            session, devtools = connection.session, connection.devtools
+            await session.execute(
+                devtools.browser.set_download_behavior(
+                    behavior="allow", download_path=self.download_dir, events_enabled=True
+                )
+            )
+            events = session.listen(
+                devtools.browser.DownloadWillBegin, devtools.browser.DownloadProgress
+            )
+            # WebDriver commands are blocking HTTP requests
+            await trio.to_thread.run_sync(start)
+
+            filenames = {}
+            with trio.move_on_at(min(deadline, trio.current_time() + DOWNLOAD_START_TIMEOUT)):
+                async for event in events:
+                    if isinstance(event, devtools.browser.DownloadWillBegin):
+                        filenames[event.guid] = event.suggested_filename
+                        break
+            if not filenames:
+                return None
 
-def download_study_plan_pdf(url, output_path=None):
+            with trio.move_on_at(deadline):
+                async for event in events:
+                    if not isinstance(event, devtools.browser.DownloadProgress):
+                        continue
+                    if event.guid not in filenames:
+                        continue
+                    if event.state == "completed":
+                        # file_path isn't reported on every platform
+                        return event.file_path or os.path.join(
+                            self.download_dir, filenames[event.guid]
+                        )
+                    if event.state == "canceled":
+                        return None
+        return None
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        finally:
+            shutil.rmtree(self.download_dir, ignore_errors=True)
+
+
+class BrowserPool:
+    """
+    A small pool of reusable headless Chrome sessions.
+
+    Sessions are started on demand (up to ``size``) and kept warm, so
+    refreshing many programs costs at most ``size`` Chrome cold starts.
+    """
+
+    def __init__(self, size=2):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take an idle session, starting a new one if the pool isn't full yet."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return BrowserSession()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=timeout)
+
+    def release(self, session, broken=False):
+        """Return a session to the pool; broken sessions are closed instead."""
+        if broken:
+            with self._lock:
+                self._created -= 1
+            session.quit()
+        else:
+            self._idle.put(session)
+
+    def close(self):
+        """Quit all idle sessions."""
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            session.quit()
+
+
+_pool = None
+
+
+def get_browser_pool():
+    """Return the module-wide browser pool."""
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool()
+    return _pool
+
+
+def _filename_from_url(url):
+    filename = os.path.basename(urllib.parse.urlparse(url).path)
+    return filename or "study_plan.pdf"
+
+
+def _download_with_browser(session, pdf_url, final_path):
+    """Download a direct PDF link with the browser's cookies, without a new browser."""
+    # A session of its own: the cookies of this site must not leak into other requests
+    with create_session(pool_size=1) as http:
+        for cookie in session.driver.get_cookies():
+            http.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"))
+        result = download_pdf(pdf_url, final_path, session=http)
+    return result[0] if result else None
+
+
+def download_study_plan_pdf(url, output_path=None, pool=None):
     """
     Download study plan PDF from a given URL using Selenium
 
     Args:
         url: URL of the webpage containing the study plan button
         output_path: Path where to save the PDF (optional)
+        pool: BrowserPool to take the browser from (optional, module-wide pool by default)
 
     Returns:
         Path to the downloaded PDF file or None if download failed
     """
-    # Setup Chrome options
-    chrome_options = Options()
-
-    # Set default download directory if provided
-    if output_path:
-        download_dir = os.path.dirname(os.path.abspath(output_path))
-        prefs = {
-            "download.default_directory": download_dir,
-            "download.prompt_for_download": False,
-            "plugins.always_open_pdf_externally": True,  # Don't open PDF in browser
-        }
-        chrome_options.add_experimental_option("prefs", prefs)
-    else:
-        # Use current directory as download location
-        download_dir = os.path.abspath(os.getcwd())
-        prefs = {
-            "download.default_directory": download_dir,
-            "download.prompt_for_download": False,
-            "plugins.always_open_pdf_externally": True,
-        }
-        chrome_options.add_experimental_option("prefs", prefs)
-
-    # Add additional options for better automation
-    chrome_options.add_argument("--headless")  # Run in headless mode
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-    chrome_options.add_argument("--disable-extensions")
-    chrome_options.add_argument("--disable-notifications")
-
-    # Setup WebDriver
-    driver = None
+    pool = pool or get_browser_pool()
+    session = None
+    broken = False
     try:
-        # Initialize the driver
-        driver = webdriver.Chrome(options=chrome_options)
+        session = pool.acquire()
+        session.reset()
+        driver = session.driver
         driver.get(url)
 
         # Wait for the page to load completely
@@ -67,34 +247,14 @@ def download_study_plan_pdf(url, output_path=None):
             EC.presence_of_element_located((By.TAG_NAME, "body"))
         )
 
-        # List of possible selectors for the study plan download button
-        button_selectors = [
-            # Exact text match
-            "//button[text()='Скачать учебный план']",
-            # Contains text
-            "//button[contains(text(), 'Скачать учебный план')]",
-            # By class name
-            "//button[contains(@class, 'ButtonSimple_button__JbIQ5')]",
-            "//button[contains(@class, 'ButtonSimple_button_masterProgram__JK8b_')]",
-            # Broader search for buttons with similar text
-            "//button[contains(text(), 'учебный план')]",
-            "//a[contains(text(), 'Скачать учебный план')]",
-            "//a[contains(text(), 'учебный план')]",
-            # Generic download buttons
-            "//button[contains(text(), 'Скачать')]",
-            "//a[contains(text(), 'Скачать')]",
-        ]
-
         button = None
-        used_selector = None
 
         # Try each selector until we find a matching element
-        for selector in button_selectors:
+        for selector in BUTTON_SELECTORS:
             try:
                 elements = driver.find_elements(By.XPATH, selector)
                 if elements:
                     button = elements[0]
-                    used_selector = selector
                     print(f"Found button using selector: {selector}")
                     print(f"Button text: {button.text}")
                     break
@@ -105,167 +265,65 @@ def download_study_plan_pdf(url, output_path=None):
             print("Could not find the download button")
             return None
 
-        # Get the count of PDF files in the download directory before clicking
-        pdf_files_before = set(
-            f for f in os.listdir(download_dir) if f.lower().endswith(".pdf")
-        )
+        def click():
+            # Scroll to the button to make sure it's visible
+            driver.execute_script("arguments[0].scrollIntoView();", button)
 
-        # Scroll to the button to make sure it's visible
-        driver.execute_script("arguments[0].scrollIntoView();", button)
-        time.sleep(1)  # Small delay after scrolling
+            # Try to click the button
+            try:
+                # First try a regular click
+                button.click()
+            except ElementNotInteractableException:
+                # If regular click fails, try JavaScript click
+                driver.execute_script("arguments[0].click();", button)
 
-        # Try to click the button
-        try:
-            # First try a regular click
-            button.click()
-        except ElementNotInteractableException:
-            # If regular click fails, try JavaScript click
-            driver.execute_script("arguments[0].click();", button)
+            print("Clicked the download button")
 
-        print("Clicked the download button")
+        # If output_path is not provided, keep the file in the current directory
+        def final_path_for(filename):
+            return output_path or os.path.join(os.getcwd(), filename)
 
-        # Wait for the download to complete (max 30 seconds)
-        download_wait_time = 30
-        download_completed = False
+        # Click and wait for the download to complete (max 30 seconds)
+        downloaded = session.download(click, timeout=30)
 
-        # First check if there's a direct redirect to PDF
-        if driver.current_url.lower().endswith(".pdf"):
+        # The button may navigate straight to the PDF
+        if not downloaded and driver.current_url.lower().endswith(".pdf"):
             print(f"Direct PDF URL: {driver.current_url}")
-
-            # Use the current URL for direct download
             pdf_url = driver.current_url
+            return _download_with_browser(
+                session, pdf_url, final_path_for(_filename_from_url(pdf_url))
+            )
 
-            # Set up a new browser session to download the PDF
-            download_options = Options()
-            download_prefs = {
-                "download.default_directory": download_dir,
-                "download.prompt_for_download": False,
-                "plugins.always_open_pdf_externally": True,
-            }
-            download_options.add_experimental_option("prefs", download_prefs)
-
-            pdf_driver = webdriver.Chrome(options=download_options)
-            pdf_driver.get(pdf_url)
-
-            # Wait for download to complete
-            time.sleep(5)
-            pdf_driver.quit()
-            download_completed = True
-        else:
-            # Wait for new PDF file to appear in download directory
-            start_time = time.time()
-            while time.time() - start_time < download_wait_time:
-                current_pdf_files = set(
-                    f for f in os.listdir(download_dir) if f.lower().endswith(".pdf")
-                )
-                new_files = current_pdf_files - pdf_files_before
-
-                if new_files:
-                    download_completed = True
-                    print(f"New PDF file(s) detected: {new_files}")
-                    break
-
-                time.sleep(1)
-
-        # If no new file is detected, look for a download link that might have appeared
-        if not download_completed:
+        # If no download is detected, look for a download link that might have appeared
+        if not downloaded:
             print(
                 "No download detected. Looking for download links that may have appeared..."
             )
-
-            # Try to find PDF links that might have appeared after clicking
             pdf_links = driver.find_elements(By.XPATH, "//a[contains(@href, '.pdf')]")
-
             if pdf_links:
                 pdf_url = pdf_links[0].get_attribute("href")
                 print(f"Found PDF link: {pdf_url}")
-
-                # Navigate to the PDF URL
-                driver.get(pdf_url)
-                time.sleep(5)  # Wait for download to start
-
-                # Check again for new PDF files
-                current_pdf_files = set(
-                    f for f in os.listdir(download_dir) if f.lower().endswith(".pdf")
+                return _download_with_browser(
+                    session, pdf_url, final_path_for(_filename_from_url(pdf_url))
                 )
-                new_files = current_pdf_files - pdf_files_before
-
-                if new_files:
-                    download_completed = True
-                    print(f"New PDF file(s) detected after following link: {new_files}")
 
-        # If download still not detected, check for any new PDFs and page changes
-        if not download_completed:
-            # One last check for new files
-            current_pdf_files = set(
-                f for f in os.listdir(download_dir) if f.lower().endswith(".pdf")
-            )
-            new_files = current_pdf_files - pdf_files_before
-
-            if new_files:
-                download_completed = True
-                print(f"New PDF file(s) detected: {new_files}")
-            else:
-                print("No PDF download detected.")
-                print(f"Current URL after clicking: {driver.current_url}")
-
-                # Check if we're now on a PDF page
-                if driver.current_url.lower().endswith(".pdf"):
-                    print(f"Redirected to PDF URL: {driver.current_url}")
-
-                    # Handle direct PDF URL differently
-                    pdf_url = driver.current_url
-                    filename = os.path.basename(urllib.parse.urlparse(pdf_url).path)
-
-                    if not filename:
-                        filename = "study_plan.pdf"
-
-                    # If output_path is provided, use it, otherwise create one based on the URL
-                    final_path = (
-                        output_path
-                        if output_path
-                        else os.path.join(download_dir, filename)
-                    )
-
-                    # Use a different approach to download the PDF from the URL
-                    import requests
-
-                    response = requests.get(pdf_url)
-                    with open(final_path, "wb") as f:
-                        f.write(response.content)
-
-                    print(f"Downloaded PDF directly to: {final_path}")
-                    return final_path
-
-                return None
-
-        # If download completed, get the path to the downloaded file
-        if download_completed:
-            # Find the most recently created PDF file
-            current_pdf_files = [
-                f for f in os.listdir(download_dir) if f.lower().endswith(".pdf")
-            ]
-            if not current_pdf_files:
-                print("No PDF files found in download directory")
-                return None
-
-            # Sort by creation time (newest first)
-            newest_pdf = max(
-                [os.path.join(download_dir, f) for f in current_pdf_files],
-                key=os.path.getctime,
-            )
+            print("No PDF download detected.")
+            print(f"Current URL after clicking: {driver.current_url}")
+            return None
 
-            # If output_path is provided, rename/move the file
-            if output_path and newest_pdf != output_path:
-                try:
-                    os.rename(newest_pdf, output_path)
-                    newest_pdf = output_path
-                except Exception as e:
-                    print(f"Error renaming file: {e}")
+        final_path = final_path_for(os.path.basename(downloaded))
+        with open(downloaded, "rb") as f:
+            # The session directory may be on another filesystem, so the file
+            # is copied next to the destination first and then swapped in
+            write_atomically(f.read(), final_path)
+        os.remove(downloaded)
 
-            print(f"PDF downloaded successfully to: {newest_pdf}")
-            return newest_pdf
+        print(f"PDF downloaded successfully to: {final_path}")
+        return final_path
 
+    except WebDriverException as e:
+        broken = True
+        print(f"Error during PDF download: {e}")
         return None
 
     except Exception as e:
@@ -273,15 +331,18 @@ def download_study_plan_pdf(url, output_path=None):
         return None
 
     finally:
-        # Always close the driver
-        if driver:
-            driver.quit()
+        # Keep the browser warm for the next URL
+        if session:
+            pool.release(session, broken=broken)
 
 
 def get_study_plan(url, output_path=None):
     """
     Simple wrapper function that takes a URL and returns the path to the downloaded PDF
 
+    The plan is fetched over plain HTTP first; a browser is only started
+    when the page does not expose the study plan link.
+
     Args:
         url: URL of the webpage containing the study plan
         output_path: Optional path where to save the PDF
@@ -289,6 +350,11 @@ def get_study_plan(url, output_path=None):
     Returns:
         Path to the downloaded PDF file or None if download failed
     """
+    pdf_path = fetch_study_plan(url, output_path)
+    if pdf_path:
+        return pdf_path
+
+    print("Falling back to Selenium")
     return download_study_plan_pdf(url, output_path)
 
 
@@ -300,7 +366,10 @@ if __name__ == "__main__":
     custom_path = input("Enter output path (leave blank for default): ")
     output_path = custom_path if custom_path else None
 
-    pdf_path = get_study_plan(url, output_path)
+    try:
+        pdf_path = get_study_plan(url, output_path)
+    finally:
+        get_browser_pool().close()
 
     if pdf_path:
         print(f"Success! The study plan PDF is saved at: {pdf_path}")
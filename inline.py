@@ -0,0 +1,149 @@
+from telegram import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InlineQueryResultCachedDocument,
+    InputTextMessageContent,
+)
+
+from catalog import normalize, truncate_message
+
+# Programs per page of inline results; each may add its study plan, Telegram allows 50 results
+PAGE_SIZE = 20
+
+# Longest typed prefix kept in the table; longer queries fall back to the search index
+MAX_PREFIX_LENGTH = 40
+
+# Length of the description snippet shown under a result's title
+SNIPPET_LENGTH = 120
+
+# Rank of a prefix hit: the whole name or an alias first, then a word of the name,
+# then a word of an alias. A query that is a complete name, alias or word beats
+# one that is only its beginning
+NAME_RANK = 0
+NAME_WORD_RANK = 1
+ALIAS_WORD_RANK = 2
+
+
+def snippet(text, length=SNIPPET_LENGTH):
+    """Return the beginning of a text on one line, cut at a word boundary."""
+    text = " ".join(text.split())
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(" ", 1)[0] + "…"
+
+
+class InlineResultTable:
+    """
+    Inline query answers for every typed prefix of program names and aliases, built once.
+
+    Answering a keystroke is a dictionary lookup of the normalized query and
+    a slice of a prebuilt tuple of results. Queries that aren't a prefix of
+    any name (typos, several words in another order) go to the search index
+    once and are remembered.
+    """
+
+    def __init__(self, catalog, search_index):
+        """
+        Args:
+            catalog: ProgramCatalog
+            search_index: ProgramSearchIndex for queries missing from the table
+        """
+        self.catalog = catalog
+        self.search_index = search_index
+
+        # prefix -> {program id: best (is partial, rank)}
+        hits = {}
+        for program in catalog.programs:
+            terms = [(normalize(program.name), NAME_RANK)]
+            terms += [(word, NAME_WORD_RANK) for word in normalize(program.name).split()]
+            for alias in (program.id, *program.aliases):
+                terms.append((normalize(alias), NAME_RANK))
+                terms += [(word, ALIAS_WORD_RANK) for word in normalize(alias).split()]
+            for term, rank in terms:
+                for end in range(1, min(len(term), MAX_PREFIX_LENGTH) + 1):
+                    ranks = hits.setdefault(term[:end], {})
+                    key = (end < len(term), rank)
+                    ranks[program.id] = min(ranks.get(program.id, key), key)
+
+        order = {p.id: i for i, p in enumerate(catalog.programs)}
+        # Many prefixes lead to the same programs; they share one tuple
+        shared = {}
+        self._table = {}
+        for prefix, ranks in hits.items():
+            ids = tuple(sorted(ranks, key=lambda p: (ranks[p], order[p])))
+            self._table[prefix] = shared.setdefault(ids, ids)
+        self._table[""] = tuple(p.id for p in catalog.programs)
+        self._searched = {}
+
+        self._articles = {p.id: self._article(p) for p in catalog.programs}
+        # (program id, file_id) -> document result
+        self._documents = {}
+
+    @staticmethod
+    def _article(program):
+        text = f"{program.name}\n\n{program.description.strip()}\n\n{program.url}"
+        text = truncate_message(text)
+        return InlineQueryResultArticle(
+            id=program.id,
+            title=program.name,
+            description=snippet(program.description),
+            input_message_content=InputTextMessageContent(text),
+            reply_markup=InlineKeyboardMarkup(
+                [[InlineKeyboardButton("Страница программы", url=program.url)]]
+            ),
+        )
+
+    def _document(self, program, file_id):
+        key = (program.id, file_id)
+        result = self._documents.get(key)
+        if result is None:
+            result = InlineQueryResultCachedDocument(
+                id=f"{program.id}:plan",
+                title=f"Учебный план — {program.name}",
+                document_file_id=file_id,
+                description="PDF",
+                caption=f"Учебный план для программы '{program.name}'",
+            )
+            # A file_id only changes when its plan is uploaded again
+            if len(self._documents) < 4 * len(self._articles):
+                self._documents[key] = result
+        return result
+
+    def program_ids(self, query):
+        """Return the ids of the programs matching a query, best first."""
+        key = normalize(query)
+        ids = self._table.get(key)
+        if ids is None:
+            ids = self._searched.get(key)
+        if ids is None:
+            ids = tuple(p for p, _ in self.search_index.search(key, limit=len(self.catalog)))
+            # Bounded: only the queries users actually type end up here
+            if len(self._searched) < 10000:
+                self._searched[key] = ids
+        return ids
+
+    def page(self, query, offset, file_id_of):
+        """
+        Return one page of inline results for a query
+
+        Args:
+            query: Text typed after the bot's username
+            offset: InlineQuery.offset, "" for the first page
+            file_id_of: Function returning the Telegram file_id of a program's
+                uploaded study plan, or None; such programs get a document result too
+
+        Returns:
+            Tuple (list of results, next_offset), next_offset is "" on the last page
+        """
+        ids = self.program_ids(query)
+        start = int(offset) if offset.isdigit() else 0
+        end = start + PAGE_SIZE
+        results = []
+        for program_id in ids[start:end]:
+            results.append(self._articles[program_id])
+            program = self.catalog.by_id[program_id]
+            file_id = file_id_of(program)
+            if file_id:
+                results.append(self._document(program, file_id))
+        return results, str(end) if end < len(ids) else ""
@@ -0,0 +1,71 @@
+import json
+from abc import ABC, abstractmethod
+
+import httpx
+
+
+class LLMClient(ABC):
+    """
+    Interface of the chat model used for program Q&A.
+
+    Implementations yield the answer in pieces as the model produces them.
+    """
+
+    @abstractmethod
+    def stream_chat(self, messages):
+        """
+        Generate a reply to a chat, as an async generator
+
+        Args:
+            messages: List of {"role": ..., "content": ...} dicts
+
+        Yields:
+            Pieces of the reply text
+        """
+
+    async def close(self):
+        pass
+
+
+class OpenAICompatibleClient(LLMClient):
+    """
+    Client for any server with an OpenAI-style /chat/completions endpoint.
+
+    Besides the OpenAI API this covers local servers such as llama.cpp,
+    Ollama or vLLM, so a local stand-in can replace the real model.
+    """
+
+    def __init__(self, base_url, model, api_key=None, timeout=60.0, max_tokens=700):
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.model = model
+        self.max_tokens = max_tokens
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"), headers=headers, timeout=timeout
+        )
+
+    async def stream_chat(self, messages):
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": self.max_tokens,
+            "temperature": 0.2,
+            "stream": True,
+        }
+        async with self._client.stream(
+            "POST", "/chat/completions", json=payload
+        ) as response:
+            response.raise_for_status()
+            # Server-sent events: "data: {json}" lines, terminated by "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                piece = choices[0].get("delta", {}).get("content")
+                if piece:
+                    yield piece
+
+    async def close(self):
+        await self._client.aclose()
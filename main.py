@@ -1,166 +1,1038 @@
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import (
     Application,
     CommandHandler,
+    InlineQueryHandler,
     MessageHandler,
+    TypeHandler,
     ContextTypes,
     ConversationHandler,
     filters,
 )
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
+import asyncio
+import contextlib
+import functools
+from dataclasses import dataclass
+import hashlib
 import os
+import time
+import secrets
+import my_secrets
 from my_secrets import BOT_KEY
-from config import STUDY_PROGRAMS
+from config import (
+    PROGRAMS_DIR,
+    PROGRAMS_RELOAD_INTERVAL,
+    DOCUMENT_CACHE_PATH,
+    BOT_MODE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+    CONCURRENT_UPDATES,
+    BOT_API_BASE_URL,
+    PERSISTENCE_PATH,
+    PERSISTENCE_UPDATE_INTERVAL,
+    SESSION_TTL,
+    SESSION_MEMORY_LIMIT,
+    SESSION_EVICTION_INTERVAL,
+    STUDY_PLAN_REFRESH_INTERVAL,
+    STUDY_PLAN_REFRESH_WORKERS,
+    CURRICULUM_INDEX_PATH,
+    STUDY_PLAN_SLICES_DIR,
+    LLM_BASE_URL,
+    LLM_MODEL,
+    METRICS_LISTEN,
+    METRICS_PORT,
+    SLOW_UPDATE_PROFILE_THRESHOLD,
+    OUTGOING_MESSAGES_PER_SECOND,
+    CHAT_MESSAGES_PER_SECOND,
+    GROUP_MESSAGES_PER_MINUTE,
+    CHAT_MESSAGE_BURST,
+    SUBSCRIPTIONS_PATH,
+    BROADCAST_BATCH_SIZE,
+    ADMIN_CHAT_IDS,
+    CLUSTER_WORKERS,
+    CLUSTER_WORKER_PORT,
+    INLINE_CACHE_TIME,
+)
+from catalog import (
+    ProgramCatalog,
+    directory_signature,
+    START_BUTTON,
+    SHOW_PROGRAMS_BUTTON,
+    BACK_BUTTON,
+    DOWNLOAD_BUTTON,
+    PREVIEW_BUTTON,
+    SEMESTER_BUTTON,
+    SEMESTER_LABEL_RE,
+    OTHER_PROGRAM_BUTTON,
+    ASK_BUTTON,
+    SUBSCRIBE_BUTTON,
+    MAX_MESSAGE_LENGTH,
+    truncate_message,
+)
+from curriculum import CurriculumIndex, ELECTIVE
+from document_cache import DocumentCache
+from inline import InlineResultTable
+import metrics
+from metrics import InstrumentedRequest, instrumented
+from llm import OpenAICompatibleClient
+from rate_limiter import PriorityRateLimiter, BULK
+from search import ProgramSearchIndex
+from sessions import Session, SessionStore
+from persistence import SQLitePersistence, LazyConversationHandler
+from study_plan_refresh import make_refresh_job
+from study_plan_slices import StudyPlanSlicer
+from subscriptions import Broadcaster, SubscriptionStore
+from update_processor import ChatOrderedUpdateProcessor
 
 # Define conversation states
-START, SHOWING_PROGRAMS, PROGRAM_DETAILS = range(3)
+START, SHOWING_PROGRAMS, PROGRAM_DETAILS, ASKING, EXPIRED = range(5)
+metrics.state_names.update(
+    {
+        START: "START",
+        SHOWING_PROGRAMS: "SHOWING_PROGRAMS",
+        PROGRAM_DETAILS: "PROGRAM_DETAILS",
+        ASKING: "ASKING",
+        EXPIRED: "EXPIRED",
+        ConversationHandler.END: "END",
+        None: "none",
+    }
+)
+
+# Sessions of recently active users, bounded in memory
+sessions = SessionStore(SESSION_TTL, SESSION_MEMORY_LIMIT)
+
+# Telegram file_ids of already uploaded study plans
+document_cache = DocumentCache(DOCUMENT_CACHE_PATH)
+
+# Courses extracted from the study plans
+curriculum = CurriculumIndex(CURRICULUM_INDEX_PATH)
+
+# (snapshot, plan hashes, CourseComparison) the comparison was last built for
+comparison_cache = None
+
+# Per-semester parts and previews of the study plans
+plan_slicer = StudyPlanSlicer(STUDY_PLAN_SLICES_DIR)
+
+# Chats following program updates, and the broadcasts notifying them
+subscriptions = SubscriptionStore(SUBSCRIPTIONS_PATH)
+# Created with the application, it needs its bot
+broadcaster = None
+
+# Chat model for Q&A about programs
+llm_client = OpenAICompatibleClient(
+    LLM_BASE_URL, LLM_MODEL, api_key=getattr(my_secrets, "LLM_API_KEY", None)
+)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    Programs and everything built on them: lookups, keyboards, search and Q&A indexes.
+
+    Never changed in place. When program files change, a new snapshot is
+    built in a worker thread and replaces the old one in a single
+    assignment; a handler takes the current snapshot once and uses only it.
+    """
+
+    catalog: ProgramCatalog
+    search_index: ProgramSearchIndex
+    inline_results: InlineResultTable
+    courses: CurriculumIndex | None
+    signature: tuple | None
+
+    @functools.cached_property
+    def assistant(self):
+        """Q&A over the programs, built on first use; it's the only user of numpy."""
+        from qa import ProgramAssistant
+
+        return ProgramAssistant.build(llm_client, self.catalog, self.courses)
+
+
+def build_snapshot(with_curriculum=True, with_assistant=True) -> Snapshot:
+    """
+    Load the programs from PROGRAMS_DIR and build the indexes on them. Blocking.
+
+    Args:
+        with_curriculum: Parse study plans that changed and index their
+            course titles too
+        with_assistant: Build the Q&A indexes now rather than on the first question
+
+    Raises:
+        ValueError: If a program file is invalid
+    """
+    signature = directory_signature(PROGRAMS_DIR)
+    catalog = ProgramCatalog.from_directory(PROGRAMS_DIR)
+    courses = None
+    if with_curriculum:
+        plans = [p.path_to_study_plan for p in catalog.programs if p.path_to_study_plan]
+        # A damaged PDF leaves its plan unindexed and unsliced, it doesn't fail the build
+        for program in catalog.programs:
+            if program.path_to_study_plan:
+                curriculum.ensure(program.id, program.path_to_study_plan)
+                plan_slicer.prepare(program.path_to_study_plan)
+        plan_slicer.prune(plans)
+        courses = curriculum
+    search_index = ProgramSearchIndex.from_catalog(catalog, courses)
+    snapshot = Snapshot(
+        catalog=catalog,
+        search_index=search_index,
+        inline_results=InlineResultTable(catalog, search_index),
+        courses=courses,
+        signature=signature,
+    )
+    if with_assistant:
+        # Built in the calling thread, not on the first question
+        snapshot.assistant
+    return snapshot
+
+
+# Built without course titles here; rebuilt with them once the curriculum is indexed
+snapshot = build_snapshot(with_curriculum=False, with_assistant=False)
+# Sessions stored by earlier versions name their program, see Session.restore
+Session.catalog = snapshot.catalog
+# Signature of program files that failed to load
+rejected_signature = None
+
+# Minimum seconds between edits of a message with a streamed answer
+STREAM_EDIT_INTERVAL = 1.0
+
+# HTTP server exposing the metrics, started with the application
+metrics_server = None
+
+
+# file key -> lock held while the file is uploaded, so it's uploaded once
+upload_locks = {}
+
+
+async def send_cached_file(bot, key: str, local_path: str, photo=False, **kwargs) -> None:
+    """
+    Send a document or photo, reusing the Telegram file_id when it was uploaded before
 
-# List of available study programs
-study_program_list = [v["name"] for k, v in STUDY_PROGRAMS.items()]
+    Args:
+        bot: Bot to send with
+        key: Key of the file in the document cache
+        local_path: Path to the file
+        photo: Send as a photo instead of a document
+        **kwargs: Passed to send_document/send_photo: chat_id, caption, ...
+    """
+    send = bot.send_photo if photo else bot.send_document
+    field = "photo" if photo else "document"
 
+    file_id = document_cache.get(key, local_path)
+    if file_id:
+        try:
+            await send(**{field: file_id}, **kwargs)
+            return
+        except BadRequest as e:
+            # Other errors (e.g. "chat not found") say nothing about the file_id
+            if "file" not in str(e).lower():
+                raise
+            # The file_id is no longer valid (e.g. the bot token changed)
+            document_cache.invalidate(key, file_id)
 
+    # Concurrent sends (e.g. a broadcast) wait for the first upload and reuse its file_id
+    lock = upload_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        file_id = document_cache.get(key, local_path)
+        if file_id:
+            await send(**{field: file_id}, **kwargs)
+            return
+        with open(local_path, "rb") as f:
+            message = await send(**{field: f}, **kwargs)
+        uploaded = message.photo[-1] if photo else message.document
+        document_cache.put(key, local_path, uploaded.file_id)
+
+
+async def send_study_plan(
+    bot,
+    chat_id: int,
+    program: str,
+    local_path: str,
+    prompt=None,
+    reply_markup=None,
+    rate_limit_args=None,
+) -> None:
+    """
+    Send a study plan PDF, reusing the Telegram file_id when it was uploaded before
+
+    Args:
+        bot: Bot to send with
+        chat_id: Chat to send to
+        program: Program name
+        local_path: Path to the PDF
+        prompt: Text added to the caption, so it doesn't need a message of its own
+        reply_markup: Keyboard sent with the document
+        rate_limit_args: Passed to the rate limiter, e.g. the priority of a broadcast
+    """
+    kwargs = {
+        "chat_id": chat_id,
+        "filename": f"Учебный план - {program}.pdf",
+        "caption": f"Учебный план для программы '{program}'",
+        "reply_markup": reply_markup,
+    }
+    if prompt:
+        kwargs["caption"] += f"\n\n{prompt}"
+    if rate_limit_args:
+        kwargs["rate_limit_args"] = rate_limit_args
+    await send_cached_file(bot, program, local_path, **kwargs)
+
+
+@instrumented
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Send a message when the command /start is issued."""
-    keyboard = [[KeyboardButton("Start")]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    await update.message.reply_text(
+        "Нажмите 'Start' чтобы начать.", reply_markup=snapshot.catalog.start_keyboard
+    )
 
+    return START
+
+
+async def track_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Record the user's activity; an expired session restarts the conversation."""
+    # Inline queries come from any chat and aren't part of the conversation
+    if update.effective_user is None or update.inline_query:
+        return
+    if sessions.touch(update.effective_user.id, context.user_data):
+        for handlers in context.application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, LazyConversationHandler):
+                    await handler.set_state(update, EXPIRED)
+
+
+@instrumented
+async def session_expired(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Tell a user returning after SESSION_TTL that the conversation starts over."""
     await update.message.reply_text(
-        "Нажмите 'Start' чтобы начать.", reply_markup=reply_markup
+        "Сессия истекла из-за долгого отсутствия активности. "
+        "Нажмите 'Start', чтобы начать заново.",
+        reply_markup=snapshot.catalog.start_keyboard,
     )
 
     return START
 
 
+async def evict_sessions(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Drop idle sessions from memory and report the memory held by the rest."""
+    released = await sessions.evict(context.application)
+    count, size = sessions.memory_usage(context.application)
+    metrics.SESSIONS.set(count)
+    metrics.SESSION_MEMORY.set(size)
+    if released:
+        metrics.SESSIONS_RELEASED.inc(amount=released)
+        print(
+            f"Released {released} idle sessions, {count} in memory "
+            f"(~{size / 2**20:.1f} MiB)"
+        )
+
+
+@instrumented
 async def start_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle the 'Start' button press and move to showing programs state."""
-    keyboard = [[KeyboardButton("Show Study Programs")]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
     await update.message.reply_text(
         "Привет! Я бот для отборочного задания.\nНажмите 'Show Study Programs', чтобы посмотреть доступные программы.",
-        reply_markup=reply_markup,
+        reply_markup=snapshot.catalog.welcome_keyboard,
     )
 
     return SHOWING_PROGRAMS
 
 
+@instrumented
 async def show_programs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Show list of study programs and move to program details state."""
-    programs_str = "\n".join(f"- {p}" for p in study_program_list)
+    catalog = snapshot.catalog
+    await update.message.reply_text(
+        catalog.programs_text, reply_markup=catalog.programs_keyboard
+    )
+
+    return PROGRAM_DETAILS
+
+
+async def show_programs_again(update: Update, notice: str) -> int:
+    """Show the list of study programs after a notice, in the same message."""
+    catalog = snapshot.catalog
+    await update.message.reply_text(
+        f"{notice}\n\n{catalog.programs_text}", reply_markup=catalog.programs_keyboard
+    )
+
+    return PROGRAM_DETAILS
+
+
+@instrumented
+async def download_study_plan(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Send the study plan PDF of the selected program."""
+    catalog = snapshot.catalog
+    # Get the selected program from context
+    program = catalog.by_id.get(context.user_data.program_id)
+    if program is None:
+        return await show_programs_again(update, "Сначала выберите программу обучения.")
+
+    local_path = program.path_to_study_plan
+    if local_path and os.path.exists(local_path):
+        # We have the file locally, send it
+        try:
+            # The follow-up question goes into the caption: one message instead of two
+            await send_study_plan(
+                context.bot,
+                update.effective_chat.id,
+                program.name,
+                local_path,
+                prompt="Что вы хотите сделать дальше?",
+                reply_markup=catalog.after_download_keyboard,
+            )
+            metrics.OUTCOMES.inc("pdf_sent")
+        except Exception as e:
+            metrics.OUTCOMES.inc("pdf_send_failed")
+            await update.message.reply_text(f"Ошибка при отправке файла: {str(e)}")
+    else:
+        metrics.OUTCOMES.inc("pdf_missing")
+        await update.message.reply_text("К сожалению, файл учебного плана не найден.")
+
+    return PROGRAM_DETAILS
+
 
-    # Create keyboard with program buttons
-    keyboard = [[KeyboardButton(p)] for p in study_program_list]
-    # Add a button to go back to start
-    keyboard.append([KeyboardButton("◀️ Back to Start")])
+async def get_plan_slices(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Return the selected program and the slices of its study plan
 
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    Returns:
+        (program, PlanSlices); program is None if none is selected, slices
+        is None if the plan is missing, the user has been told so then
+    """
+    program = snapshot.catalog.by_id.get(context.user_data.program_id)
+    if program is None:
+        return None, None
+    # Cut only when the PDF changed since its slices were made
+    slices = program.path_to_study_plan and await asyncio.to_thread(
+        plan_slicer.prepare, program.path_to_study_plan
+    )
+    if not slices:
+        metrics.OUTCOMES.inc("pdf_missing")
+        await update.message.reply_text("К сожалению, файл учебного плана не найден.")
+        return program, None
+    return program, slices
+
+
+@instrumented
+async def send_plan_preview(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Send the first page of the selected program's study plan, as an image if possible."""
+    program, slices = await get_plan_slices(update, context)
+    if program is None:
+        return await show_programs_again(update, "Сначала выберите программу обучения.")
+    if slices is None:
+        return PROGRAM_DETAILS
 
+    kwargs = {
+        "chat_id": update.effective_chat.id,
+        "caption": f"Первая страница учебного плана программы '{program.name}'",
+    }
+    if not slices.preview_is_image:
+        kwargs["filename"] = f"Учебный план - {program.name} - первая страница.pdf"
+    try:
+        await send_cached_file(
+            context.bot,
+            f"{program.name}#preview",
+            slices.preview,
+            photo=slices.preview_is_image,
+            **kwargs,
+        )
+        metrics.OUTCOMES.inc("preview_sent")
+    except Exception as e:
+        metrics.OUTCOMES.inc("pdf_send_failed")
+        await update.message.reply_text(f"Ошибка при отправке файла: {str(e)}")
+    return PROGRAM_DETAILS
+
+
+@instrumented
+async def choose_semester(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Offer the semesters of the selected program's study plan."""
+    program = await get_indexed_program(update, context)
+    if program is None:
+        return PROGRAM_DETAILS
+
+    semesters = curriculum.semesters(program.id)
+    if not semesters:
+        await update.message.reply_text(
+            "Не удалось разделить учебный план по семестрам, его можно скачать целиком.",
+            reply_markup=snapshot.catalog.program_keyboard,
+        )
+        return PROGRAM_DETAILS
     await update.message.reply_text(
-        f"Список программ:\n{programs_str}\n\nНапишите название программы, чтобы узнать подробности.",
-        reply_markup=reply_markup,
+        "Выберите семестр:",
+        reply_markup=snapshot.catalog.semester_keyboard(semesters),
     )
+    return PROGRAM_DETAILS
+
 
+@instrumented
+async def send_semester_plan(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Send the courses of one semester of the selected program's study plan ("2 семестр")."""
+    program = await get_indexed_program(update, context)
+    if program is None:
+        return PROGRAM_DETAILS
+
+    catalog = snapshot.catalog
+    semester = int(SEMESTER_LABEL_RE.match(update.message.text).group(1))
+    courses = curriculum.courses(program.id, semester)
+    if not courses:
+        await update.message.reply_text(
+            f"В учебном плане нет курсов {semester} семестра.",
+            reply_markup=catalog.program_keyboard,
+        )
+        return PROGRAM_DETAILS
+
+    # A few KB of text instead of PDF pages that hold most of the plan anyway
+    parts = split_message(semester_text(program, semester, courses))
+    for part in parts[:-1]:
+        await update.message.reply_text(part)
+    await update.message.reply_text(parts[-1], reply_markup=catalog.program_keyboard)
+    metrics.OUTCOMES.inc("semester_plan_sent")
     return PROGRAM_DETAILS
 
 
+@instrumented
+async def start_questions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Switch to answering questions about the selected program."""
+    catalog = snapshot.catalog
+    program = catalog.by_id.get(context.user_data.program_id)
+    if program is None:
+        return await show_programs_again(update, "Сначала выберите программу обучения.")
+
+    await update.message.reply_text(
+        f"Задайте вопрос о программе {program.name}.",
+        reply_markup=catalog.after_download_keyboard,
+    )
+    return ASKING
+
+
+# Buttons available in the asking state
+ASKING_ACTIONS = {
+    BACK_BUTTON: start_conversation,
+    OTHER_PROGRAM_BUTTON: show_programs,
+}
+
+
+@instrumented
+async def answer_question(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Answer a question about the selected program, streaming the answer into one message."""
+    user_text = update.message.text
+
+    action = ASKING_ACTIONS.get(user_text)
+    if action is not None:
+        return await action(update, context)
+
+    # The same snapshot for the whole answer, even if the programs are reloaded meanwhile
+    current = snapshot
+    program = current.catalog.by_id.get(context.user_data.program_id)
+    if program is None:
+        return await show_programs_again(update, "Сначала выберите программу обучения.")
+    assistant = current.assistant
+
+    # Popular questions are answered from the cache without calling the model
+    cached = assistant.cached_answer(program, user_text)
+    if cached is not None:
+        metrics.OUTCOMES.inc("answer_cached")
+        await update.message.reply_text(truncate_message(cached))
+        return ASKING
+
+    message = await update.message.reply_text("⏳ Ищу ответ...")
+    text = ""
+    shown = ""
+    last_edit = time.monotonic()
+    try:
+        async with contextlib.aclosing(assistant.stream_answer(program, user_text)) as stream:
+            async for text in stream:
+                # Nothing past the length limit would be shown
+                if len(text) > MAX_MESSAGE_LENGTH:
+                    break
+                # Telegram limits edits; show progress about once a second. It
+                # also refuses edits that don't change the text
+                if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL and text != shown:
+                    shown = text
+                    await message.edit_text(shown)
+                    last_edit = time.monotonic()
+    except Exception as e:
+        metrics.OUTCOMES.inc("answer_failed")
+        await message.edit_text(f"Не удалось получить ответ: {str(e)}")
+        return ASKING
+    metrics.OUTCOMES.inc("answer_generated")
+
+    text = truncate_message(text) or "Не удалось получить ответ."
+    if text != shown:
+        await message.edit_text(text)
+    return ASKING
+
+
+@instrumented
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Subscribe the chat to updates of the selected program."""
+    program = snapshot.catalog.by_id.get(context.user_data.program_id)
+    if program is None:
+        return await show_programs_again(update, "Сначала выберите программу обучения.")
+
+    added = await asyncio.to_thread(
+        subscriptions.subscribe, update.effective_chat.id, program.id
+    )
+    if added:
+        metrics.OUTCOMES.inc("subscribed")
+        text = (
+            f"Готово! Я пришлю сообщение, когда учебный план или описание программы "
+            f"{program.name} изменится."
+        )
+    else:
+        text = f"Вы уже следите за программой {program.name}."
+    await update.message.reply_text(f"{text}\nОтписаться: /unsubscribe")
+    return PROGRAM_DETAILS
+
+
+# Buttons available in the program details state
+PROGRAM_DETAILS_ACTIONS = {
+    BACK_BUTTON: start_conversation,
+    DOWNLOAD_BUTTON: download_study_plan,
+    PREVIEW_BUTTON: send_plan_preview,
+    SEMESTER_BUTTON: choose_semester,
+    OTHER_PROGRAM_BUTTON: show_programs,
+    ASK_BUTTON: start_questions,
+    SUBSCRIBE_BUTTON: subscribe,
+}
+
+
+@instrumented
 async def show_program_details(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
     """Show details for a specific program and offer to download the study plan."""
     user_text = update.message.text
 
-    # Handle back button
-    if user_text == "◀️ Back to Start":
-        return await start_conversation(update, context)
-
-    # Check if the user requested a PDF download
-    if user_text == "📄 Скачать учебный план":
-        # Get the selected program from context
-        selected_program = context.user_data.get("selected_program")
-        if selected_program:
-            # Find the local path for this program
-            local_path = None
-
-            for url, info in STUDY_PROGRAMS.items():
-                if info["name"] == selected_program:
-                    local_path = info.get("path_to_study_plan")
-                    break
-
-            if local_path and os.path.exists(local_path):
-                # We have the file locally, send it
-                try:
-                    await update.message.reply_document(
-                        document=open(local_path, "rb"),
-                        filename=f"Учебный план - {selected_program}.pdf",
-                        caption=f"Учебный план для программы '{selected_program}'",
-                    )
-
-                    # Create keyboard with program options
-                    keyboard = [
-                        [KeyboardButton("🔄 Выбрать другую программу")],
-                        [KeyboardButton("◀️ Back to Start")],
-                    ]
-
-                    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
-                    await update.message.reply_text(
-                        "Что вы хотите сделать дальше?", reply_markup=reply_markup
-                    )
-                except Exception as e:
-                    await update.message.reply_text(
-                        f"Ошибка при отправке файла: {str(e)}"
-                    )
-            else:
-                await update.message.reply_text(
-                    "К сожалению, файл учебного плана не найден."
-                )
+    action = PROGRAM_DETAILS_ACTIONS.get(user_text)
+    if action is not None:
+        return await action(update, context)
+    if SEMESTER_LABEL_RE.match(user_text):
+        return await send_semester_plan(update, context)
 
+    current = snapshot
+    catalog = current.catalog
+    # Find the program details
+    program = catalog.find(user_text)
+    if program is None:
+        best, candidates = current.search_index.resolve(user_text)
+        if best is not None:
+            program = catalog.by_id[best]
+        elif candidates:
+            metrics.OUTCOMES.inc("program_ambiguous")
+            await update.message.reply_text(
+                "Возможно, вы имели в виду одну из программ:",
+                reply_markup=catalog.choice_keyboard(candidates),
+            )
             return PROGRAM_DETAILS
         else:
-            await update.message.reply_text("Сначала выберите программу обучения.")
-            return await show_programs(update, context)
+            metrics.OUTCOMES.inc("program_not_found")
+            return await show_programs_again(
+                update,
+                "Программа не найдена. Пожалуйста, выберите одну из предложенных опций.",
+            )
 
-    # Find the program details
-    if user_text in study_program_list:
-        # Save the selected program in context
-        context.user_data["selected_program"] = user_text
+    metrics.OUTCOMES.inc("program_found")
 
-        # Get program description
-        description = None
-        for k, v in STUDY_PROGRAMS.items():
-            if v["name"] == user_text:
-                description = v.get("description")
-                break
+    # Save the selected program in context; by id, which survives renaming the program
+    context.user_data.program_id = program.id
 
-        if not description:
-            description = "Описание программы отсутствует."
+    await update.message.reply_text(
+        program.details_text, reply_markup=catalog.program_keyboard
+    )
 
-        # Create keyboard with program options
-        keyboard = [
-            [KeyboardButton("📄 Скачать учебный план")],
-            [KeyboardButton("◀️ Back to Start")],
-            [KeyboardButton("🔄 Выбрать другую программу")],
-        ]
+    return PROGRAM_DETAILS
 
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
-        await update.message.reply_text(
-            f"Подробнее о программе {user_text}:\n\n{description}\n\n"
-            "Нажмите '📄 Скачать учебный план' чтобы получить PDF документ с учебным планом.",
-            reply_markup=reply_markup,
+async def reload_programs(force=False, with_assistant=True) -> bool:
+    """
+    Rebuild the snapshot in a worker thread if program files changed, then swap it in
+
+    Message handling goes on with the old snapshot meanwhile.
+
+    Args:
+        force: Rebuild even if the files didn't change
+        with_assistant: Build the Q&A indexes too, see build_snapshot
+
+    Returns:
+        True if a new snapshot was swapped in
+    """
+    global snapshot, rejected_signature
+
+    signature = directory_signature(PROGRAMS_DIR)
+    if not force and signature in (snapshot.signature, rejected_signature):
+        return False
+    try:
+        new_snapshot = await asyncio.to_thread(
+            build_snapshot, with_assistant=with_assistant
         )
+    except ValueError as e:
+        # Keep serving the last good catalog; reported once until the files change again
+        rejected_signature = signature
+        print(f"Programs not reloaded: {e}")
+        return False
+    snapshot = new_snapshot
+    Session.catalog = snapshot.catalog
+    return True
 
-        return PROGRAM_DETAILS
-    elif user_text == "🔄 Выбрать другую программу":
-        return await show_programs(update, context)
+
+async def watch_programs(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Reload the programs when files in PROGRAMS_DIR change."""
+    if await reload_programs():
+        print(f"Programs reloaded: {len(snapshot.catalog)} programs")
+        # context.job.data: whether this process is the primary one
+        if context.job.data:
+            await announce_description_changes()
+
+
+async def start_monitoring(app: Application, metrics_port=METRICS_PORT) -> None:
+    """Start the metrics endpoint and, if configured, the slow update profiler."""
+    global metrics_server
+
+    if SLOW_UPDATE_PROFILE_THRESHOLD:
+        metrics.enable_profiler(SLOW_UPDATE_PROFILE_THRESHOLD)
+    if metrics_port:
+        metrics_server = await metrics.start_server(METRICS_LISTEN, metrics_port)
+
+
+async def notify_subscriber(bot, chat_id: int, program_id: str, kind: str) -> None:
+    """Tell a subscriber that a program's study plan or description changed."""
+    program = snapshot.catalog.by_id.get(program_id)
+    if program is None:
+        return
+    # Broadcasts give way to replies to users
+    rate_limit_args = {"priority": BULK} if bot.rate_limiter else None
+    if kind == "study_plan" and program.path_to_study_plan:
+        await send_study_plan(
+            bot,
+            chat_id,
+            program.name,
+            program.path_to_study_plan,
+            prompt="Учебный план обновился. Отписаться: /unsubscribe",
+            rate_limit_args=rate_limit_args,
+        )
     else:
+        kwargs = {"rate_limit_args": rate_limit_args} if rate_limit_args else {}
+        await bot.send_message(
+            chat_id,
+            truncate_message(
+                f"Описание программы {program.name} обновилось.\n\n"
+                f"{program.description}\n\nОтписаться: /unsubscribe"
+            ),
+            **kwargs,
+        )
+
+
+async def start_broadcast(program, kind: str) -> None:
+    """Notify the subscribers of a program, if it has any."""
+    if await asyncio.to_thread(subscriptions.count, program.id):
+        broadcast_id = await broadcaster.start(program.id, kind)
+        print(f"Broadcast {broadcast_id} ({program.id}, {kind}) started")
+
+
+async def announce_study_plan_changes(context: ContextTypes.DEFAULT_TYPE, urls) -> None:
+    """Notify subscribers of the programs whose study plans were refreshed."""
+    for program in snapshot.catalog.programs:
+        if program.url in urls:
+            await start_broadcast(program, "study_plan")
+
+
+async def announce_description_changes() -> None:
+    """Notify subscribers of the programs whose description differs from the last one seen."""
+    for program in snapshot.catalog.programs:
+        digest = hashlib.sha256(program.description.encode()).hexdigest()
+        if await asyncio.to_thread(subscriptions.program_changed, program.id, digest):
+            await start_broadcast(program, "description")
+
+
+def study_plan_sources() -> dict:
+    """Return the URL and study plan path of the current programs for the refresh job."""
+    return {
+        program.url: {"path_to_study_plan": program.path_to_study_plan}
+        for program in snapshot.catalog.programs
+    }
+
+
+async def start_broadcasts(app: Application, primary=True) -> None:
+    """Create the broadcaster, resume interrupted broadcasts and announce changed descriptions."""
+    global broadcaster
+
+    broadcaster = Broadcaster(
+        subscriptions,
+        functools.partial(notify_subscriber, app.bot),
+        batch_size=BROADCAST_BATCH_SIZE,
+    )
+    # With several worker processes only one of them starts broadcasts by itself
+    if not primary:
+        return
+    await broadcaster.resume_unfinished()
+    await announce_description_changes()
+
+
+async def post_init(app: Application, primary=True, metrics_port=METRICS_PORT) -> None:
+    await start_monitoring(app, metrics_port)
+    # Parse the study plans that changed since the last start and index them
+    await reload_programs(force=True)
+    await start_broadcasts(app, primary)
+
+
+async def close_clients(app: Application) -> None:
+    """Close HTTP clients and servers owned by the bot."""
+    await llm_client.close()
+    if broadcaster is not None:
+        await broadcaster.shutdown()
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    if metrics.profiler is not None:
+        metrics.profiler.stop()
+
+
+async def get_indexed_program(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Return the selected program with its study plan indexed, or None if there is none."""
+    program = snapshot.catalog.by_id.get(context.user_data.program_id)
+    if program is None:
+        await update.message.reply_text("Сначала выберите программу обучения.")
+        return None
+
+    # Parsing only happens when the PDF changed since it was last indexed
+    indexed = program.path_to_study_plan and await asyncio.to_thread(
+        curriculum.ensure, program.id, program.path_to_study_plan
+    )
+    if not indexed:
+        await update.message.reply_text("К сожалению, файл учебного плана не найден.")
+        return None
+    return program
+
+
+def format_course(course) -> str:
+    kind = "по выбору" if course.kind == ELECTIVE else "обязательный"
+    return f"{course.name} — {course.credits} з.е. ({course.hours} ч.), {kind}"
+
+
+def split_message(text: str) -> list:
+    """Split text into messages at line breaks; a line too long for one message is cut."""
+    parts = [""]
+    for line in text.split("\n"):
+        line = truncate_message(line)
+        if parts[-1] and len(parts[-1]) + 1 + len(line) > MAX_MESSAGE_LENGTH:
+            parts.append("")
+        parts[-1] = f"{parts[-1]}\n{line}" if parts[-1] else line
+    return parts
+
+
+def semester_text(program, semester: int, courses) -> str:
+    """Return the courses of one semester of a program as a list grouped by plan section."""
+    lines = [f"Программа {program.name}, {semester} семестр:"]
+    section = None
+    for course in courses:
+        if course.section != section:
+            section = course.section
+            lines.append(f"\n{section}:")
+        kind = ", по выбору" if course.kind == ELECTIVE else ""
+        lines.append(f"- {course.name} — {course.credits} з.е., {course.hours} ч.{kind}")
+    return "\n".join(lines)
+
+
+@instrumented
+async def courses_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """List the courses of the selected program for one semester: /courses <semester>."""
+    program = await get_indexed_program(update, context)
+    if program is None:
+        return
+
+    semesters = curriculum.semesters(program.id)
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text(
+            "Использование: /courses <семестр>\n"
+            f"Доступные семестры: {', '.join(map(str, semesters))}"
+        )
+        return
+
+    semester = int(context.args[0])
+    courses = curriculum.courses(program.id, semester)
+    if not courses:
+        await update.message.reply_text(
+            f"В {semester} семестре курсов не найдено. "
+            f"Доступные семестры: {', '.join(map(str, semesters))}"
+        )
+        return
+
+    for part in split_message(semester_text(program, semester, courses)):
+        await update.message.reply_text(part)
+
+
+@instrumented
+async def credits_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show credits and hours of courses of the selected program: /credits <course name>."""
+    program = await get_indexed_program(update, context)
+    if program is None:
+        return
+
+    query = " ".join(context.args)
+    if not query:
+        await update.message.reply_text("Использование: /credits <название курса>")
+        return
+
+    courses = curriculum.find(program.id, query)
+    if not courses:
+        await update.message.reply_text(
+            f"Курс «{query}» не найден в учебном плане программы {program.name}."
+        )
+        return
+
+    lines = [f"{c.semester} семестр: {format_course(c)}" for c in courses]
+    await update.message.reply_text(truncate_message("\n".join(lines)))
+
+
+def ensure_all_plans(programs) -> tuple:
+    """Index the study plans of all programs. Returns the indexed versions, None for missing ones."""
+    return tuple(
+        curriculum.sha256(p.id)
+        if p.path_to_study_plan and curriculum.ensure(p.id, p.path_to_study_plan)
+        else None
+        for p in programs
+    )
+
+
+async def get_comparison():
+    """Return the CourseComparison of the current programs, rebuilt only when a plan changed."""
+    global comparison_cache
+    current = snapshot
+    hashes = await asyncio.to_thread(ensure_all_plans, current.catalog.programs)
+    cached = comparison_cache
+    if cached is not None and cached[0] is current and cached[1] == hashes:
+        return cached[2]
+
+    # numpy is only needed here; keep it off the cold start
+    from comparison import CourseComparison
+
+    comparison = await asyncio.to_thread(CourseComparison.build, current.catalog, curriculum)
+    comparison_cache = (current, hashes, comparison)
+    return comparison
+
+
+@instrumented
+async def compare_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Compare the study plans of two programs course by course: /compare <program>."""
+    current = snapshot
+    catalog = current.catalog
+    comparison = await get_comparison()
+    selected = catalog.by_id.get(context.user_data.program_id)
+
+    query = " ".join(context.args)
+    if not query:
+        others = [p for p in catalog.programs if p is not selected]
+        if selected is not None and len(others) == 1:
+            text = comparison.compare_text(selected.id, others[0].id)
+        else:
+            text = comparison.summary_text + "\n\nПодробнее: /compare <программа>"
+        await update.message.reply_text(text)
+        return
+
+    other = catalog.find(query)
+    if other is None:
+        best, _ = current.search_index.resolve(query)
+        other = catalog.by_id.get(best)
+    if other is None:
+        await update.message.reply_text(f"Программа «{query}» не найдена.")
+        return
+    if selected is None:
         await update.message.reply_text(
-            "Программа не найдена. Пожалуйста, выберите одну из предложенных опций."
+            "Сначала выберите программу обучения, затем сравните её с другой."
         )
+        return
+    if selected is other:
+        await update.message.reply_text("Эта программа уже выбрана, укажите другую.")
+        return
+    await update.message.reply_text(comparison.compare_text(selected.id, other.id))
+
+
+@instrumented
+async def recommend_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Recommend programs and electives for the user's interests: /recommend <interests>."""
+    query = " ".join(context.args)
+    if not query:
+        await update.message.reply_text(
+            "Использование: /recommend <ваши интересы или опыт>, например\n"
+            "/recommend компьютерное зрение и обработка текстов"
+        )
+        return
+    comparison = await get_comparison()
+    program_id = context.user_data.program_id
+    await update.message.reply_text(comparison.recommend_text(query, program_id))
+
+
+@instrumented
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stop notifications about all programs: /unsubscribe."""
+    removed = await asyncio.to_thread(subscriptions.unsubscribe, update.effective_chat.id)
+    if removed:
+        await update.message.reply_text("Вы больше не получаете уведомления об изменениях.")
+    else:
+        await update.message.reply_text("У вас нет подписок.")
+
+
+def format_broadcast(broadcast: dict) -> str:
+    return (
+        f"#{broadcast['id']} {broadcast['program']} ({broadcast['kind']}): "
+        f"{broadcast['status']}, отправлено {broadcast['sent']}/{broadcast['total']}, "
+        f"ошибок {broadcast['failed']}, недоступных чатов {broadcast['dead']}"
+    )
+
+
+async def broadcasts_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """List the latest broadcasts: /broadcasts. Admins only."""
+    broadcasts = await asyncio.to_thread(subscriptions.broadcasts)
+    lines = [format_broadcast(b) for b in broadcasts] or ["Рассылок не было."]
+    await update.message.reply_text(truncate_message("\n".join(lines)))
+
+
+async def control_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Pause or resume a broadcast: /broadcast_pause <id>, /broadcast_resume <id>. Admins only."""
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Укажите номер рассылки, см. /broadcasts")
+        return
+    broadcast_id = int(context.args[0])
+    if await asyncio.to_thread(subscriptions.broadcast, broadcast_id) is None:
+        await update.message.reply_text(f"Рассылка #{broadcast_id} не найдена.")
+        return
+
+    if update.message.text.startswith("/broadcast_pause"):
+        await broadcaster.pause(broadcast_id)
+    else:
+        await broadcaster.resume(broadcast_id)
+    broadcast = await asyncio.to_thread(subscriptions.broadcast, broadcast_id)
+    await update.message.reply_text(format_broadcast(broadcast))
 
-        # Show programs again
-        return await show_programs(update, context)
 
+def uploaded_study_plan(program):
+    """Return the file_id of a program's study plan if it was uploaded and hasn't changed since."""
+    if not program.path_to_study_plan:
+        return None
+    try:
+        return document_cache.get(program.name, program.path_to_study_plan)
+    except FileNotFoundError:
+        return None
 
+
+@instrumented
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answer '@bot <query>' in any chat with matching programs and their study plans."""
+    query = update.inline_query
+    results, next_offset = snapshot.inline_results.page(
+        query.query, query.offset, uploaded_study_plan
+    )
+    # The same for everyone, so Telegram can answer repeated queries from its cache
+    await query.answer(
+        results, cache_time=INLINE_CACHE_TIME, is_personal=False, next_offset=next_offset
+    )
+
+
+@instrumented
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel and end the conversation."""
     await update.message.reply_text(
@@ -171,35 +1043,185 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
-def main():
-    """Start the bot."""
-    app = Application.builder().token(BOT_KEY).build()
+def build_application(
+    request=None, primary=True, metrics_port=METRICS_PORT, journal_mode="WAL"
+) -> Application:
+    """
+    Create the application with all handlers registered
+
+    Args:
+        request: telegram.request.BaseRequest for Bot API calls (optional),
+            e.g. a fake Bot API in benchmarks
+        primary: False for all but one worker process in cluster mode; only
+            the primary one runs the refresh job and resumes broadcasts
+        metrics_port: Port of the metrics endpoint, None disables it
+        journal_mode: SQLite journal mode of PERSISTENCE_PATH, "DELETE" if
+            instances on other machines share it (see SQLitePersistence)
+
+    Returns:
+        Application instance
+    """
+    builder = (
+        Application.builder()
+        .token(BOT_KEY)
+        .concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+        # A slotted Session per user instead of a dict; chat_data isn't used
+        .context_types(ContextTypes(user_data=Session))
+        .persistence(
+            SQLitePersistence(
+                PERSISTENCE_PATH,
+                update_interval=PERSISTENCE_UPDATE_INTERVAL,
+                store_chat_data=False,
+                journal_mode=journal_mode,
+            )
+        )
+    )
+    if request is None:
+        # One connection per concurrently processed update
+        request = HTTPXRequest(connection_pool_size=CONCURRENT_UPDATES)
+        get_updates_request = HTTPXRequest()
+    else:
+        get_updates_request = request
+    # Every Bot API call is timed, per method
+    builder = builder.request(InstrumentedRequest(request)).get_updates_request(
+        InstrumentedRequest(get_updates_request)
+    )
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL).base_file_url(
+            BOT_API_BASE_URL.replace("/bot", "/file/bot", 1)
+        )
+    if OUTGOING_MESSAGES_PER_SECOND:
+        builder = builder.rate_limiter(
+            PriorityRateLimiter(
+                overall_rate=OUTGOING_MESSAGES_PER_SECOND,
+                chat_rate=CHAT_MESSAGES_PER_SECOND,
+                group_rate=GROUP_MESSAGES_PER_MINUTE / 60,
+                chat_burst=CHAT_MESSAGE_BURST,
+            )
+        )
+    app = builder.post_init(
+        functools.partial(post_init, primary=primary, metrics_port=metrics_port)
+    ).post_shutdown(close_clients).build()
 
     # Create the conversation handler with states
-    conv_handler = ConversationHandler(
+    conv_handler = LazyConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
-            START: [MessageHandler(filters.Regex("^Start$"), start_conversation)],
+            START: [MessageHandler(filters.Text([START_BUTTON]), start_conversation)],
             SHOWING_PROGRAMS: [
-                MessageHandler(filters.Regex("^Show Study Programs$"), show_programs)
+                MessageHandler(filters.Text([SHOW_PROGRAMS_BUTTON]), show_programs)
             ],
+            # Buttons and program names are dispatched by show_program_details
             PROGRAM_DETAILS: [
-                MessageHandler(
-                    filters.Regex("^📄 Скачать учебный план$"), show_program_details
-                ),
-                MessageHandler(
-                    filters.Regex("^🔄 Выбрать другую программу$"), show_programs
-                ),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, show_program_details),
             ],
+            ASKING: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, answer_question),
+            ],
+            # Set by track_session when the user was idle for longer than SESSION_TTL
+            EXPIRED: [
+                CommandHandler("start", start),
+                MessageHandler(filters.ALL, session_expired),
+            ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="main_conversation",
+        persistent=True,
     )
 
+    # Loads the update's conversation state from the database before anything reads it
+    app.add_handler(TypeHandler(Update, conv_handler.preload), group=-2)
+    # Runs before all other handlers, so they see an expired session already reset
+    app.add_handler(TypeHandler(Update, track_session), group=-1)
     app.add_handler(conv_handler)
+    app.add_handler(CommandHandler("courses", courses_command))
+    app.add_handler(CommandHandler("credits", credits_command))
+    app.add_handler(CommandHandler("compare", compare_command))
+    app.add_handler(CommandHandler("recommend", recommend_command))
+    app.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+    app.add_handler(InlineQueryHandler(inline_query))
+    admins = filters.Chat(chat_id=ADMIN_CHAT_IDS)
+    app.add_handler(CommandHandler("broadcasts", broadcasts_command, filters=admins))
+    app.add_handler(
+        CommandHandler(
+            ["broadcast_pause", "broadcast_resume"], control_broadcast, filters=admins
+        )
+    )
 
-    # Start the Bot
-    app.run_polling()
+    # Keep study_plans/ up to date in the background
+    if STUDY_PLAN_REFRESH_INTERVAL and primary:
+        app.job_queue.run_repeating(
+            make_refresh_job(
+                study_plan_sources,
+                max_workers=STUDY_PLAN_REFRESH_WORKERS,
+                on_change=announce_study_plan_changes,
+            ),
+            interval=STUDY_PLAN_REFRESH_INTERVAL,
+            first=60,
+            name="refresh_study_plans",
+        )
+
+    # Pick up edited program files without a restart; every process reloads,
+    # only the primary one notifies subscribers
+    if PROGRAMS_RELOAD_INTERVAL:
+        app.job_queue.run_repeating(
+            watch_programs,
+            interval=PROGRAMS_RELOAD_INTERVAL,
+            first=PROGRAMS_RELOAD_INTERVAL,
+            data=primary,
+            name="watch_programs",
+        )
+
+    # Keep the sessions held in memory under SESSION_MEMORY_LIMIT
+    if SESSION_EVICTION_INTERVAL:
+        app.job_queue.run_repeating(
+            evict_sessions,
+            interval=SESSION_EVICTION_INTERVAL,
+            first=SESSION_EVICTION_INTERVAL,
+            name="evict_sessions",
+        )
+
+    return app
+
+
+def main():
+    """Start the bot."""
+    if BOT_MODE not in ("polling", "webhook", "cluster"):
+        raise ValueError(f"Unknown BOT_MODE: {BOT_MODE}")
+
+    if BOT_MODE == "polling":
+        build_application().run_polling()
+        return
+
+    if not WEBHOOK_URL:
+        raise ValueError(f"WEBHOOK_URL must be set in config.py for {BOT_MODE} mode")
+    # Telegram sends this token with every request; others are rejected
+    secret_token = getattr(my_secrets, "WEBHOOK_SECRET", None)
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+
+    if BOT_MODE == "cluster":
+        # Only cluster mode needs the front and its dependencies
+        from cluster import run_front
+
+        run_front(
+            CLUSTER_WORKERS,
+            WEBHOOK_LISTEN,
+            WEBHOOK_PORT,
+            WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=secret_token,
+            worker_port=CLUSTER_WORKER_PORT,
+            metrics_port=METRICS_PORT,
+        )
+    else:
+        build_application().run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=secret_token,
+        )
 
 
 if __name__ == "__main__":
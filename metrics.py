@@ -0,0 +1,339 @@
+import asyncio
+import bisect
+import functools
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _TallyCounter
+
+from telegram.request import BaseRequest
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for labels, value in sorted(self._values.items()):
+            lines.append(
+                f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+            )
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, per label values."""
+
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, per label values."""
+
+    type = "gauge"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets, per label values."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # [per-bucket counts..., +Inf count, sum]; made cumulative only when rendered
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for labels, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+                )
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {series[-1]}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds", "Time spent in a handler callback.", ("handler",)
+)
+HANDLER_CALLS = Counter(
+    "bot_handler_calls_total",
+    "Handler calls by the conversation state they moved to.",
+    ("handler", "next_state"),
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Handler calls that raised.", ("handler",)
+)
+OUTCOMES = Counter(
+    "bot_outcomes_total",
+    "Results of user requests (program_found, program_not_found, pdf_sent, pdf_missing, ...).",
+    ("outcome",),
+)
+API_DURATION = Histogram(
+    "bot_api_request_duration_seconds", "Round trip of Bot API calls.", ("method",)
+)
+API_REQUESTS = Counter(
+    "bot_api_requests_total", "Bot API calls by HTTP status.", ("method", "status")
+)
+UPDATE_DURATION = Histogram(
+    "bot_update_duration_seconds",
+    "Time from the start of processing an update until all handlers finished.",
+)
+UPDATE_WAIT = Histogram(
+    "bot_update_chat_wait_seconds",
+    "Time an update waited for earlier updates of the same chat.",
+)
+OUTBOUND_WAIT = Histogram(
+    "bot_outbound_wait_seconds",
+    "Time an outgoing message waited for the rate limiter.",
+    ("priority",),
+)
+OUTBOUND_QUEUED = Gauge(
+    "bot_outbound_queued", "Outgoing messages waiting for a global rate limit token."
+)
+RETRY_AFTER = Counter(
+    "bot_retry_after_total", "Flood limit (RetryAfter) errors from Telegram.", ("method",)
+)
+BROADCAST_MESSAGES = Counter(
+    "bot_broadcast_messages_total",
+    "Broadcast notifications by result (sent, failed, dead).",
+    ("result",),
+)
+UPDATES_IN_FLIGHT = Gauge("bot_updates_in_flight", "Updates being processed.")
+UPDATES_WAITING = Gauge(
+    "bot_updates_waiting", "Updates waiting for earlier updates of the same chat."
+)
+SESSIONS = Gauge("bot_sessions", "User sessions held in memory.")
+SESSION_MEMORY = Gauge(
+    "bot_session_memory_bytes", "Estimated memory of sessions and conversation states."
+)
+SESSIONS_RELEASED = Counter(
+    "bot_sessions_released_total", "Sessions written out and dropped from memory."
+)
+
+# Conversation state value -> name used in the next_state label
+state_names = {}
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def instrumented(callback):
+    """Decorate a handler callback to record its duration and the state it returns."""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            result = await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, name)
+        HANDLER_CALLS.inc(name, state_names.get(result, str(result)))
+        return result
+
+    return wrapper
+
+
+class InstrumentedRequest(BaseRequest):
+    """BaseRequest wrapper recording the latency and status of every Bot API call."""
+
+    def __init__(self, request):
+        self._request = request
+
+    @property
+    def read_timeout(self):
+        return self._request.read_timeout
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        status = "error"
+        try:
+            status, payload = await self._request.do_request(
+                url, method, request_data=request_data, **kwargs
+            )
+            return status, payload
+        finally:
+            API_DURATION.observe(time.perf_counter() - started, endpoint)
+            API_REQUESTS.inc(endpoint, str(status))
+
+
+class SlowUpdateProfiler:
+    """
+    Sampling profiler for slow updates.
+
+    A background thread looks at the event loop thread every `interval`
+    seconds. While some update has been processed for longer than
+    `threshold` seconds, it records the loop thread's current stack.
+    Stacks are aggregated in the "folded" format flame graph tools read.
+    Nothing is sampled while updates are fast.
+    """
+
+    def __init__(self, threshold=0.5, interval=0.01, max_stacks=5000):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks = _TallyCounter()
+        # update id -> start time of its processing
+        self._running = {}
+        self._thread_id = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(
+            target=self._sample, name="slow-update-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def update_started(self, key):
+        self._running[key] = time.monotonic()
+
+    def update_finished(self, key):
+        self._running.pop(key, None)
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            running = list(self._running.values())
+            if not running or time.monotonic() - min(running) < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = ";".join(
+                f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                for entry in traceback.extract_stack(frame)
+            )
+            if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                self.stacks[stack] += 1
+
+    def render(self):
+        """Return the collected stacks in folded format, most frequent first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+profiler = None
+
+
+def enable_profiler(threshold):
+    """Start sampling stacks of updates slower than `threshold` seconds."""
+    global profiler
+    profiler = SlowUpdateProfiler(threshold=threshold)
+    profiler.start()
+    return profiler
+
+
+async def start_server(host, port):
+    """
+    Serve /metrics (and /profile when the profiler is enabled) over HTTP
+
+    Args:
+        host: Interface to listen on
+        port: Port to listen on
+
+    Returns:
+        asyncio.Server instance
+    """
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Skip the headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+            if path == "/metrics":
+                status, body = "200 OK", render()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/profile" and profiler is not None:
+                status, body = "200 OK", profiler.render()
+                content_type = "text/plain; charset=utf-8"
+            else:
+                status, body = "404 Not Found", "Not found\n"
+                content_type = "text/plain; charset=utf-8"
+            payload = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
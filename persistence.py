@@ -0,0 +1,513 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from telegram import Update
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_data (
+    chat_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bot_data (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    data TEXT NOT NULL
+);
+"""
+
+KEY_COLUMNS = {"user_data": "user_id", "chat_data": "chat_id", "bot_data": "id"}
+
+# Bytes of a user or chat id held in memory
+ID_SIZE = sys.getsizeof(2**40)
+
+
+# File systems of storage shared between machines (/proc/mounts types)
+NETWORK_FILESYSTEMS = frozenset(
+    {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "ceph", "glusterfs", "lustre", "gpfs"}
+)
+
+
+def filesystem_type(path):
+    """
+    Return the type of the file system holding path, as listed in /proc/mounts
+
+    Args:
+        path: File path; the file itself doesn't need to exist
+
+    Returns:
+        E.g. "ext4" or "nfs4", None where /proc/mounts isn't available
+    """
+    directory = os.path.dirname(os.path.realpath(path))
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    best, fs_type = "", None
+    for mount_point, mount_type in mounts:
+        # Spaces in mount points are escaped as \040
+        mount_point = mount_point.replace("\\040", " ")
+        inside = directory == mount_point or directory.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) >= len(best):
+            best, fs_type = mount_point, mount_type
+    return fs_type
+
+
+def _on_network_storage(path):
+    fs_type = filesystem_type(path)
+    return fs_type is not None and (
+        fs_type in NETWORK_FILESYSTEMS or fs_type.startswith("fuse.")
+    )
+
+
+def _connect(path, journal_mode):
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    connection.execute(f"PRAGMA journal_mode={journal_mode}")
+    if journal_mode == "WAL":
+        # WAL makes NORMAL safe against corruption; only the last commits may be lost on power loss
+        connection.execute("PRAGMA synchronous=NORMAL")
+    else:
+        connection.execute("PRAGMA synchronous=FULL")
+    return connection
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Persistence for conversations and user/chat/bot data in a SQLite database.
+
+    - Nothing but bot_data is read at startup. A user's data and a chat's
+      conversation state are loaded the first time that user/chat shows up
+      (see refresh_user_data, refresh_chat_data and LazyConversationHandler).
+    - Writes are buffered in memory. All writes made in the same event loop
+      iteration (python-telegram-bot issues them together every update_interval)
+      are coalesced and written in one transaction in a worker thread, one
+      transaction at a time. Lookups see buffered writes before they reach
+      the database.
+    - Values are stored as JSON, so user_data/chat_data/bot_data must only
+      contain JSON-serializable values. user_data may also be an object with
+      to_dict() and restore(dict) methods, like sessions.Session.
+    - The database is meant for the processes of one machine. WAL keeps its
+      index in shared memory, so it's refused on network file systems, where
+      processes on different machines would corrupt the database; use
+      journal_mode="DELETE" there, which relies on the file system's locks.
+      Even then state is only consistent while a single instance at a time
+      handles the updates of a chat.
+    """
+
+    def __init__(self, path, update_interval=60, store_chat_data=True, journal_mode="WAL"):
+        super().__init__(
+            store_data=PersistenceInput(chat_data=store_chat_data, callback_data=False),
+            update_interval=update_interval,
+        )
+        if journal_mode not in ("WAL", "DELETE"):
+            raise ValueError(f"Unsupported journal mode {journal_mode!r}, use 'WAL' or 'DELETE'")
+        if journal_mode == "WAL" and _on_network_storage(path):
+            raise ValueError(
+                f"{path} is on a network file system ({filesystem_type(path)}): SQLite's WAL "
+                "mode is only safe for processes on one machine, use journal_mode='DELETE'"
+            )
+        self.path = path
+        self.journal_mode = journal_mode
+        self._writer = _connect(path, journal_mode)
+        self._writer.executescript(SCHEMA)
+        # Separate connection for lookups on the event loop thread; with WAL they
+        # don't wait for the writer
+        self._reader = _connect(path, journal_mode)
+        self._write_lock = threading.Lock()
+
+        # (table, key) -> serialized value, or None for deletion
+        self._pending = {}
+        # The batch being written to the database
+        self._in_flight = {}
+        self._batch_lock = asyncio.Lock()
+        self._flush_task = None
+        self._loaded_users = set()
+        self._loaded_chats = set()
+        # (table, key) -> task loading that user's or chat's data, awaited by every update
+        # of theirs that arrives meanwhile
+        self._loading = {}
+        # Dropped from memory by release(): their drop or deletion must not delete the stored state
+        self._released_users = set()
+        self._released_chats = set()
+        self._released_conversations = set()
+
+    # Reading
+
+    def _buffered(self, table, key):
+        """Return (True, value) for a write that isn't in the database yet, else (False, None)."""
+        for batch in (self._pending, self._in_flight):
+            if (table, key) in batch:
+                value = batch[(table, key)]
+                return True, None if value is None else json.loads(value)
+        return False, None
+
+    def _load_json(self, query, params):
+        row = self._reader.execute(query, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def load_conversation(self, name, key):
+        """Return the stored state of one conversation or None."""
+        key = json.dumps(key)
+        found, state = self._buffered("conversations", (name, key))
+        if found:
+            return state
+        return await asyncio.to_thread(
+            self._load_json,
+            "SELECT state FROM conversations WHERE name = ? AND key = ?",
+            (name, key),
+        )
+
+    async def _load(self, table, key):
+        found, value = self._buffered(table, key)
+        if found:
+            return value
+        return await asyncio.to_thread(
+            self._load_json, f"SELECT data FROM {table} WHERE {KEY_COLUMNS[table]} = ?", (key,)
+        )
+
+    async def get_user_data(self):
+        # Loaded per user in refresh_user_data
+        return {}
+
+    async def get_chat_data(self):
+        # Loaded per chat in refresh_chat_data
+        return {}
+
+    async def get_bot_data(self):
+        data = self._load_json("SELECT data FROM bot_data WHERE id = 0", ())
+        return data or {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        # Loaded per conversation by LazyConversationHandler
+        return {}
+
+    async def _restore(self, table, key, data, loaded):
+        try:
+            stored = await self._load(table, key)
+            if stored and not isinstance(data, dict):
+                data.restore(stored)
+            elif stored:
+                # Values set before the first refresh are newer than the stored ones
+                data.update({k: v for k, v in stored.items() if k not in data})
+            loaded.add(key)
+        finally:
+            del self._loading[(table, key)]
+
+    async def _refresh(self, table, key, data, loaded):
+        """Load stored data into data once; callers arriving during the load wait for it."""
+        if key in loaded:
+            return
+        loading = self._loading.get((table, key))
+        if loading is None:
+            loading = asyncio.ensure_future(self._restore(table, key, data, loaded))
+            self._loading[(table, key)] = loading
+        # A cancelled update doesn't cancel the load other updates wait for
+        await asyncio.shield(loading)
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self._refresh("user_data", user_id, user_data, self._loaded_users)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._refresh("chat_data", chat_id, chat_data, self._loaded_chats)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # Writing
+
+    def _enqueue(self, table, key, value):
+        self._pending[(table, key)] = value
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        # Let the rest of the current batch of update_* calls get enqueued first
+        await asyncio.sleep(0)
+        await self._write_batches()
+
+    async def _write_batches(self):
+        # One batch at a time, so a later write never lands before an earlier one
+        async with self._batch_lock:
+            while self._pending:
+                self._in_flight, self._pending = self._pending, {}
+                try:
+                    await asyncio.to_thread(self._write_batch, self._in_flight)
+                finally:
+                    self._in_flight = {}
+
+    def _write_batch(self, batch):
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute("BEGIN")
+            try:
+                for (table, key), value in batch.items():
+                    if table == "conversations":
+                        name, conversation_key = key
+                        if value is None:
+                            cursor.execute(
+                                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                                (name, conversation_key),
+                            )
+                        else:
+                            cursor.execute(
+                                "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?)",
+                                (name, conversation_key, value),
+                            )
+                    elif value is None:
+                        cursor.execute(
+                            f"DELETE FROM {table} WHERE {KEY_COLUMNS[table]} = ?", (key,)
+                        )
+                    else:
+                        cursor.execute(
+                            f"INSERT OR REPLACE INTO {table} VALUES (?, ?)", (key, value)
+                        )
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    async def update_conversation(self, name, key, new_state):
+        key = (name, json.dumps(key))
+        if key in self._released_conversations:
+            self._released_conversations.discard(key)
+            if new_state is None:
+                # Deleted from memory by release_chats, not ended
+                return
+        value = None if new_state is None else json.dumps(new_state)
+        self._enqueue("conversations", key, value)
+
+    @staticmethod
+    def _serialize(data):
+        if not isinstance(data, dict):
+            data = data.to_dict()
+        return json.dumps(data, ensure_ascii=False)
+
+    async def update_user_data(self, user_id, data):
+        self._loaded_users.add(user_id)
+        self._enqueue("user_data", user_id, self._serialize(data))
+
+    async def update_chat_data(self, chat_id, data):
+        self._loaded_chats.add(chat_id)
+        self._enqueue("chat_data", chat_id, self._serialize(data))
+
+    async def update_bot_data(self, data):
+        self._enqueue("bot_data", 0, json.dumps(data, ensure_ascii=False))
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        if user_id in self._released_users:
+            # Dropped from memory by release_chats, the stored data stays
+            self._released_users.discard(user_id)
+            return
+        self._loaded_users.discard(user_id)
+        self._enqueue("user_data", user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        if chat_id in self._released_chats:
+            self._released_chats.discard(chat_id)
+            return
+        self._loaded_chats.discard(chat_id)
+        self._enqueue("chat_data", chat_id, None)
+
+    async def write_pending(self):
+        """Write all buffered changes to the database now."""
+        await self._write_batches()
+
+    def release(self, user_data, chat_data, conversations):
+        """
+        Buffer the state of users, chats and conversations dropped from the application's memory
+
+        The application's following drop_user_data/drop_chat_data calls and
+        conversation deletions for them keep the stored state, and it's loaded
+        again the next time they show up. Must be called on the event loop.
+
+        Args:
+            user_data: User id -> user data
+            chat_data: Chat id -> chat data, ignored unless chat data is stored
+            conversations: (handler name, conversation key) -> state
+        """
+        for user_id, data in user_data.items():
+            self._enqueue("user_data", user_id, self._serialize(data))
+            self._released_users.add(user_id)
+            self._loaded_users.discard(user_id)
+        if self.store_data.chat_data:
+            for chat_id, data in chat_data.items():
+                self._enqueue("chat_data", chat_id, self._serialize(data))
+                self._released_chats.add(chat_id)
+                self._loaded_chats.discard(chat_id)
+        for (name, key), state in conversations.items():
+            key = (name, json.dumps(key))
+            self._enqueue("conversations", key, json.dumps(state))
+            self._released_conversations.add(key)
+
+    def memory_usage(self):
+        """Return the estimated bytes held in memory to know which users/chats are loaded."""
+        return (
+            sys.getsizeof(self._loaded_users)
+            + sys.getsizeof(self._loaded_chats)
+            + (len(self._loaded_users) + len(self._loaded_chats)) * ID_SIZE
+        )
+
+    async def flush(self):
+        await self.write_pending()
+        self._writer.close()
+        self._reader.close()
+
+
+class LazyConversationHandler(ConversationHandler):
+    """
+    ConversationHandler that restores a conversation's state from
+    SQLitePersistence the first time an update for it arrives, instead of
+    loading every stored conversation at startup.
+
+    check_update can't wait for the database, so the state is loaded by
+    preload, which must be registered to run before the handler:
+
+        app.add_handler(TypeHandler(Update, handler.preload), group=-2)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._store = None
+        self._restored = set()
+
+    async def _initialize_persistence(self, application):
+        result = await super()._initialize_persistence(application)
+        if isinstance(application.persistence, SQLitePersistence):
+            self._store = application.persistence
+        return result
+
+    def loaded_chat_ids(self):
+        """Return the ids of chats whose conversation state is held in memory."""
+        return {key[0] for key in self._restored if isinstance(key, tuple)} | {
+            key[0] for key in self._conversations if isinstance(key, tuple)
+        }
+
+    def _key(self, update):
+        if not isinstance(update, Update):
+            return None
+        try:
+            return self._get_key(update)
+        except RuntimeError:
+            # Not a conversation update
+            return None
+
+    async def preload(self, update, context=None):
+        """Load the stored state of an update's conversation unless it's loaded; a TypeHandler callback."""
+        key = self._key(update)
+        if self._store is None or key is None or key in self._restored:
+            return
+        state = await self._store.load_conversation(self.name, key)
+        # Loaded meanwhile by another update of the conversation
+        if key in self._restored:
+            return
+        self._restored.add(key)
+        if state is not None and key not in self._conversations:
+            self._conversations.update_no_track({key: state})
+
+    async def set_state(self, update, state):
+        """Move the conversation of an update to another state, if the update is in one."""
+        key = self._key(update)
+        if key is None:
+            return
+        await self.preload(update)
+        if key in self._conversations:
+            # Tracked, so the new state gets persisted
+            self._conversations[key] = state
+
+    def memory_usage(self):
+        """Return the estimated bytes of the conversation states held in memory."""
+        conversations = getattr(self._conversations, "data", self._conversations)
+        # Keys are (chat id, user id) tuples, a separate one in each container
+        key_size = sys.getsizeof((0, 0)) + 2 * ID_SIZE
+        return (
+            sys.getsizeof(conversations)
+            + sys.getsizeof(self._restored)
+            + (len(conversations) + len(self._restored)) * key_size
+        )
+
+    def _involves(self, key, chat_ids, user_ids):
+        # Keys are (chat id, user id), or just one of them without per_chat or per_user
+        chat_id = key[0] if self.per_chat else None
+        user_id = key[1 if self.per_chat else 0] if self.per_user else None
+        return chat_id in chat_ids or user_id in user_ids
+
+    def release(self, chat_ids, user_ids):
+        """
+        Drop the conversations in chats `chat_ids` and of users `user_ids` from memory
+
+        Returns:
+            Dict (handler name, key) -> state of the dropped conversations, for
+            SQLitePersistence.release, which keeps them in the database
+        """
+        released = {}
+        for key in [k for k in self._conversations if self._involves(k, chat_ids, user_ids)]:
+            released[(self.name, key)] = self._conversations.pop(key)
+        self._restored = {k for k in self._restored if not self._involves(k, chat_ids, user_ids)}
+        return released
+
+
+
+def loaded_chat_ids(application):
+    """Return the ids of chats and users whose state the application holds in memory."""
+    ids = set(application.chat_data) | set(application.user_data)
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, LazyConversationHandler):
+                ids |= handler.loaded_chat_ids()
+    return ids
+
+
+async def release_chats(application, chat_ids=(), user_ids=()):
+    """
+    Write the state of chats and users to the database and drop it from memory
+
+    Used when another process takes over these chats or to bound memory; if
+    they come back, their state is loaded from the database again.
+
+    Args:
+        application: Application using SQLitePersistence
+        chat_ids: Ids of the chats to release: their chat_data and the
+            conversations in them
+        user_ids: Ids of the users to release: their user_data and their
+            conversations in any chat
+    """
+    chat_ids, user_ids = set(chat_ids), set(user_ids)
+    persistence = application.persistence
+    # Nothing awaits until the data is dropped, so an update of these chats
+    # can't change it after it was buffered; updates arriving later load it
+    # from the buffered writes
+    conversations = {}
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, LazyConversationHandler):
+                conversations.update(handler.release(chat_ids, user_ids))
+    user_data = {i: application.user_data[i] for i in user_ids if i in application.user_data}
+    chat_data = {i: application.chat_data[i] for i in chat_ids if i in application.chat_data}
+    persistence.release(user_data, chat_data, conversations)
+    for user_id in user_data:
+        application.drop_user_data(user_id)
+    for chat_id in chat_data:
+        application.drop_chat_data(chat_id)
+    # Hand the drops to the persistence before updates can touch these ids again
+    await application.update_persistence()
+    await persistence.write_pending()
@@ -0,0 +1,281 @@
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from search import tokenize
+
+SYSTEM_PROMPT = (
+    "Ты помощник абитуриента магистратуры ИТМО. Отвечай только на вопросы об "
+    "учебной программе «{name}»: её содержании, курсах, учебном плане, формате "
+    "обучения и поступлении. Используй только сведения из контекста ниже; если "
+    "ответа в нём нет, так и скажи. На вопросы на другие темы вежливо откажись "
+    "отвечать. Отвечай кратко, на языке вопроса.\n\nКонтекст:\n{context}"
+)
+
+# Chunk size in characters
+CHUNK_SIZE = 800
+
+# Words that don't change what a question asks. Question words and "не" are kept
+STOP_WORDS = frozenset(
+    "а в во и или на о об обо от по при про с со у к ко за из для до ли же бы "
+    "ну мне меня я вы a an the of in on to for is are do does".split()
+)
+
+# Words are compared by their beginning, so "программе" matches "программы"
+STEM_LENGTH = 6
+
+# Dimensions of the hashed question vectors of the answer cache
+QUESTION_FEATURES = 2**12
+
+# Similarity from which a cached answer is reused. Binary vectors of content
+# words: questions with the same words are at 1, one different word out of
+# ten is at 0.9, one extra word out of ten at 0.95 (see tests/test_qa.py)
+ANSWER_CACHE_THRESHOLD = 0.99
+
+
+def chunk_text(text, size=CHUNK_SIZE):
+    """
+    Split text into chunks of about `size` characters along paragraph and line breaks
+
+    Args:
+        text: Text to split
+        size: Target chunk size in characters
+
+    Returns:
+        List of chunks
+    """
+    chunks = []
+    current = []
+    length = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if current and length + len(line) > size:
+            chunks.append("\n".join(current))
+            current, length = [], 0
+        current.append(line)
+        length += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def program_documents(program, curriculum=None):
+    """Return the chunks of text known about a program: its description and study plan."""
+    chunks = chunk_text(program.description)
+    if curriculum is not None:
+        by_semester = defaultdict(list)
+        for course in curriculum.courses(program.id):
+            kind = "по выбору" if course.kind == "elective" else "обязательный"
+            by_semester[course.semester].append(
+                f"{course.name} — {course.credits} з.е., {course.hours} ч., {kind}"
+            )
+        for semester, lines in sorted(by_semester.items()):
+            for chunk in chunk_text("\n".join(lines)):
+                chunks.append(f"Учебный план, {semester} семестр:\n{chunk}")
+    return chunks
+
+
+def stems(text):
+    """Return the beginnings of the words of a text, see STEM_LENGTH."""
+    return [token[:STEM_LENGTH] for token in tokenize(text)]
+
+
+def question_vector(text, dimensions=QUESTION_FEATURES):
+    """
+    Return the normalized vector of the content words of a question
+
+    Every word counts, including those no program text contains: words are
+    hashed into `dimensions` signed features instead of looked up in a
+    vocabulary.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for stem in set(stems(text)) - STOP_WORDS:
+        digest = zlib.crc32(stem.encode())
+        vector[digest % dimensions] += 1 if digest & 2**31 else -1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class TfidfIndex:
+    """TF-IDF vectors of texts, e.g. a program's chunks, as one L2-normalized NumPy matrix."""
+
+    def __init__(self, chunks, analyze=tokenize):
+        """
+        Args:
+            chunks: Texts to index, one matrix row each
+            analyze: Function splitting a text into the terms it is indexed by
+        """
+        self.chunks = list(chunks)
+        self.analyze = analyze
+        self.vocabulary = {}
+        tokenized = [analyze(chunk) for chunk in self.chunks]
+        for tokens in tokenized:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        counts = np.zeros((len(self.chunks), len(self.vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(tokenized):
+            for token in tokens:
+                counts[row, self.vocabulary[token]] += 1
+
+        document_frequency = np.count_nonzero(counts, axis=0)
+        self.idf = (
+            np.log((1 + len(self.chunks)) / (1 + document_frequency)) + 1
+        ).astype(np.float32)
+        self.matrix = self._normalize(np.log1p(counts) * self.idf)
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def vectorize(self, text):
+        """Return the normalized TF-IDF vector of a text in this index's vocabulary."""
+        return self.weigh((term, 1.0) for term in self.analyze(text))
+
+    def weigh(self, terms):
+        """Return the normalized TF-IDF vector of (term, count) pairs; unknown terms are ignored."""
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term, count in terms:
+            column = self.vocabulary.get(term)
+            if column is not None:
+                vector[column] += count
+        return self._normalize(np.log1p(vector) * self.idf)
+
+    def top_k(self, vector, k=3):
+        """Return the k chunks most similar to a query vector, best first."""
+        if not self.chunks:
+            return []
+        scores = self.matrix @ vector
+        k = min(k, len(self.chunks))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [self.chunks[i] for i in best if scores[i] > 0]
+
+
+class SemanticAnswerCache:
+    """
+    Answers to previous questions, matched by similarity of their question_vector.
+
+    Question vectors are rows of one NumPy matrix, so a lookup is one
+    matrix-vector product. The matrix grows with use up to `capacity` rows;
+    then the least recently used entry is evicted.
+    """
+
+    def __init__(
+        self,
+        dimensions=QUESTION_FEATURES,
+        capacity=256,
+        threshold=ANSWER_CACHE_THRESHOLD,
+        ttl=24 * 60 * 60,
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors = np.zeros((min(8, capacity), dimensions), dtype=np.float32)
+        self._answers = [None] * capacity
+        self._created = [0.0] * capacity
+        # slot -> None, in least to most recently used order
+        self._lru = OrderedDict()
+
+    def get(self, vector):
+        """Return the cached answer to a question similar enough to `vector`, or None."""
+        if not self._lru or not vector.any():
+            return None
+        scores = self._vectors @ vector
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.threshold or self._answers[slot] is None:
+            return None
+        if time.monotonic() - self._created[slot] > self.ttl:
+            self._answers[slot] = None
+            self._vectors[slot] = 0
+            del self._lru[slot]
+            return None
+        self._lru.move_to_end(slot)
+        return self._answers[slot]
+
+    def put(self, vector, answer):
+        if not vector.any():
+            return
+        if len(self._lru) < self.capacity:
+            slot = len(self._lru)
+            while slot in self._lru:
+                slot = (slot + 1) % self.capacity
+        else:
+            slot, _ = self._lru.popitem(last=False)
+        if slot >= len(self._vectors):
+            rows = min(max(2 * len(self._vectors), slot + 1), self.capacity)
+            grown = np.zeros((rows, self._vectors.shape[1]), dtype=np.float32)
+            grown[: len(self._vectors)] = self._vectors
+            self._vectors = grown
+        self._vectors[slot] = vector
+        self._answers[slot] = answer
+        self._created[slot] = time.monotonic()
+        self._lru[slot] = None
+
+
+class ProgramAssistant:
+    """Retrieval-augmented answers to questions about a study program."""
+
+    def __init__(self, llm_client, indexes, top_k=3, cache_capacity=256):
+        """
+        Args:
+            llm_client: LLMClient used to generate answers
+            indexes: Mapping of program id -> TfidfIndex of its chunks
+            top_k: Number of chunks passed to the model with a question
+            cache_capacity: Number of cached answers per program
+        """
+        self.llm_client = llm_client
+        self.indexes = indexes
+        self.top_k = top_k
+        self.caches = {
+            program_id: SemanticAnswerCache(capacity=cache_capacity) for program_id in indexes
+        }
+
+    @classmethod
+    def build(cls, llm_client, catalog, curriculum=None, **kwargs):
+        """Build the per-program indexes for a ProgramCatalog."""
+        indexes = {
+            program.id: TfidfIndex(program_documents(program, curriculum))
+            for program in catalog.programs
+        }
+        return cls(llm_client, indexes, **kwargs)
+
+    def build_messages(self, program, question, vector):
+        context = "\n\n".join(self.indexes[program.id].top_k(vector, self.top_k))
+        return [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT.format(name=program.name, context=context),
+            },
+            {"role": "user", "content": question},
+        ]
+
+    def cached_answer(self, program, question):
+        """Return the answer to this or a near-identical earlier question, or None."""
+        return self.caches[program.id].get(question_vector(question))
+
+    async def stream_answer(self, program, question):
+        """
+        Answer a question about a program with the LLM and cache the answer
+
+        Args:
+            program: Program the question is about
+            question: Question text
+
+        Yields:
+            The answer text so far, growing as the model generates it
+        """
+        vector = self.indexes[program.id].vectorize(question)
+        answer = ""
+        async for piece in self.llm_client.stream_chat(
+            self.build_messages(program, question, vector)
+        ):
+            answer += piece
+            yield answer
+        if answer:
+            self.caches[program.id].put(question_vector(question), answer)
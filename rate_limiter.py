@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+# Priorities of outgoing messages, lower is sent first
+INTERACTIVE = 0
+BULK = 10
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average and bursts of up to `capacity`."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available, 0 if one is available now."""
+        self.refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def is_full(self):
+        self.refill()
+        return self.tokens >= self.capacity
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """
+    Outbound scheduler keeping the bot below Telegram's flood limits.
+
+    Every request addressed to a chat first waits for that chat's own token
+    bucket (private and group chats have different limits), then for a token
+    of the global bucket. Global tokens are handed out in priority order, so
+    interactive replies overtake queued bulk sends. A RetryAfter from Telegram
+    pauses all sending for the requested time before the request is retried.
+
+    Requests without a chat_id (getMe, setWebhook, ...) are not throttled.
+    Pass rate_limit_args={"priority": BULK} for broadcasts and other
+    non-interactive sends.
+    """
+
+    def __init__(
+        self,
+        overall_rate=30,
+        chat_rate=1,
+        group_rate=20 / 60,
+        chat_burst=3,
+        max_retries=3,
+    ):
+        """
+        Args:
+            overall_rate: Messages per second to all chats together
+            chat_rate: Messages per second to one private chat
+            group_rate: Messages per second to one group chat
+            chat_burst: Messages a chat may get at once before pacing starts
+            max_retries: Retries of a request after RetryAfter errors
+        """
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(overall_rate, overall_rate)
+        self._chat_buckets = {}
+        # Heap of (priority, sequence number, future) waiting for a global token
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._dispatcher = None
+
+    async def initialize(self) -> None:
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Only chats messaged recently need a bucket; a full one is the default state
+            if len(self._chat_buckets) >= 10000:
+                self._chat_buckets = {
+                    k: b for k, b in self._chat_buckets.items() if not b.is_full()
+                }
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    async def _wait_for_chat(self, chat_id):
+        bucket = self._chat_bucket(chat_id)
+        while (delay := bucket.delay()) > 0:
+            await asyncio.sleep(delay)
+        bucket.tokens -= 1
+
+    async def _wait_for_turn(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        """Hand out global tokens to waiting requests, most urgent first."""
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            delay = self._bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            # The request may have been cancelled while it waited
+            if not future.done():
+                self._bucket.tokens -= 1
+                future.set_result(None)
+            metrics.OUTBOUND_QUEUED.set(len(self._waiters))
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        priority = (rate_limit_args or {}).get("priority", INTERACTIVE)
+        label = "bulk" if priority >= BULK else "interactive"
+        retries = 0
+        while True:
+            started = time.perf_counter()
+            await self._wait_for_chat(chat_id)
+            await self._wait_for_turn(priority)
+            metrics.OUTBOUND_WAIT.observe(time.perf_counter() - started, label)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                metrics.RETRY_AFTER.inc(endpoint)
+                if retries == self.max_retries:
+                    raise
+                retries += 1
+                # Telegram asks everyone to wait, not only this chat
+                retry_after = exc.retry_after
+                if not isinstance(retry_after, (int, float)):
+                    retry_after = retry_after.total_seconds()
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after + 0.1
+                )
+                self._wakeup.set()
@@ -0,0 +1,178 @@
+import math
+import re
+from collections import defaultdict
+
+# Field weights: a hit in a program's name counts much more than one in a course title
+NAME_WEIGHT = 5.0
+ALIAS_WEIGHT = 4.0
+COURSE_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.5
+
+# Weight of all synonyms of a word together, relative to the word itself
+SYNONYM_FACTOR = 0.5
+
+# Minimum trigram similarity for a misspelled token to match an indexed one
+MIN_SIMILARITY = 0.4
+
+# Equivalent spellings in Russian and English; they count for less than the typed word
+SYNONYMS = {
+    "ии": ("ai", "искусственный", "интеллект"),
+    "ai": ("ии", "искусственный", "интеллект"),
+    "мо": ("ml",),
+    "ml": ("мо",),
+    "продукт": ("product",),
+    "product": ("продукт",),
+    "интеллект": ("intelligence",),
+    "intelligence": ("интеллект",),
+}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Split text into lowercase tokens with ё replaced by е."""
+    return TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+def synonym_variants(token):
+    """Return [(token or synonym, weight)] for a query token, the synonyms sharing SYNONYM_FACTOR."""
+    synonyms = SYNONYMS.get(token, ())
+    variants = [(token, 1.0)]
+    variants += [(s, SYNONYM_FACTOR / len(synonyms)) for s in synonyms]
+    return variants
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class ProgramSearchIndex:
+    """
+    Inverted index over program names, aliases, descriptions and course titles.
+
+    Built once; a query only touches the postings of its own tokens and of
+    indexed tokens sharing trigrams with them, so it stays well under a
+    millisecond for hundreds of programs.
+    """
+
+    def __init__(self, documents):
+        """
+        Args:
+            documents: Iterable of (program_id, weight, text) triples
+        """
+        postings = defaultdict(lambda: defaultdict(float))
+        programs = set()
+        for program_id, weight, text in documents:
+            programs.add(program_id)
+            for token in tokenize(text):
+                postings[token][program_id] = max(postings[token][program_id], weight)
+
+        # Rare tokens tell programs apart better than ones every program has
+        n = max(len(programs), 1)
+        self._postings = {
+            token: {
+                program_id: weight * (1.0 + math.log(n / len(hits)))
+                for program_id, weight in hits.items()
+            }
+            for token, hits in postings.items()
+        }
+
+        self._trigrams = defaultdict(list)
+        for token in self._postings:
+            for gram in trigrams(token):
+                self._trigrams[gram].append(token)
+        self._trigrams = dict(self._trigrams)
+        self._similar_cache = {}
+
+    @classmethod
+    def from_catalog(cls, catalog, curriculum=None):
+        """
+        Build the index for a ProgramCatalog
+
+        Args:
+            catalog: ProgramCatalog
+            curriculum: CurriculumIndex to take course titles from (optional)
+
+        Returns:
+            ProgramSearchIndex instance
+        """
+        documents = []
+        for program in catalog.programs:
+            documents.append((program.id, NAME_WEIGHT, program.name))
+            documents.append((program.id, ALIAS_WEIGHT, program.id.replace("_", " ")))
+            for alias in program.aliases:
+                documents.append((program.id, ALIAS_WEIGHT, alias))
+            documents.append((program.id, DESCRIPTION_WEIGHT, program.description))
+            if curriculum is not None:
+                for course in curriculum.courses(program.id):
+                    documents.append((program.id, COURSE_WEIGHT, course.name))
+        return cls(documents)
+
+    def _similar_tokens(self, token):
+        """Return [(indexed token, similarity)] for a query token, typos and prefixes included."""
+        cached = self._similar_cache.get(token)
+        if cached is not None:
+            return cached
+
+        if token in self._postings:
+            result = [(token, 1.0)]
+        else:
+            grams = trigrams(token)
+            shared = defaultdict(int)
+            for gram in grams:
+                for candidate in self._trigrams.get(gram, ()):
+                    shared[candidate] += 1
+            result = []
+            for candidate, count in shared.items():
+                similarity = count / (len(grams) + len(trigrams(candidate)) - count)
+                # A typed beginning of a word ("прод" for "продуктами") is a good match too
+                if len(token) >= 3 and candidate.startswith(token):
+                    similarity = max(similarity, 0.8)
+                if similarity >= MIN_SIMILARITY:
+                    result.append((candidate, similarity))
+
+        # Bounded: only the tokens users actually type end up here
+        if len(self._similar_cache) < 10000:
+            self._similar_cache[token] = result
+        return result
+
+    def search(self, text, limit=5):
+        """
+        Rank programs for a free-text query
+
+        Args:
+            text: Query typed by the user
+            limit: Maximum number of results
+
+        Returns:
+            List of (program_id, score), best first
+        """
+        scores = defaultdict(float)
+        for token in tokenize(text):
+            for variant, factor in synonym_variants(token):
+                for indexed, similarity in self._similar_tokens(variant):
+                    for program_id, weight in self._postings[indexed].items():
+                        scores[program_id] += weight * similarity * factor
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    def resolve(self, text, min_score=2.0, margin=1.5):
+        """
+        Resolve free text to one program or a short list of candidates
+
+        Args:
+            text: Query typed by the user
+            min_score: Score below which results are ignored
+            margin: How many times better than the runner-up the best result
+                must be to be taken as the answer
+
+        Returns:
+            Tuple (best program id or None, list of candidate program ids)
+        """
+        ranked = [(p, s) for p, s in self.search(text) if s >= min_score]
+        if not ranked:
+            return None, []
+        if len(ranked) == 1 or ranked[0][1] >= margin * ranked[1][1]:
+            return ranked[0][0], []
+        return None, [p for p, _ in ranked]
@@ -0,0 +1,174 @@
+"""
+Processes one webhook update per invocation, for function platforms (AWS
+Lambda, Yandex Cloud Functions, ...) or running the bot on demand:
+
+    python serverless.py update.json
+
+Importing this module costs next to nothing: main.py, python-telegram-bot
+and the rest are imported by the first invocation, and numpy, pypdf and the
+study plan downloader only when an update needs them. Invocations of a warm
+instance reuse the application. Conversation state lives in PERSISTENCE_PATH
+(e.g. on a volume shared with the next instance): only the chat of the update
+is loaded, and it is written back and dropped before the invocation returns,
+so the next update of that chat may go to a new instance.
+
+Only one instance at a time is supported (limit the function's concurrency
+to 1). The database uses SQLite's rollback journal instead of WAL, whose
+shared-memory index doesn't work across machines, but concurrent instances
+would still depend on the network file system's locking and could handle
+two updates of a chat at once, one overwriting the other's state.
+
+benchmarks/cold_start.py checks the cold start against its budget.
+"""
+
+import asyncio
+import base64
+import hmac
+import json
+import sys
+import time
+
+# Application and event loop shared by the invocations of a warm instance
+_app = None
+_loop = None
+
+# Seconds the first invocation spent importing and building the application
+cold_start_seconds = None
+
+
+async def get_application(request=None):
+    """
+    Return the application, importing and initializing it on the first call
+
+    Args:
+        request: telegram.request.BaseRequest for Bot API calls (optional),
+            e.g. a fake Bot API in benchmarks
+
+    Returns:
+        Initialized Application; it isn't started, updates are passed to process_update
+    """
+    global _app, cold_start_seconds
+
+    if _app is None:
+        started = time.perf_counter()
+        import main
+
+        # No job queue, metrics server or broadcasts of its own: the instance
+        # lives only as long as the invocations keep coming
+        app = main.build_application(
+            request=request, primary=False, metrics_port=None, journal_mode="DELETE"
+        )
+        await app.initialize()
+        await main.start_broadcasts(app, primary=False)
+        # Course titles for the search; the Q&A indexes wait for the first question
+        await main.reload_programs(force=True, with_assistant=False)
+        _app = app
+        cold_start_seconds = time.perf_counter() - started
+    return _app
+
+
+async def process(data, request=None):
+    """
+    Handle one update and store the state of its chat
+
+    Args:
+        data: The update as decoded JSON
+        request: See get_application
+    """
+    from telegram import Update
+
+    import main
+    from persistence import release_chats
+
+    app = await get_application(request)
+    # Program files may have changed since the last invocation of this instance
+    await main.reload_programs(with_assistant=False)
+
+    update = Update.de_json(data, app.bot)
+    await app.process_update(update)
+
+    chat_ids = {update.effective_chat.id} if update.effective_chat else set()
+    user_ids = {update.effective_user.id} if update.effective_user else set()
+    await release_chats(app, chat_ids=chat_ids, user_ids=user_ids)
+    main.sessions.forget(user_ids)
+
+
+def run(data, request=None):
+    """Process an update on the instance's event loop. Blocking."""
+    global _loop
+
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    _loop.run_until_complete(process(data, request))
+
+
+def _secret_token_matches(headers):
+    import my_secrets
+
+    expected = getattr(my_secrets, "WEBHOOK_SECRET", None)
+    if not expected:
+        return True
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    received = headers.get("x-telegram-bot-api-secret-token") or ""
+    return hmac.compare_digest(received.encode(), expected.encode())
+
+
+def handler(event, context=None):
+    """
+    Entry point for function platforms
+
+    Args:
+        event: The update as a dict, or an HTTP event with the update JSON in
+            "body" (base64-encoded if "isBase64Encoded") and the request "headers".
+            With WEBHOOK_SECRET in my_secrets.py, HTTP events must carry it
+        context: Invocation context of the platform, unused
+
+    Returns:
+        HTTP response for the platform's gateway. Errors in handlers still
+        return 200, otherwise Telegram would deliver the update again and again
+    """
+    if "update_id" in event:
+        data = event
+    else:
+        if not _secret_token_matches(event.get("headers")):
+            return {"statusCode": 403}
+        body = event.get("body") or ""
+        try:
+            if event.get("isBase64Encoded"):
+                body = base64.b64decode(body)
+            data = json.loads(body)
+        except ValueError:
+            return {"statusCode": 400}
+
+    run(data)
+    return {"statusCode": 200}
+
+
+def main():
+    """Process the update in the JSON file given as argument, or on stdin."""
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        data = json.load(sys.stdin)
+
+    started = time.perf_counter()
+    run(data)
+    print(
+        f"Update {data.get('update_id')} processed in "
+        f"{1000 * (time.perf_counter() - started):.0f} ms, "
+        f"cold start {1000 * cold_start_seconds:.0f} ms"
+    )
+    _loop.run_until_complete(_shutdown())
+
+
+async def _shutdown():
+    import main
+
+    await _app.shutdown()
+    await main.close_clients(_app)
+
+
+if __name__ == "__main__":
+    main()
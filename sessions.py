@@ -0,0 +1,153 @@
+import sys
+import time
+from collections import OrderedDict
+
+from persistence import ID_SIZE, LazyConversationHandler, SQLitePersistence, release_chats
+
+
+class Session:
+    """
+    What the bot remembers about a user between updates, as context.user_data.
+
+    Slotted: one small object per user instead of a dict with string keys.
+    """
+
+    __slots__ = ("program_id", "last_active")
+
+    # ProgramCatalog resolving the program names stored by earlier versions, set by main.py
+    catalog = None
+
+    def __init__(self):
+        # Id of the selected program, None until the user picks one
+        self.program_id = None
+        # Unix time of the user's latest update, None before the first one
+        self.last_active = None
+
+    def to_dict(self):
+        return {"program_id": self.program_id, "last_active": self.last_active}
+
+    def restore(self, data):
+        """Fill the fields that are still unset from stored data."""
+        if self.program_id is None:
+            program_id = data.get("program_id")
+            if program_id is None and data.get("selected_program") and self.catalog is not None:
+                # Earlier versions stored the program's name as typed by the user
+                program = self.catalog.find(data["selected_program"])
+                program_id = program.id if program else None
+            # One string per program shared by all sessions
+            self.program_id = sys.intern(program_id) if program_id else None
+        if self.last_active is None:
+            self.last_active = data.get("last_active")
+
+
+# Bytes of a session object, its last_active value and the user id keying it
+SESSION_SIZE = sys.getsizeof(Session()) + 2 * ID_SIZE
+# Bytes a dict takes per entry, on average over its growth steps
+DICT_ENTRY_SIZE = (sys.getsizeof(dict.fromkeys(range(2**16))) - sys.getsizeof({})) / 2**16
+
+
+def dict_size(entries):
+    """Estimate the bytes of a dict with that many entries, not counting keys and values."""
+    return sys.getsizeof({}) + int(entries * DICT_ENTRY_SIZE)
+
+
+class SessionStore:
+    """
+    Keeps the sessions held in memory bounded, least recently active first.
+
+    A session idle for longer than `ttl` seconds expires: the next update of
+    its user finds it reset (see touch). Independently, evict() writes the
+    state of idle users and, while the estimated memory of all sessions is
+    over `memory_limit` bytes, of the least recently active ones to the
+    database and drops it from memory (release_chats); it's loaded again if
+    they return.
+    """
+
+    def __init__(self, ttl, memory_limit):
+        self.ttl = ttl
+        self.memory_limit = memory_limit
+        # user id -> Session, least recently active first
+        self._recent = OrderedDict()
+
+    def __len__(self):
+        return len(self._recent)
+
+    def touch(self, user_id, session, now=None):
+        """
+        Record an update of a user
+
+        Args:
+            user_id: Telegram user id
+            session: The user's Session (context.user_data), already loaded
+                from persistence
+            now: Unix time of the update, the current time if None
+
+        Returns:
+            True if the session had expired; it's reset to a new one then
+        """
+        now = int(time.time()) if now is None else now
+        expired = session.last_active is not None and now - session.last_active > self.ttl
+        if expired:
+            session.program_id = None
+        session.last_active = now
+        self._recent[user_id] = session
+        self._recent.move_to_end(user_id)
+        return expired
+
+    def forget(self, user_ids):
+        """Stop tracking users whose state was released from memory elsewhere."""
+        for user_id in user_ids:
+            self._recent.pop(user_id, None)
+
+    def memory_usage(self, application):
+        """
+        Estimate the memory this process holds for users' sessions and conversations
+
+        Container sizes are exact, objects are counted at their typical size,
+        so the estimate takes constant time however many sessions there are.
+
+        Returns:
+            Tuple (number of sessions, estimated bytes)
+        """
+        sessions = len(application.user_data)
+        total = dict_size(sessions) + sys.getsizeof(self._recent) + sessions * SESSION_SIZE
+        if application.persistence.store_data.chat_data:
+            chats = len(application.chat_data)
+            total += dict_size(chats) + chats * (sys.getsizeof({}) + ID_SIZE)
+        if isinstance(application.persistence, SQLitePersistence):
+            total += application.persistence.memory_usage()
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, LazyConversationHandler):
+                    total += handler.memory_usage()
+        return sessions, total
+
+    async def evict(self, application, now=None):
+        """
+        Release idle sessions, and the least recently active ones while over the memory limit
+
+        Args:
+            application: Application using SQLitePersistence
+            now: Unix time, the current time if None
+
+        Returns:
+            Number of released sessions
+        """
+        now = int(time.time()) if now is None else now
+        sessions, total = self.memory_usage(application)
+        over_limit = 0
+        if total > self.memory_limit:
+            over_limit = sessions - int(sessions * self.memory_limit / total)
+
+        released = []
+        while self._recent:
+            user_id, session = next(iter(self._recent.items()))
+            if now - session.last_active <= self.ttl and over_limit <= 0:
+                break
+            del self._recent[user_id]
+            released.append(user_id)
+            over_limit -= 1
+        if released:
+            # With their conversations in all chats
+            await release_chats(application, user_ids=released)
+        return len(released)
@@ -0,0 +1,253 @@
+import json
+import os
+import re
+import tempfile
+import urllib.parse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from document_cache import file_sha256
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+)
+
+# Texts of links/buttons that lead to the study plan
+PLAN_LINK_TEXTS = ("скачать учебный план", "учебный план")
+
+TIMEOUT = 30
+
+
+def create_session(pool_size=8):
+    """Create a requests session with a connection pool shared by all fetches."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+_session = None
+
+
+def get_session():
+    """Return the module-wide pooled session."""
+    global _session
+    if _session is None:
+        _session = create_session()
+    return _session
+
+
+def _looks_like_plan_url(value):
+    lowered = value.lower()
+    return lowered.startswith(("http://", "https://", "/")) and (
+        urllib.parse.urlparse(lowered).path.endswith(".pdf") or "/plan" in lowered
+    )
+
+
+def _find_in_json(data):
+    """Find a study plan URL in embedded page data (e.g. Next.js __NEXT_DATA__)."""
+    candidates = []
+
+    def walk(node, key=""):
+        if isinstance(node, dict):
+            for k, v in node.items():
+                walk(v, str(k))
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, key)
+        elif isinstance(node, str) and _looks_like_plan_url(node):
+            # Values under keys mentioning the plan are the best candidates
+            priority = 0 if "plan" in key.lower() else 1
+            candidates.append((priority, node))
+
+    walk(data)
+    if not candidates:
+        return None
+    return min(candidates, key=lambda c: c[0])[1]
+
+
+def find_study_plan_url(html, page_url):
+    """
+    Extract the study plan PDF link from a program page
+
+    Args:
+        html: HTML of the program page
+        page_url: URL of the page, used to resolve relative links
+
+    Returns:
+        Absolute URL of the study plan or None if no link was found
+    """
+    soup = BeautifulSoup(html, "html.parser")
+
+    # Links with a telling text, then any link to a PDF
+    links = soup.find_all("a", href=True)
+    for link in links:
+        text = " ".join(link.get_text(" ").split()).lower()
+        if any(t in text for t in PLAN_LINK_TEXTS):
+            return urllib.parse.urljoin(page_url, link["href"])
+    for link in links:
+        if urllib.parse.urlparse(link["href"]).path.lower().endswith(".pdf"):
+            return urllib.parse.urljoin(page_url, link["href"])
+
+    # The download button is rendered by JS; its target is in the page data
+    for script in soup.find_all("script"):
+        content = script.string
+        if not content:
+            continue
+        if script.get("type") == "application/json" or script.get("id") == "__NEXT_DATA__":
+            try:
+                found = _find_in_json(json.loads(content))
+            except json.JSONDecodeError:
+                found = None
+        else:
+            match = re.search(r"""["']([^"'\s]+\.pdf)["']""", content)
+            found = match.group(1) if match else None
+        if found:
+            return urllib.parse.urljoin(page_url, found)
+
+    return None
+
+
+def replace_if_changed(tmp_path, output_path):
+    """
+    Atomically move a freshly written file over output_path if its contents differ
+
+    A reader that already opened output_path keeps reading the old file, so
+    a half-written PDF is never visible under output_path.
+
+    Args:
+        tmp_path: Complete new file, on the same filesystem as output_path
+        output_path: Destination path
+
+    Returns:
+        True if output_path was replaced, False if the contents were the same
+    """
+    if os.path.exists(output_path) and file_sha256(tmp_path) == file_sha256(output_path):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, output_path)
+    return True
+
+
+def write_atomically(data, output_path):
+    """Write bytes to output_path via a temporary file; return True if the contents changed."""
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return replace_if_changed(tmp_path, output_path)
+
+
+def _read_validators(meta_path):
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_validators(meta_path, validators):
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(validators, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def download_pdf(pdf_url, output_path, session=None):
+    """
+    Download a PDF with a conditional GET
+
+    The ETag and Last-Modified of the previous download are kept next to the
+    file (<output_path>.meta.json), so an unchanged plan costs a single
+    304 response. The file is replaced atomically and only if its contents
+    changed.
+
+    Args:
+        pdf_url: URL of the PDF
+        output_path: Path where to save the PDF
+        session: requests session (optional, the pooled session by default)
+
+    Returns:
+        Tuple (path, changed) or None if download failed
+    """
+    session = session or get_session()
+    meta_path = f"{output_path}.meta.json"
+
+    headers = {}
+    validators = _read_validators(meta_path)
+    if os.path.exists(output_path) and validators.get("url") == pdf_url:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = session.get(pdf_url, headers=headers, timeout=TIMEOUT)
+    if response.status_code == 304:
+        return output_path, False
+    response.raise_for_status()
+
+    if not response.content.startswith(b"%PDF"):
+        print(f"Response from {pdf_url} is not a PDF")
+        return None
+
+    changed = write_atomically(response.content, output_path)
+
+    _write_validators(
+        meta_path,
+        {
+            "url": pdf_url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        },
+    )
+    return output_path, changed
+
+
+def fetch_study_plan(url, output_path=None, session=None):
+    """
+    Download the study plan of a program page without a browser
+
+    Args:
+        url: URL of the program page
+        output_path: Path where to save the PDF (optional)
+        session: requests session (optional, the pooled session by default)
+
+    Returns:
+        Path to the downloaded PDF file or None if no plan could be fetched
+    """
+    session = session or get_session()
+    try:
+        response = session.get(url, timeout=TIMEOUT)
+        response.raise_for_status()
+
+        pdf_url = find_study_plan_url(response.text, response.url)
+        if not pdf_url:
+            print(f"Could not find a study plan link on {url}")
+            return None
+
+        if not output_path:
+            filename = os.path.basename(urllib.parse.urlparse(pdf_url).path)
+            if not filename.lower().endswith(".pdf"):
+                filename = "study_plan.pdf"
+            output_path = os.path.join(os.getcwd(), filename)
+
+        result = download_pdf(pdf_url, output_path, session=session)
+        if result is None:
+            return None
+        path, changed = result
+        print(f"Study plan {'downloaded' if changed else 'not modified'}: {path}")
+        return path
+
+    except requests.RequestException as e:
+        print(f"Error during HTTP fetch of the study plan: {e}")
+        return None
@@ -0,0 +1,103 @@
+import asyncio
+import os
+
+from telegram.ext import ContextTypes
+
+from document_cache import file_sha256
+
+
+def _content_hash(path):
+    return file_sha256(path) if os.path.exists(path) else None
+
+
+def refresh_study_plan(url, path):
+    """
+    Download a program's study plan and swap it in if it changed. Blocking.
+
+    Args:
+        url: URL of the program page
+        path: Local path of the study plan PDF
+
+    Returns:
+        True if the local file was replaced, False otherwise
+    """
+    # Imported here so the bot doesn't load the downloader (and selenium)
+    # until the first refresh
+    from get_study_plan import get_study_plan
+
+    old_hash = _content_hash(path)
+    # The downloaders write to a temporary file and atomically replace `path`
+    # only when the contents differ
+    if not get_study_plan(url, path):
+        return False
+    return _content_hash(path) != old_hash
+
+
+def _close_browsers():
+    from get_study_plan import get_browser_pool
+
+    get_browser_pool().close()
+
+
+async def refresh_study_plans(study_programs, max_workers=2):
+    """
+    Refresh the study plans of all programs concurrently without blocking the event loop
+
+    Args:
+        study_programs: Mapping of program URL -> program info with path_to_study_plan
+        max_workers: Maximum number of plans downloaded at the same time
+
+    Returns:
+        List of URLs of the programs whose study plan changed
+    """
+    targets = [
+        (url, info["path_to_study_plan"])
+        for url, info in study_programs.items()
+        if info.get("path_to_study_plan")
+    ]
+    slots = asyncio.Semaphore(max_workers)
+
+    async def refresh(url, path):
+        async with slots:
+            # In the loop's default executor: cancelling the refresh doesn't
+            # wait for downloads already running, they finish in the background
+            return await asyncio.to_thread(refresh_study_plan, url, path)
+
+    results = await asyncio.gather(
+        *(refresh(url, path) for url, path in targets), return_exceptions=True
+    )
+    # Browsers are kept warm within one refresh, not between refreshes
+    await asyncio.to_thread(_close_browsers)
+
+    changed = []
+    for (url, _), result in zip(targets, results):
+        if isinstance(result, BaseException):
+            print(f"Error refreshing study plan for {url}: {result}")
+        elif result:
+            changed.append(url)
+    return changed
+
+
+def make_refresh_job(study_programs, max_workers=2, on_change=None):
+    """
+    Build a JobQueue callback that refreshes the given programs' study plans
+
+    Args:
+        study_programs: Mapping of program URL -> program info with path_to_study_plan,
+            or a function returning the current mapping
+        max_workers: Maximum number of plans downloaded at the same time
+        on_change: Coroutine function on_change(context, changed_urls) called
+            when some study plans changed (optional)
+
+    Returns:
+        Coroutine function for JobQueue.run_repeating
+    """
+
+    async def refresh_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+        programs = study_programs() if callable(study_programs) else study_programs
+        changed = await refresh_study_plans(programs, max_workers=max_workers)
+        print(f"Study plans refreshed, changed: {changed or 'none'}")
+        if changed and on_change is not None:
+            await on_change(context, changed)
+
+    return refresh_job
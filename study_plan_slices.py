@@ -0,0 +1,160 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+
+from document_cache import content_hash
+
+# Width in pixels of the rendered first page. Rendered in grayscale to PNG:
+# for a page of small text that is about half the size of a JPEG of the same
+# legibility, and smaller than the whole plan
+PREVIEW_WIDTH = 800
+
+MANIFEST = "manifest.json"
+
+
+@dataclass(frozen=True)
+class PlanSlices:
+    """Files cut from one version of a study plan."""
+
+    sha256: str
+    # PNG of the first page, or the first page as a PDF without pymupdf
+    preview: str
+    preview_is_image: bool
+
+    @classmethod
+    def from_manifest(cls, directory, manifest):
+        return cls(
+            sha256=manifest["sha256"],
+            preview=os.path.join(directory, manifest["preview"]),
+            preview_is_image=manifest["preview"].endswith(".png"),
+        )
+
+
+def _write_pages(reader, page_indexes, path):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for index in page_indexes:
+        writer.add_page(reader.pages[index])
+    # Pages of one plan share fonts; keep one copy of each
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def _render_preview(pdf_path, path):
+    """Render the first page to a PNG. Returns False if pymupdf isn't installed."""
+    try:
+        import pymupdf
+    except ImportError:
+        return False
+    with pymupdf.open(pdf_path) as document:
+        page = document[0]
+        zoom = PREVIEW_WIDTH / page.rect.width
+        pixmap = page.get_pixmap(
+            matrix=pymupdf.Matrix(zoom, zoom), colorspace=pymupdf.csGRAY
+        )
+        pixmap.save(path)
+    return True
+
+
+class StudyPlanSlicer:
+    """
+    First-page previews of study plans, made once per PDF version.
+
+    Semesters aren't cut out of the PDF: a semester's courses are spread over
+    most pages of a plan, so such parts were almost as large as the plan
+    itself. They are sent as text from the curriculum index instead.
+
+    Outputs go to directory/<SHA-256 of the plan>/ with a manifest, so every
+    version of a plan is cut once, however many processes and restarts use
+    it. A version is written to a temporary directory and renamed into place
+    when complete.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # sha256 -> PlanSlices
+        self._slices = {}
+        # SHA-256 of plans that couldn't be cut
+        self._broken = set()
+        self._lock = threading.Lock()
+
+    def prepare(self, pdf_path):
+        """
+        Return the slices of the current version of a plan, cutting them if needed. Blocking.
+
+        Args:
+            pdf_path: Path to the study plan PDF
+
+        Returns:
+            PlanSlices, or None if the PDF doesn't exist or can't be read
+        """
+        try:
+            sha256 = content_hash(pdf_path)
+        except FileNotFoundError:
+            return None
+        slices = self._slices.get(sha256)
+        if slices is not None or sha256 in self._broken:
+            return slices
+
+        with self._lock:
+            directory = os.path.join(self.directory, sha256)
+            try:
+                with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                try:
+                    manifest = self._cut(pdf_path, sha256, directory)
+                except Exception as e:
+                    # pymupdf and pypdf raise all kinds of errors on damaged files
+                    self._broken.add(sha256)
+                    print(f"Study plan {pdf_path} not sliced: {type(e).__name__}: {e}")
+                    return None
+            slices = self._slices[sha256] = PlanSlices.from_manifest(directory, manifest)
+        return slices
+
+    def _cut(self, pdf_path, sha256, directory):
+        from pypdf import PdfReader
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_directory = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            manifest = {"sha256": sha256, "preview": "preview.png"}
+            if not _render_preview(pdf_path, os.path.join(tmp_directory, "preview.png")):
+                manifest["preview"] = "preview.pdf"
+                _write_pages(
+                    PdfReader(pdf_path), [0], os.path.join(tmp_directory, "preview.pdf")
+                )
+
+            with open(os.path.join(tmp_directory, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            try:
+                os.rename(tmp_directory, directory)
+            except OSError:
+                # Another process cut the same version first; use its files
+                shutil.rmtree(tmp_directory, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            raise
+        return manifest
+
+    def prune(self, pdf_paths):
+        """Delete the slices of plan versions other than the current ones of these PDFs."""
+        keep = set()
+        for path in pdf_paths:
+            try:
+                keep.add(content_hash(path))
+            except FileNotFoundError:
+                pass
+        try:
+            entries = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry not in keep and not entry.startswith(".tmp-"):
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+                self._slices.pop(entry, None)
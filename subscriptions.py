@@ -0,0 +1,317 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    program TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    PRIMARY KEY (program, chat_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS dead_chats (
+    chat_id INTEGER PRIMARY KEY,
+    reason TEXT NOT NULL,
+    at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY,
+    program TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    last_chat_id INTEGER NOT NULL,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS program_versions (
+    program TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+"""
+
+# Broadcast statuses
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+
+# Checkpoint of a broadcast that hasn't sent anything; group chat ids are negative
+FIRST_CHAT_ID = -(2**63)
+
+# Errors after which a chat is never messaged again
+DEAD_CHAT_ERRORS = ("chat not found", "user is deactivated", "bot was kicked")
+
+
+class SubscriptionStore:
+    """
+    Subscriptions of chats to programs and the state of broadcasts, in SQLite.
+
+    Subscriptions are (program, chat_id) pairs in a WITHOUT ROWID table, so
+    the subscribers of a program are read in chat_id order straight from the
+    primary key. A broadcast remembers the last chat it got to; it can stop
+    at any point and continue from there.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def subscribe(self, chat_id, program):
+        """Subscribe a chat to a program. Returns False if it already was subscribed."""
+        with self._lock, self._connection:
+            # A chat writing to the bot again is alive again
+            self._connection.execute("DELETE FROM dead_chats WHERE chat_id = ?", (chat_id,))
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO subscriptions (program, chat_id) VALUES (?, ?)",
+                (program, chat_id),
+            )
+        return cursor.rowcount > 0
+
+    def unsubscribe(self, chat_id, program=None):
+        """Unsubscribe a chat from a program, or from all programs. Returns the number removed."""
+        with self._lock, self._connection:
+            if program is None:
+                cursor = self._connection.execute(
+                    "DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,)
+                )
+            else:
+                cursor = self._connection.execute(
+                    "DELETE FROM subscriptions WHERE program = ? AND chat_id = ?",
+                    (program, chat_id),
+                )
+        return cursor.rowcount
+
+    def is_subscribed(self, chat_id, program):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM subscriptions WHERE program = ? AND chat_id = ?",
+                (program, chat_id),
+            ).fetchone()
+        return row is not None
+
+    def count(self, program):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM subscriptions WHERE program = ?", (program,)
+            ).fetchone()[0]
+
+    def subscribers(self, program, after_chat_id, limit):
+        """Return up to `limit` subscribed chat ids greater than `after_chat_id`, ascending."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT chat_id FROM subscriptions WHERE program = ? AND chat_id > ? "
+                "ORDER BY chat_id LIMIT ?",
+                (program, after_chat_id, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_dead(self, chat_ids, reason):
+        """Drop all subscriptions of chats that can't be messaged any more."""
+        now = int(time.time())
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM subscriptions WHERE chat_id = ?", [(c,) for c in chat_ids]
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO dead_chats (chat_id, reason, at) VALUES (?, ?, ?)",
+                [(c, reason, now) for c in chat_ids],
+            )
+
+    def program_changed(self, program, digest):
+        """
+        Remember the hash of a program's description
+
+        Returns:
+            True if a different hash was stored before, False if it is the same or new
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT sha256 FROM program_versions WHERE program = ?", (program,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO program_versions (program, sha256) VALUES (?, ?)",
+                (program, digest),
+            )
+        return row is not None and row[0] != digest
+
+    def create_broadcast(self, program, kind):
+        """Create a broadcast to the current subscribers of a program and return its id."""
+        with self._lock, self._connection:
+            total = self._connection.execute(
+                "SELECT COUNT(*) FROM subscriptions WHERE program = ?", (program,)
+            ).fetchone()[0]
+            cursor = self._connection.execute(
+                "INSERT INTO broadcasts (program, kind, status, created, total, last_chat_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (program, kind, RUNNING, int(time.time()), total, FIRST_CHAT_ID),
+            )
+        return cursor.lastrowid
+
+    def broadcast(self, broadcast_id):
+        """Return a broadcast as a dict, or None if there is no such broadcast."""
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)
+            )
+            row = cursor.fetchone()
+            columns = [d[0] for d in cursor.description]
+        return dict(zip(columns, row)) if row else None
+
+    def broadcasts(self, status=None, limit=20):
+        """Return the latest broadcasts as dicts, optionally only those with a status."""
+        query = "SELECT * FROM broadcasts"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            cursor = self._connection.execute(
+                query + " ORDER BY id DESC LIMIT ?", (*params, limit)
+            )
+            columns = [d[0] for d in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def save_progress(self, broadcast_id, last_chat_id, sent, failed, dead):
+        """Checkpoint a broadcast: add the results of a batch and move past its last chat."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE broadcasts SET last_chat_id = ?, sent = sent + ?, "
+                "failed = failed + ?, dead = dead + ? WHERE id = ?",
+                (last_chat_id, sent, failed, dead, broadcast_id),
+            )
+
+    def set_status(self, broadcast_id, status):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE broadcasts SET status = ? WHERE id = ?", (status, broadcast_id)
+            )
+
+
+class Broadcaster:
+    """
+    Sends a notification to all subscribers of a program, batch by batch.
+
+    Each batch is sent concurrently; the bot's rate limiter paces the sends
+    with bulk priority, so replies to users go first. After every batch the
+    progress is checkpointed, so a paused or interrupted broadcast continues
+    with the next chat instead of starting over.
+    """
+
+    def __init__(self, store, send, batch_size=50):
+        """
+        Args:
+            store: SubscriptionStore
+            send: Coroutine function send(chat_id, program, kind) delivering one notification
+            batch_size: Number of chats notified concurrently
+        """
+        self.store = store
+        self.send = send
+        self.batch_size = batch_size
+        # broadcast id -> task sending it
+        self._tasks = {}
+        self._stopping = False
+        # Held while a broadcast is started, paused or resumed; a pause holds
+        # it until the current batch is sent, so a resume waits for that
+        self._control_lock = asyncio.Lock()
+
+    async def start(self, program, kind):
+        """Create a broadcast to the subscribers of a program and start sending it."""
+        broadcast_id = await asyncio.to_thread(self.store.create_broadcast, program, kind)
+        await self.resume(broadcast_id)
+        return broadcast_id
+
+    async def resume(self, broadcast_id):
+        """Continue a paused or interrupted broadcast from its checkpoint."""
+        async with self._control_lock:
+            if broadcast_id in self._tasks:
+                return
+            await asyncio.to_thread(self.store.set_status, broadcast_id, RUNNING)
+            self._tasks[broadcast_id] = asyncio.create_task(self._run(broadcast_id))
+
+    async def resume_unfinished(self):
+        """Resume broadcasts that were running when the bot stopped."""
+        broadcasts = await asyncio.to_thread(self.store.broadcasts, status=RUNNING, limit=1000)
+        for broadcast in broadcasts:
+            await self.resume(broadcast["id"])
+
+    async def pause(self, broadcast_id):
+        """Stop a broadcast after its current batch; it can be resumed later."""
+        async with self._control_lock:
+            task = self._tasks.get(broadcast_id)
+            await asyncio.to_thread(self.store.set_status, broadcast_id, PAUSED)
+            if task is not None:
+                await asyncio.wait([task])
+
+    async def shutdown(self):
+        """Stop all broadcasts after their current batch, leaving them to be resumed."""
+        self._stopping = True
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _deliver(self, chat_id, program, kind):
+        """Send one notification; return "sent", "failed" or "dead"."""
+        try:
+            await self.send(chat_id, program, kind)
+            return "sent"
+        except Forbidden:
+            # The user blocked the bot or deleted their account
+            return "dead"
+        except BadRequest as e:
+            if any(error in str(e).lower() for error in DEAD_CHAT_ERRORS):
+                return "dead"
+            print(f"Error notifying chat {chat_id}: {e}")
+            return "failed"
+        except RetryAfter:
+            # The rate limiter already retried; try again in a later broadcast
+            return "failed"
+        except Exception as e:
+            print(f"Error notifying chat {chat_id}: {e}")
+            return "failed"
+
+    async def _run(self, broadcast_id):
+        try:
+            broadcast = await asyncio.to_thread(self.store.broadcast, broadcast_id)
+            program, kind = broadcast["program"], broadcast["kind"]
+            last_chat_id = broadcast["last_chat_id"]
+            while True:
+                # Stopped with the bot (stays RUNNING to be resumed) or paused
+                if self._stopping:
+                    return
+                current = await asyncio.to_thread(self.store.broadcast, broadcast_id)
+                if current["status"] != RUNNING:
+                    return
+                chat_ids = await asyncio.to_thread(
+                    self.store.subscribers, program, last_chat_id, self.batch_size
+                )
+                if not chat_ids:
+                    await asyncio.to_thread(self.store.set_status, broadcast_id, DONE)
+                    print(f"Broadcast {broadcast_id} ({program}, {kind}) finished")
+                    return
+
+                results = await asyncio.gather(
+                    *(self._deliver(chat_id, program, kind) for chat_id in chat_ids)
+                )
+                dead = [c for c, r in zip(chat_ids, results) if r == "dead"]
+                if dead:
+                    await asyncio.to_thread(self.store.mark_dead, dead, "undeliverable")
+                for result in results:
+                    metrics.BROADCAST_MESSAGES.inc(result)
+                last_chat_id = chat_ids[-1]
+                await asyncio.to_thread(
+                    self.store.save_progress,
+                    broadcast_id,
+                    last_chat_id,
+                    results.count("sent"),
+                    results.count("failed"),
+                    len(dead),
+                )
+        finally:
+            self._tasks.pop(broadcast_id, None)
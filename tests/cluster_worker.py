@@ -0,0 +1,24 @@
+"""
+Runs cluster.py's command line with every store in a scratch directory:
+
+    python tests/cluster_worker.py <directory> worker --name worker-0 --port 8600
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+    from load_test import use_scratch_stores
+
+    use_scratch_stores(sys.argv.pop(1))
+    import cluster
+
+    cluster.main()
+
+
+if __name__ == "__main__":
+    main()
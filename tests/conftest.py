@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture
+def bot_api():
+    """Bot API stand-in from the load test, answering every call at once."""
+    from load_test import fake_bot_api
+
+    return fake_bot_api()
+
+
+@pytest.fixture(scope="session")
+def bot_main(tmp_path_factory):
+    """main.py imported with every on-disk store in a scratch directory."""
+    from load_test import prepare_environment
+
+    return prepare_environment(str(tmp_path_factory.mktemp("stores")))
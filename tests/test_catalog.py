@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from catalog import ProgramCatalog
+
+VALID = {
+    "url": "https://abit.itmo.ru/program/master/ai",
+    "name": "Искусственный интеллект",
+    "aliases": ["AI Talent"],
+    "description": "Описание",
+    "path_to_study_plan": None,
+}
+
+
+def write_programs(directory, *programs):
+    for index, program in enumerate(programs):
+        path = directory / f"{index}.json"
+        if isinstance(program, str):
+            path.write_text(program, encoding="utf-8")
+        else:
+            path.write_text(json.dumps(program, ensure_ascii=False), encoding="utf-8")
+
+
+def test_valid_file(tmp_path):
+    write_programs(tmp_path, VALID)
+    catalog = ProgramCatalog.from_directory(tmp_path)
+    program = catalog.find("AI Talent")
+    assert program is not None and program.id == "ai"
+    assert catalog.find("a") is None
+
+
+def test_optional_fields_can_be_left_out(tmp_path):
+    write_programs(tmp_path, {"url": VALID["url"], "name": VALID["name"]})
+    program = ProgramCatalog.from_directory(tmp_path).programs[0]
+    assert program.description == ""
+    assert program.path_to_study_plan is None
+
+
+@pytest.mark.parametrize(
+    "program, message",
+    [
+        ({**VALID, "aliases": "AI Talent"}, "'aliases' has the wrong type"),
+        ({**VALID, "aliases": ["AI", 1]}, "'aliases' must be a list of strings"),
+        ({**VALID, "name": ["Искусственный интеллект"]}, "'name' has the wrong type"),
+        ({**VALID, "name": " "}, "'name' is empty"),
+        ({**VALID, "description": 42}, "'description' has the wrong type"),
+        ({**VALID, "path_to_study_plan": True}, "'path_to_study_plan' has the wrong type"),
+        ({k: v for k, v in VALID.items() if k != "url"}, "'url' is missing"),
+        ({**VALID, "alias": ["AI"]}, "unknown field 'alias'"),
+        (["not", "an", "object"], "expected an object"),
+        ('{"url": ', "Invalid program file"),
+    ],
+)
+def test_malformed_file_is_reported_with_its_name(tmp_path, program, message):
+    write_programs(tmp_path, program)
+    with pytest.raises(ValueError, match="0.json") as error:
+        ProgramCatalog.from_directory(tmp_path)
+    assert message in str(error.value)
+
+
+def test_duplicate_program(tmp_path):
+    write_programs(tmp_path, VALID, {**VALID, "name": "Другое имя"})
+    with pytest.raises(ValueError, match="already defined"):
+        ProgramCatalog.from_directory(tmp_path)
@@ -0,0 +1,218 @@
+import asyncio
+import http.server
+import itertools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+
+import httpx
+import pytest
+from tornado.httpserver import HTTPServer
+from tornado.web import Application
+
+from cluster import Front, HashRing, _TelegramHandler, chat_id_of
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cluster_worker.py")
+
+
+def test_ring_moves_only_the_new_workers_share():
+    keys = range(10_000)
+    before = HashRing(["worker-0", "worker-1", "worker-2"])
+    after = HashRing(["worker-0", "worker-1", "worker-2", "worker-3"])
+    moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+
+    assert all(after.node_for(key) == "worker-3" for key in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.35
+
+
+def test_empty_ring():
+    with pytest.raises(LookupError):
+        HashRing().node_for(1)
+
+
+def test_chat_id_of():
+    message = {"chat": {"id": -100}, "from": {"id": 7}}
+    assert chat_id_of({"update_id": 1, "message": message}) == -100
+    assert chat_id_of({"update_id": 1, "callback_query": {"from": {"id": 7}, "message": message}}) == -100
+    assert chat_id_of({"update_id": 1, "inline_query": {"from": {"id": 7}}}) == 7
+    assert chat_id_of({"update_id": 1}) is None
+
+
+def test_updates_without_the_secret_token_are_refused():
+    routed = []
+
+    class Router:
+        async def route(self, update):
+            routed.append(update)
+
+    async def scenario():
+        app = Application(
+            [("/telegram", _TelegramHandler, {"front": Router(), "secret_token": "s3cret"})]
+        )
+        server = HTTPServer(app)
+        port = free_ports(1)
+        server.listen(port, "127.0.0.1")
+        url = f"http://127.0.0.1:{port}/telegram"
+        try:
+            async with httpx.AsyncClient() as client:
+                statuses = []
+                for token in (None, "wrong", "s3cret"):
+                    headers = {"X-Telegram-Bot-Api-Secret-Token": token} if token else {}
+                    response = await client.post(url, json={"update_id": 1}, headers=headers)
+                    statuses.append(response.status_code)
+        finally:
+            server.stop()
+        return statuses
+
+    assert asyncio.run(scenario()) == [403, 403, 200]
+    assert routed == [{"update_id": 1}]
+
+
+class BotAPIServer(http.server.ThreadingHTTPServer):
+    """Bot API stand-in for worker processes, recording the texts sent to each chat."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), BotAPIHandler)
+        self.message_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # chat id -> texts sent to it
+        self.sent = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/bot"
+
+
+class BotAPIHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+        if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            params = {k: v[0] for k, v in urllib.parse.parse_qs(body).items()}
+        else:
+            params = {}
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Test", "username": "test_bot"}
+        elif method.startswith(("send", "edit")):
+            chat_id = int(params.get("chat_id", 0))
+            with self.server.lock:
+                self.server.sent.setdefault(chat_id, []).append(params.get("text", ""))
+            result = {
+                "message_id": next(self.server.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+            }
+        else:
+            result = True
+        response = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+@pytest.fixture
+def bot_api_server():
+    server = BotAPIServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def free_ports(count):
+    """Return the first of `count` consecutive ports free on 127.0.0.1."""
+    for _ in range(100):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            first = probe.getsockname()[1]
+        if first + count > 65535:
+            continue
+        sockets = []
+        try:
+            for port in range(first, first + count):
+                sockets.append(socket.socket())
+                sockets[-1].bind(("127.0.0.1", port))
+            return first
+        except OSError:
+            continue
+        finally:
+            for s in sockets:
+                s.close()
+    raise RuntimeError("No free ports")
+
+
+update_ids = itertools.count(1)
+
+
+def make_update(chat_id, text):
+    message = {
+        "message_id": next(update_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        length = len(text.split()[0])
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": length}]
+    return {"update_id": message["message_id"], "message": message}
+
+
+def test_chats_keep_their_state_when_workers_come_and_go(bot_api_server, tmp_path):
+    chats = range(1001, 1041)
+    three_workers = HashRing(["worker-0", "worker-1", "worker-2"])
+    two_workers = HashRing(["worker-0", "worker-1"])
+    moving = [chat for chat in chats if three_workers.node_for(chat) != two_workers.node_for(chat)]
+    assert moving
+
+    async def say(text, expected_reply):
+        """Send text in every chat and wait for each to get a reply starting with expected_reply."""
+        for chat in chats:
+            await front.route(make_update(chat, text))
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            with bot_api_server.lock:
+                last = {chat: (bot_api_server.sent.get(chat) or [""])[-1] for chat in chats}
+            if all(reply.startswith(expected_reply) for reply in last.values()):
+                return
+            await asyncio.sleep(0.1)
+        wrong = {chat: reply[:40] for chat, reply in last.items() if not reply.startswith(expected_reply)}
+        raise AssertionError(f"No {expected_reply!r} reply in chats {wrong}")
+
+    async def scenario():
+        nonlocal front
+        front = Front(
+            free_ports(3),
+            bot_api_url=bot_api_server.url,
+            worker_command=[sys.executable, "-u", WORKER_SCRIPT, str(tmp_path)],
+        )
+        try:
+            for _ in range(2):
+                await front.add_worker()
+            await say("/start", "Нажмите 'Start'")
+            await say("Start", "Привет!")
+
+            await front.add_worker()
+            assert front.ring.nodes == three_workers.nodes
+            # Only the state in the database can tell the moved chats where they were
+            await say("Show Study Programs", "Список программ")
+
+            await front.remove_worker()
+            assert front.ring.nodes == two_workers.nodes
+            await say("Искусственный интеллект", "Подробнее о программе")
+        finally:
+            await front.stop()
+
+    front = None
+    asyncio.run(scenario())
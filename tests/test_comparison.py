@@ -0,0 +1,56 @@
+from catalog import Program
+from comparison import CourseComparison
+from curriculum import ELECTIVE, REQUIRED, Course
+
+
+def course(semester, name, credits, kind=REQUIRED):
+    return Course(semester, name, kind, "Блок 1", credits, credits * 36)
+
+
+def program(program_id, name):
+    return Program(program_id, f"https://example.com/{program_id}", name, "", None)
+
+
+def build():
+    first = program("first", "Первая")
+    second = program("second", "Вторая")
+    return CourseComparison(
+        [first, second],
+        {
+            "first": [
+                course(1, "Математическая статистика", 3),
+                # The same elective offered in two semesters
+                course(1, "ML System Design", 6, ELECTIVE),
+                course(3, "ML System Design", 6, ELECTIVE),
+                course(2, "Компьютерное зрение", 6, ELECTIVE),
+            ],
+            "second": [
+                course(1, "Математическая статистика", 3),
+                course(2, "ML System Design", 6, ELECTIVE),
+                course(2, "Маркетинг", 6),
+            ],
+        },
+    )
+
+
+def test_course_in_several_semesters_counts_once():
+    comparison = build()
+    column = comparison.course_names.index("ML System Design")
+    assert comparison.credits[0, column] == 6
+    assert comparison._plan_credits.tolist() == [15, 15]
+    text = comparison.compare_text("first", "second")
+    assert "общих курсов 2 (9 з.е. в первой программе)" in text
+    assert "ML System Design — 6 з.е. / 6 з.е." in text
+
+
+def test_overlap_is_credit_weighted_jaccard():
+    pair = build().pair("first", "second")
+    # Shared 9 credits out of 3 + 6 + 6 + 6 in either plan
+    assert abs(pair.overlap - 9 / 21) < 1e-6
+    assert len(pair.common) == 2
+    assert len(pair.only_first) == len(pair.only_second) == 1
+
+
+def test_semesters_are_kept_for_display():
+    text = build().recommend_text("ML system design", "first")
+    assert "ML System Design — 6 з.е., 1, 3 сем." in text
@@ -0,0 +1,105 @@
+import os
+from types import SimpleNamespace
+
+import curriculum
+from curriculum import ELECTIVE, REQUIRED, Course, CurriculumIndex, iter_courses
+
+PAGES = [
+    """Учебный план
+Блок 1. Модули (дисциплины) 60 2160
+Обязательные дисциплины. 1 семестр 9 324
+1 Машинное  обучение 6 216
+1, 2, 3 Иностранный язык 1 36
+Пул выборных дисциплин. 1 семестр 15 540
+1 Глубокое обучение 3 108
+""",
+    """Soft Skills 3 108
+2 Публичные выступления 3 108
+Блок 4. Факультативные модули (дисциплины) 6 216
+Универсальная подготовка 6 216
+4 Английский для исследователей 2 72
+""",
+]
+
+
+def pages(*texts):
+    return [SimpleNamespace(extract_text=lambda text=text: text) for text in texts]
+
+
+def test_courses_and_their_sections_are_read_from_the_table():
+    courses = list(iter_courses(pages(*PAGES)))
+    assert courses[0] == (
+        0,
+        Course(1, "Машинное обучение", REQUIRED, "Обязательные дисциплины. 1 семестр", 6, 216),
+    )
+    # One record per semester, each with the credits of the whole course
+    languages = [(i, c.semester, c.credits) for i, c in courses if c.name == "Иностранный язык"]
+    assert languages == [(0, 1, 1), (0, 2, 1), (0, 3, 1)]
+    assert [c.name for _, c in courses][4:] == [
+        "Глубокое обучение",
+        "Публичные выступления",
+        "Английский для исследователей",
+    ]
+    # The section continues on the next page
+    assert courses[4][1].section == "Пул выборных дисциплин. 1 семестр"
+
+
+def test_kind_comes_from_the_section_or_its_block():
+    kinds = {c.name: c.kind for _, c in iter_courses(pages(*PAGES))}
+    assert kinds == {
+        "Машинное обучение": REQUIRED,
+        "Иностранный язык": REQUIRED,
+        "Глубокое обучение": ELECTIVE,
+        # No marker in "Soft Skills", nor in block 1
+        "Публичные выступления": REQUIRED,
+        # No marker in the section, the block is optional
+        "Английский для исследователей": ELECTIVE,
+    }
+
+
+def test_empty_pages_and_other_lines_are_skipped():
+    texts = [None, "Семестр Название З.е. Часы\n2024 год", PAGES[0]]
+    courses = list(iter_courses(pages(*texts)))
+    assert len(courses) == 5
+    assert {index for index, _ in courses} == {2}
+
+
+def test_plan_is_parsed_again_only_when_the_pdf_changes(tmp_path, monkeypatch):
+    parsed = []
+
+    def parse_study_plan(pdf_path):
+        parsed.append(pdf_path)
+        return [course for _, course in iter_courses(pages(*PAGES))]
+
+    monkeypatch.setattr(curriculum, "parse_study_plan", parse_study_plan)
+    pdf = tmp_path / "plan.pdf"
+    pdf.write_bytes(b"%PDF-1.4 version 1")
+    index_path = str(tmp_path / "curriculum.sqlite3")
+    index = CurriculumIndex(index_path)
+
+    assert index.ensure("ai", str(pdf))
+    assert index.ensure("ai", str(pdf))
+    # The hashes are stored with the courses; a restart doesn't parse either
+    assert CurriculumIndex(index_path).ensure("ai", str(pdf))
+    assert len(parsed) == 1
+
+    pdf.write_bytes(b"%PDF-1.4 version 2")
+    assert index.ensure("ai", str(pdf))
+    assert len(parsed) == 2
+    assert index.semesters("ai") == [1, 2, 3, 4]
+    assert [c.name for c in index.courses("ai", 2)] == [
+        "Иностранный язык",
+        "Публичные выступления",
+    ]
+    assert [c.name for c in index.find("ai", "ОБУЧЕНИЕ")] == [
+        "Машинное обучение",
+        "Глубокое обучение",
+    ]
+    assert not index.ensure("ai", str(tmp_path / "missing.pdf"))
+
+
+def test_real_plan_has_both_kinds():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    courses = curriculum.parse_study_plan(os.path.join(root, "study_plans", "ai.pdf"))
+    assert {c.kind for c in courses} == {REQUIRED, ELECTIVE}
+    assert all(c.credits >= 0 and c.hours >= 0 and c.semester >= 1 for c in courses)
@@ -0,0 +1,68 @@
+import json
+import multiprocessing
+
+import pytest
+
+from document_cache import DocumentCache
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "plan.pdf"
+    path.write_bytes(b"%PDF-1.4 plan")
+    return str(path)
+
+
+def test_processes_keep_each_others_entries(tmp_path, pdf):
+    path = str(tmp_path / "file_ids.json")
+    first, second = DocumentCache(path), DocumentCache(path)
+    first.put("ai", pdf, "id-ai")
+    second.put("ai_product", pdf, "id-product")
+
+    with open(path, encoding="utf-8") as f:
+        assert set(json.load(f)) == {"ai", "ai_product"}
+    # Entries of the other process are seen without restarting
+    assert first.get("ai_product", pdf) == "id-product"
+    assert second.get("ai", pdf) == "id-ai"
+
+
+def test_invalidate_keeps_a_newer_file_id(tmp_path, pdf):
+    path = str(tmp_path / "file_ids.json")
+    first, second = DocumentCache(path), DocumentCache(path)
+    first.put("ai", pdf, "old")
+    second.put("ai", pdf, "new")
+
+    first.invalidate("ai", "old")
+    assert second.get("ai", pdf) == "new"
+    first.invalidate("ai", "new")
+    assert second.get("ai", pdf) is None
+
+
+def test_changed_pdf_invalidates(tmp_path, pdf):
+    cache = DocumentCache(str(tmp_path / "file_ids.json"))
+    cache.put("ai", pdf, "id-ai")
+    with open(pdf, "ab") as f:
+        f.write(b" changed")
+    assert cache.get("ai", pdf) is None
+
+
+def put_many(path, pdf, worker, count):
+    cache = DocumentCache(path)
+    for i in range(count):
+        cache.put(f"{worker}-{i}", pdf, f"id-{worker}-{i}")
+
+
+def test_concurrent_processes_lose_no_entries(tmp_path, pdf):
+    path = str(tmp_path / "file_ids.json")
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=put_many, args=(path, pdf, worker, 20)) for worker in range(4)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(30)
+        assert process.exitcode == 0
+
+    cache = DocumentCache(path)
+    assert all(cache.get(f"{w}-{i}", pdf) == f"id-{w}-{i}" for w in range(4) for i in range(20))
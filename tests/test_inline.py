@@ -0,0 +1,80 @@
+from telegram import InlineQueryResultArticle, InlineQueryResultCachedDocument
+
+from catalog import ProgramCatalog
+from inline import PAGE_SIZE, InlineResultTable
+from search import ProgramSearchIndex
+
+PROGRAMS = {
+    "https://abit.itmo.ru/program/master/ai": {
+        "name": "Искусственный интеллект",
+        "description": "Машинное обучение и проекты для компаний.",
+    },
+    "https://abit.itmo.ru/program/master/ai_product": {
+        "name": "Управление ИИ-продуктами",
+        "aliases": ["AI Product"],
+        "description": "Продуктовая разработка с искусственным интеллектом.",
+    },
+    "https://abit.itmo.ru/program/master/robotics": {
+        "name": "Робототехника",
+        "aliases": ["Роботы и искусственный интеллект"],
+        "description": "Роботы.",
+    },
+}
+
+
+def build_table(programs=PROGRAMS):
+    catalog = ProgramCatalog.from_config(programs)
+    return InlineResultTable(catalog, ProgramSearchIndex.from_catalog(catalog))
+
+
+def test_prefixes_rank_names_before_words_before_aliases():
+    table = build_table()
+    assert table.program_ids("") == ("ai", "ai_product", "robotics")
+    # Beginning of a name, a word of another name and a word of an alias
+    assert table.program_ids("ИСКУС") == ("ai", "robotics")
+    assert table.program_ids("прод") == ("ai_product",)
+    # The whole alias beats a word of a name that only starts with it
+    assert table.program_ids("ai") == ("ai", "ai_product")
+    assert table.program_ids("ai product") == ("ai_product",)
+    assert table.program_ids("робот") == ("robotics",)
+
+
+def test_queries_missing_from_the_table_go_to_the_search_index():
+    table = build_table()
+    # A typo and words in another order aren't prefixes of any name
+    assert table.program_ids("робототехнека")[0] == "robotics"
+    assert table.program_ids("интеллект искусственный")[0] == "ai"
+    assert table.program_ids("нечто совсем другое") == ()
+
+
+def test_pages_stay_within_telegram_limits():
+    programs = {
+        f"https://abit.itmo.ru/program/master/p{i:02}": {"name": f"Программа {i:02}"}
+        for i in range(2 * PAGE_SIZE + 5)
+    }
+    table = build_table(programs)
+
+    def file_id_of(program):
+        return f"file-{program.id}"
+
+    pages = []
+    offset = ""
+    while True:
+        results, offset = table.page("программа", offset, file_id_of)
+        pages.append(results)
+        if not offset:
+            break
+    assert [len(page) for page in pages] == [2 * PAGE_SIZE, 2 * PAGE_SIZE, 10]
+    assert all(len(page) <= 50 for page in pages)
+
+    articles = [r for page in pages for r in page if isinstance(r, InlineQueryResultArticle)]
+    documents = [
+        r for page in pages for r in page if isinstance(r, InlineQueryResultCachedDocument)
+    ]
+    assert [r.id for r in articles] == [p.id for p in table.catalog.programs]
+    assert documents[0].document_file_id == "file-p00"
+
+    # Without uploaded plans a page holds only the articles; the last page has no next_offset
+    results, next_offset = table.page("программа", str(2 * PAGE_SIZE), lambda program: None)
+    assert (len(results), next_offset) == (5, "")
+    assert table.page("программа", "", lambda program: None)[1] == str(PAGE_SIZE)
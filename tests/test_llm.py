@@ -0,0 +1,156 @@
+import asyncio
+import http.server
+import json
+import threading
+import types
+
+import httpx
+import pytest
+
+from llm import LLMClient, OpenAICompatibleClient
+
+REPLY = ["Обучение ", "длится ", "два года."]
+
+
+class LLMServer(http.server.ThreadingHTTPServer):
+    """Stand-in for a local OpenAI-compatible server streaming REPLY as server-sent events."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), LLMHandler)
+        self.requests = []
+        self.status = 200
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class LLMHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, dict(self.headers), json.loads(body)))
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        events = [{"choices": [{"delta": {"role": "assistant"}}]}]
+        events += [{"choices": [{"delta": {"content": piece}}]} for piece in REPLY]
+        for event in events:
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b": keep-alive comment\n\ndata: [DONE]\n\n")
+
+
+@pytest.fixture
+def llm_server():
+    server = LLMServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+async def collect(client, messages):
+    try:
+        return [piece async for piece in client.stream_chat(messages)]
+    finally:
+        await client.close()
+
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        LLMClient()
+
+
+def test_streams_the_reply(llm_server):
+    client = OpenAICompatibleClient(llm_server.url, "local-model", api_key="secret")
+    messages = [{"role": "user", "content": "Сколько длится обучение?"}]
+
+    assert asyncio.run(collect(client, messages)) == REPLY
+    path, headers, payload = llm_server.requests[0]
+    assert path == "/v1/chat/completions"
+    assert headers["Authorization"] == "Bearer secret"
+    assert payload["model"] == "local-model"
+    assert payload["messages"] == messages
+    assert payload["stream"] is True
+
+
+def test_server_error_raises(llm_server):
+    llm_server.status = 500
+    client = OpenAICompatibleClient(llm_server.url, "local-model")
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(collect(client, [{"role": "user", "content": "?"}]))
+
+
+def test_assistant_answers_and_caches(llm_server, bot_main):
+    from qa import ProgramAssistant
+
+    catalog = bot_main.snapshot.catalog
+    program = catalog.programs[0]
+    question = "Сколько длится обучение?"
+
+    async def scenario():
+        client = OpenAICompatibleClient(llm_server.url, "local-model")
+        assistant = ProgramAssistant.build(client, catalog)
+        try:
+            answers = [answer async for answer in assistant.stream_answer(program, question)]
+        finally:
+            await client.close()
+        return answers, assistant.cached_answer(program, question)
+
+    answers, cached = asyncio.run(scenario())
+    assert answers == ["Обучение ", "Обучение длится ", "Обучение длится два года."]
+    assert cached == "Обучение длится два года."
+    # The program's description is in the prompt
+    system = llm_server.requests[0][2]["messages"][0]["content"]
+    assert program.name in system
+
+
+def test_streamed_answer_stops_at_the_message_length_limit(bot_main, monkeypatch):
+    program = bot_main.snapshot.catalog.programs[0]
+    streamed = []
+    edits = []
+
+    class Assistant:
+        def cached_answer(self, program, question):
+            return None
+
+        async def stream_answer(self, program, question):
+            answer = ""
+            for piece in ["Ответ ", "", "очень длинный. " * 400, "Ещё. " * 100]:
+                answer += piece
+                streamed.append(answer)
+                yield answer
+
+    class Message:
+        async def reply_text(self, text, **kwargs):
+            return self
+
+        async def edit_text(self, text, **kwargs):
+            # Telegram refuses an edit that doesn't change the message
+            if edits and edits[-1] == text:
+                raise bot_main.BadRequest("Message is not modified")
+            edits.append(text)
+
+    current = types.SimpleNamespace(catalog=bot_main.snapshot.catalog, assistant=Assistant())
+    monkeypatch.setattr(bot_main, "snapshot", current)
+    monkeypatch.setattr(bot_main, "STREAM_EDIT_INTERVAL", 0)
+    update = types.SimpleNamespace(message=Message())
+    update.message.text = "Расскажите о программе"
+    context = types.SimpleNamespace(user_data=bot_main.Session())
+    context.user_data.program_id = program.id
+
+    assert asyncio.run(bot_main.answer_question(update, context)) == bot_main.ASKING
+    # The last piece isn't waited for: the message is full already
+    assert len(streamed) == 3
+    assert edits == ["Ответ ", bot_main.truncate_message(streamed[-1])]
+    assert len(edits[-1]) == bot_main.MAX_MESSAGE_LENGTH
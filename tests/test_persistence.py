@@ -0,0 +1,212 @@
+import asyncio
+import time
+
+import pytest
+
+import persistence
+from persistence import SQLitePersistence, filesystem_type, release_chats
+
+
+def journal_mode(store):
+    return store._writer.execute("PRAGMA journal_mode").fetchone()[0]
+
+
+def test_filesystem_of_a_local_path(tmp_path):
+    assert filesystem_type(str(tmp_path / "state.sqlite3")) not in persistence.NETWORK_FILESYSTEMS
+
+
+def test_wal_by_default(tmp_path):
+    assert journal_mode(SQLitePersistence(str(tmp_path / "state.sqlite3"))) == "wal"
+
+
+@pytest.mark.parametrize("fs_type", ["nfs4", "cifs", "fuse.sshfs"])
+def test_wal_refused_on_network_storage(tmp_path, monkeypatch, fs_type):
+    monkeypatch.setattr(persistence, "filesystem_type", lambda path: fs_type)
+    path = str(tmp_path / "state.sqlite3")
+    with pytest.raises(ValueError, match=fs_type):
+        SQLitePersistence(path)
+    assert journal_mode(SQLitePersistence(path, journal_mode="DELETE")) == "delete"
+
+
+def test_unknown_journal_mode(tmp_path):
+    with pytest.raises(ValueError, match="MEMORY"):
+        SQLitePersistence(str(tmp_path / "state.sqlite3"), journal_mode="MEMORY")
+
+
+def test_delete_mode_keeps_state(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        store = SQLitePersistence(path, journal_mode="DELETE")
+        await store.update_user_data(1, {"program_id": "ai"})
+        await store.flush()
+
+        data = {}
+        await SQLitePersistence(path, journal_mode="DELETE").refresh_user_data(1, data)
+        return data
+
+    assert asyncio.run(scenario()) == {"program_id": "ai"}
+
+
+def test_concurrent_refreshes_wait_for_the_stored_data(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        store = SQLitePersistence(path)
+        await store.update_user_data(1, {"program_id": "ai"})
+        await store.flush()
+
+        store = SQLitePersistence(path)
+        load_json = store._load_json
+        loads = []
+
+        def slow_load_json(query, params):
+            loads.append(params)
+            time.sleep(0.1)
+            return load_json(query, params)
+
+        monkeypatch.setattr(store, "_load_json", slow_load_json)
+        data = {}
+        seen = []
+
+        async def update():
+            # Updates of the same user in two chats
+            await store.refresh_user_data(1, data)
+            seen.append(dict(data))
+
+        await asyncio.gather(update(), update())
+        return loads, seen
+
+    loads, seen = asyncio.run(scenario())
+    assert loads == [(1,)]
+    assert seen == [{"program_id": "ai"}] * 2
+
+
+def build_app(bot_api, path):
+    """Application with a two-step conversation and Session user data, like main.py's."""
+    from telegram import Update
+    from telegram.ext import Application, ContextTypes, MessageHandler, TypeHandler, filters
+
+    from persistence import LazyConversationHandler
+    from sessions import Session
+
+    async def step(update, context):
+        context.user_data.program_id = update.message.text
+        return int(update.message.text)
+
+    conversation = LazyConversationHandler(
+        entry_points=[MessageHandler(filters.Regex("^1$"), step)],
+        states={n: [MessageHandler(filters.Regex(f"^{n + 1}$"), step)] for n in range(1, 9)},
+        fallbacks=[],
+        name="conversation",
+        persistent=True,
+    )
+    app = (
+        Application.builder()
+        .token("1:test")
+        .request(bot_api)
+        .get_updates_request(bot_api)
+        .context_types(ContextTypes(user_data=Session))
+        .persistence(SQLitePersistence(path, store_chat_data=False))
+        .build()
+    )
+    app.add_handler(TypeHandler(Update, conversation.preload), group=-2)
+    app.add_handler(conversation)
+    return app, conversation
+
+
+update_ids = iter(range(1, 10**6))
+
+
+def message(chat_id, user_id, text):
+    from telegram import Update
+
+    update_id = next(update_ids)
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private" if chat_id == user_id else "group"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+    return Update.de_json(data, None)
+
+
+def stored_states(path):
+    import sqlite3
+
+    with sqlite3.connect(path) as connection:
+        return dict(connection.execute("SELECT key, state FROM conversations"))
+
+
+def test_released_user_keeps_conversations_in_group_chats(bot_api, tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        app, conversation = build_app(bot_api, path)
+        async with app:
+            for text in "12":
+                await app.process_update(message(-100, 7, text))
+            await release_chats(app, user_ids={7})
+            assert 7 not in app.user_data
+            assert not conversation.loaded_chat_ids()
+            assert stored_states(path) == {"[-100, 7]": "2"}
+
+            await app.process_update(message(-100, 7, "3"))
+            assert app.user_data[7].program_id == "3"
+            await app.update_persistence()
+            await app.persistence.write_pending()
+        return stored_states(path)
+
+    assert asyncio.run(scenario()) == {"[-100, 7]": "3"}
+
+
+def test_update_during_release_is_kept(bot_api, tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        app, conversation = build_app(bot_api, path)
+        async with app:
+            await app.process_update(message(7, 7, "1"))
+            release = asyncio.create_task(release_chats(app, chat_ids={7}, user_ids={7}))
+            # The release is writing to the database when the next update comes
+            await asyncio.sleep(0)
+            await app.process_update(message(7, 7, "2"))
+            await release
+
+            assert app.user_data[7].program_id == "2"
+            assert conversation.loaded_chat_ids() == {7}
+            await app.update_persistence()
+            await app.persistence.write_pending()
+        return stored_states(path)
+
+    assert asyncio.run(scenario()) == {"[7, 7]": "2"}
+
+
+def test_conversation_state_is_read_off_the_event_loop(bot_api, tmp_path, monkeypatch):
+    import threading
+
+    path = str(tmp_path / "state.sqlite3")
+    readers = []
+
+    async def scenario():
+        app, conversation = build_app(bot_api, path)
+        async with app:
+            await app.process_update(message(7, 7, "1"))
+            await release_chats(app, chat_ids={7}, user_ids={7})
+
+            load_json = app.persistence._load_json
+
+            def recording_load_json(query, params):
+                readers.append(threading.current_thread())
+                return load_json(query, params)
+
+            monkeypatch.setattr(app.persistence, "_load_json", recording_load_json)
+            await app.process_update(message(7, 7, "2"))
+            return conversation.loaded_chat_ids()
+
+    assert asyncio.run(scenario()) == {7}
+    assert readers and threading.main_thread() not in readers
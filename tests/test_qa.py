@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from qa import ANSWER_CACHE_THRESHOLD, SemanticAnswerCache, question_vector
+
+SAME_QUESTION = [
+    ("Сколько стоит обучение на программе?", "сколько стоит обучение на программе"),
+    ("Сколько стоит обучение на программе?", "Обучение на программе сколько стоит?"),
+    ("Сколько стоит обучение в программе?", "Сколько стоит обучение по программе"),
+    ("Какие курсы есть в программе?", "Какие курсы есть на программе"),
+    ("Можно ли учиться заочно?", "можно учиться заочно"),
+]
+
+DIFFERENT_QUESTION = [
+    ("Сколько стоит обучение на программе?", "Сколько длится обучение на программе?"),
+    ("Сколько стоит обучение?", "Сколько стоит обучение иностранцам?"),
+    ("Можно ли учиться заочно?", "Нельзя учиться заочно?"),
+    ("Есть ли общежитие?", "Нет ли общежития?"),
+    ("Есть ли курс по компьютерному зрению?", "Есть ли курс по обработке текстов?"),
+    (
+        "Какие курсы по выбору есть во втором семестре программы ИИ?",
+        "Какие курсы по выбору есть в третьем семестре программы ИИ?",
+    ),
+]
+
+
+def similarity(a, b):
+    return float(question_vector(a) @ question_vector(b))
+
+
+@pytest.mark.parametrize("first, second", SAME_QUESTION)
+def test_rephrasings_reach_the_threshold(first, second):
+    assert similarity(first, second) >= ANSWER_CACHE_THRESHOLD
+
+
+@pytest.mark.parametrize("first, second", DIFFERENT_QUESTION)
+def test_different_questions_stay_below_the_threshold(first, second):
+    assert similarity(first, second) < ANSWER_CACHE_THRESHOLD
+
+
+def test_words_outside_the_program_texts_count():
+    # Neither "длится" nor "стоит" needs to occur in any program text
+    assert not np.allclose(question_vector("длится"), question_vector("стоит"))
+
+
+def test_cache_returns_only_answers_to_the_same_question():
+    cache = SemanticAnswerCache()
+    cache.put(question_vector("Сколько стоит обучение на программе?"), "Бесплатно")
+    assert cache.get(question_vector("сколько стоит обучение на программе")) == "Бесплатно"
+    assert cache.get(question_vector("Сколько длится обучение на программе?")) is None
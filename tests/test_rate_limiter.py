@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+from rate_limiter import BULK, INTERACTIVE, PriorityRateLimiter
+
+
+def send(limiter, chat_id, callback, priority=INTERACTIVE):
+    """Pass a sendMessage request to a chat through the limiter."""
+    return limiter.process_request(
+        callback, (), {}, "sendMessage", {"chat_id": chat_id}, {"priority": priority}
+    )
+
+
+def test_bulk_sends_wait_behind_interactive_ones():
+    order = []
+
+    def callback(label):
+        async def call():
+            order.append(label)
+
+        return call
+
+    async def scenario():
+        limiter = PriorityRateLimiter()
+        await limiter.initialize()
+        try:
+            requests = [send(limiter, chat, callback(f"bulk {chat}"), BULK) for chat in (1, 2, 3)]
+            requests += [send(limiter, chat, callback(f"reply {chat}")) for chat in (4, 5)]
+            # Queued together, before the dispatcher hands out any token
+            await asyncio.gather(*requests)
+        finally:
+            await limiter.shutdown()
+
+    asyncio.run(scenario())
+    assert order == ["reply 4", "reply 5", "bulk 1", "bulk 2", "bulk 3"]
+
+
+def test_chat_is_paced_after_its_burst():
+    sent = []
+
+    async def callback():
+        sent.append(time.monotonic())
+
+    async def scenario():
+        limiter = PriorityRateLimiter(chat_rate=10, chat_burst=3)
+        await limiter.initialize()
+        try:
+            for _ in range(5):
+                await send(limiter, 1, callback)
+            # Another chat isn't held up by the first one's pacing
+            started = time.monotonic()
+            await send(limiter, 2, callback)
+            assert sent[-1] - started < 0.05
+        finally:
+            await limiter.shutdown()
+
+    asyncio.run(scenario())
+    assert sent[2] - sent[0] < 0.05
+    assert sent[3] - sent[2] >= 0.08
+    assert sent[4] - sent[3] >= 0.08
+
+
+def test_retry_after_pauses_every_chat():
+    calls = []
+    first_failed = asyncio.Event()
+
+    async def flooded():
+        calls.append(("flooded", time.monotonic()))
+        if len(calls) == 1:
+            first_failed.set()
+            raise RetryAfter(datetime.timedelta(seconds=0.2))
+
+    async def other():
+        calls.append(("other", time.monotonic()))
+
+    async def scenario():
+        limiter = PriorityRateLimiter()
+        await limiter.initialize()
+        try:
+            flooded_request = asyncio.create_task(send(limiter, 1, flooded))
+            await first_failed.wait()
+            await asyncio.sleep(0)
+            await asyncio.gather(flooded_request, send(limiter, 2, other))
+        finally:
+            await limiter.shutdown()
+
+    asyncio.run(scenario())
+    failed_at = calls[0][1]
+    assert sorted(label for label, _ in calls) == ["flooded", "flooded", "other"]
+    assert all(at - failed_at >= 0.2 for _, at in calls[1:])
+
+
+def test_retry_after_is_retried_at_most_max_retries_times():
+    calls = []
+
+    async def flooded():
+        calls.append(time.monotonic())
+        raise RetryAfter(datetime.timedelta(seconds=0.01))
+
+    async def scenario():
+        limiter = PriorityRateLimiter(max_retries=2)
+        await limiter.initialize()
+        try:
+            await send(limiter, 1, flooded)
+        finally:
+            await limiter.shutdown()
+
+    with pytest.raises(RetryAfter):
+        asyncio.run(scenario())
+    assert len(calls) == 3
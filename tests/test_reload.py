@@ -0,0 +1,71 @@
+import asyncio
+import json
+import shutil
+import types
+
+
+def use_programs_copy(bot_main, tmp_path, monkeypatch):
+    """Point bot_main to a copy of the program files; the snapshot is restored afterwards."""
+    programs_dir = tmp_path / "programs"
+    shutil.copytree(bot_main.PROGRAMS_DIR, programs_dir)
+    monkeypatch.setattr(bot_main, "PROGRAMS_DIR", str(programs_dir))
+    monkeypatch.setattr(bot_main, "snapshot", bot_main.snapshot)
+    monkeypatch.setattr(bot_main.Session, "catalog", bot_main.Session.catalog)
+    monkeypatch.setattr(bot_main, "rejected_signature", None)
+    return programs_dir
+
+
+def test_invalid_file_keeps_programs_and_is_reported_once(
+    bot_main, tmp_path, monkeypatch, capsys
+):
+    programs_dir = use_programs_copy(bot_main, tmp_path, monkeypatch)
+    assert asyncio.run(bot_main.reload_programs(force=True, with_assistant=False))
+    good = bot_main.snapshot
+
+    broken = json.loads((programs_dir / "ai.json").read_text(encoding="utf-8"))
+    broken["name"] = {"ru": "Искусственный интеллект"}
+    (programs_dir / "ai.json").write_text(json.dumps(broken), encoding="utf-8")
+
+    assert not asyncio.run(bot_main.reload_programs(with_assistant=False))
+    assert not asyncio.run(bot_main.reload_programs(with_assistant=False))
+    assert bot_main.snapshot is good
+    assert capsys.readouterr().out.count("Programs not reloaded") == 1
+
+
+def test_damaged_study_plan_leaves_only_its_program_unindexed(
+    bot_main, tmp_path, monkeypatch, capsys
+):
+    programs_dir = use_programs_copy(bot_main, tmp_path, monkeypatch)
+    damaged = tmp_path / "damaged.pdf"
+    damaged.write_bytes(b"%PDF-1.4 garbage")
+    program = json.loads((programs_dir / "ai.json").read_text(encoding="utf-8"))
+    program["url"] = "https://abit.itmo.ru/program/master/damaged"
+    program["path_to_study_plan"] = str(damaged)
+    (programs_dir / "ai.json").write_text(json.dumps(program), encoding="utf-8")
+
+    assert asyncio.run(bot_main.reload_programs(force=True, with_assistant=False))
+    assert asyncio.run(bot_main.reload_programs(force=True, with_assistant=False))
+    out = capsys.readouterr().out
+    # Tried once per version of the file
+    assert out.count("Study plan of damaged not indexed") == 1
+    assert out.count("not sliced") == 1
+    other = bot_main.snapshot.catalog.by_id["ai_product"]
+    assert bot_main.curriculum.ensure(other.id, other.path_to_study_plan)
+
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = types.SimpleNamespace(message=types.SimpleNamespace(reply_text=reply_text))
+    context = types.SimpleNamespace(user_data=bot_main.Session())
+    context.user_data.program_id = "damaged"
+
+    async def scenario():
+        assert await bot_main.get_indexed_program(update, context) is None
+        assert await bot_main.get_plan_slices(update, context) == (
+            bot_main.snapshot.catalog.by_id["damaged"], None
+        )
+
+    asyncio.run(scenario())
+    assert replies == ["К сожалению, файл учебного плана не найден."] * 2
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+from catalog import ProgramCatalog
+from search import ProgramSearchIndex, synonym_variants
+
+PROGRAMS = {
+    "https://abit.itmo.ru/program/master/ai": {
+        "name": "Искусственный интеллект",
+        "description": "Проекты компаний и научная работа.",
+    },
+    "https://abit.itmo.ru/program/master/ai_product": {
+        "name": "Управление ИИ-продуктами",
+        "aliases": ["AI Product"],
+        "description": "Продуктовая разработка и анализ данных.",
+    },
+    "https://abit.itmo.ru/program/master/robotics": {
+        "name": "Робототехника",
+        "description": "Роботы и управление ими.",
+    },
+}
+
+COURSES = {
+    "ai": ["Глубокое обучение", "Обработка естественного языка"],
+    "ai_product": ["Продуктовая аналитика"],
+    "robotics": ["Компьютерное зрение", "Глубокое обучение"],
+}
+
+
+class Curriculum:
+    def courses(self, program_id):
+        return [SimpleNamespace(name=name) for name in COURSES[program_id]]
+
+
+def build_index():
+    catalog = ProgramCatalog.from_config(PROGRAMS)
+    return ProgramSearchIndex.from_catalog(catalog, Curriculum())
+
+
+def test_names_outrank_course_titles_and_descriptions():
+    index = build_index()
+    assert index.search("робототехника")[0][0] == "robotics"
+    # Only a course title mentions it
+    assert [p for p, _ in index.search("компьютерное зрение")] == ["robotics"]
+    # The same word in a name and in a description
+    ranked = index.search("управление")
+    assert ranked[0][0] == "ai_product"
+    assert ranked[0][1] > 2 * ranked[1][1]
+
+
+def test_synonyms_count_for_less_than_the_typed_word():
+    assert synonym_variants("ии") == [
+        ("ии", 1.0),
+        ("ai", 0.5 / 3),
+        ("искусственный", 0.5 / 3),
+        ("интеллект", 0.5 / 3),
+    ]
+    assert synonym_variants("данные") == [("данные", 1.0)]
+
+    index = build_index()
+    # "product" is only an alias of ai_product, "продукт" reaches it through its synonym
+    assert index.search("product")[0][0] == "ai_product"
+    assert index.search("продукт")[0][0] == "ai_product"
+    # "ии" is in one program's name; its synonyms find the other one too
+    assert {p for p, _ in index.search("ии")} >= {"ai", "ai_product"}
+
+
+def test_resolve_typos_and_ambiguous_queries():
+    index = build_index()
+    assert index.resolve("искуственный интелект") == ("ai", [])
+    assert index.resolve("роботехника") == ("robotics", [])
+    # A typed beginning of a word is enough
+    assert index.resolve("робото") == ("robotics", [])
+    # Both programs teach it and neither is much better
+    best, candidates = index.resolve("глубокое обучение", min_score=0.5)
+    assert best is None
+    assert sorted(candidates) == ["ai", "robotics"]
+    assert index.resolve("квантовая химия") == (None, [])
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import types
+
+from telegram import Update
+
+from catalog import ProgramCatalog
+from sessions import Session, SessionStore
+
+
+def test_session_expires_after_ttl():
+    store = SessionStore(ttl=60, memory_limit=2**20)
+    session = Session()
+    assert not store.touch(7, session, now=1000)
+    session.program_id = "ai"
+    assert not store.touch(7, session, now=1060)
+    assert store.touch(7, session, now=1121)
+    assert session.program_id is None
+
+
+def test_inline_queries_leave_sessions_alone(bot_main):
+    update = Update.de_json(
+        {
+            "update_id": 1,
+            "inline_query": {
+                "id": "1",
+                "from": {"id": 7, "is_bot": False, "first_name": "User"},
+                "query": "ai",
+                "offset": "",
+            },
+        },
+        None,
+    )
+    before = len(bot_main.sessions)
+    # No user_data: reading it would create a session
+    context = types.SimpleNamespace()
+    asyncio.run(bot_main.track_session(update, context))
+    assert len(bot_main.sessions) == before
+
+
+def colliding_catalog(directory):
+    """Catalog where a program listed first has another program's id as an alias."""
+    programs = {
+        "0.json": {"url": "https://abit.itmo.ru/program/master/ai_product", "name": "AI Product",
+                   "aliases": ["AI"]},
+        "1.json": {"url": "https://abit.itmo.ru/program/master/ai",
+                   "name": "Искусственный интеллект"},
+    }
+    for name, program in programs.items():
+        (directory / name).write_text(json.dumps(program, ensure_ascii=False), encoding="utf-8")
+    return ProgramCatalog.from_directory(directory)
+
+
+def test_stored_program_id_is_kept(tmp_path, monkeypatch):
+    catalog = colliding_catalog(tmp_path)
+    monkeypatch.setattr(Session, "catalog", catalog)
+    # Looking the id up by name would give the other program
+    assert catalog.find("ai").id == "ai_product"
+
+    session = Session()
+    session.restore({"program_id": "ai"})
+    assert catalog.by_id.get(session.program_id).name == "Искусственный интеллект"
+
+
+def test_program_name_of_earlier_versions_becomes_an_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(Session, "catalog", colliding_catalog(tmp_path))
+    session = Session()
+    session.restore({"selected_program": "Искусственный интеллект"})
+    assert session.program_id == "ai"
+
+    unknown = Session()
+    unknown.restore({"selected_program": "Закрытая программа"})
+    assert unknown.program_id is None
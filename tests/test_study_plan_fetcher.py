@@ -0,0 +1,171 @@
+import hashlib
+import http.server
+import json
+import os
+import threading
+
+import pytest
+import requests
+
+from study_plan_fetcher import create_session, download_pdf, fetch_study_plan
+
+PDF_V1 = b"%PDF-1.4 version 1"
+PDF_V2 = b"%PDF-1.4 version 2"
+LAST_MODIFIED = "Wed, 01 Oct 2025 10:00:00 GMT"
+
+
+class FixtureServer(http.server.ThreadingHTTPServer):
+    """Program pages and study plans, with the PDF contents changeable by tests."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.pdf = PDF_V1
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body=b"", content_type="text/html; charset=utf-8", **headers):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        etag = f'"{hashlib.sha256(server.pdf).hexdigest()[:16]}"'
+        if self.path == "/program/link":
+            self.send(200, '<a href="/files/plan.pdf">Скачать учебный план</a>'.encode())
+        elif self.path == "/program/next":
+            data = {"props": {"program": {"academic_plan": "/files/plan.pdf"}}}
+            self.send(
+                200,
+                f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data)}'
+                "</script>".encode(),
+            )
+        elif self.path == "/program/moved":
+            self.send(302, Location="/program/link")
+        elif self.path == "/program/no-link":
+            self.send(200, b"<p>no plan here</p>")
+        elif self.path == "/program/gone":
+            self.send(404, b"not found")
+        elif self.path == "/files/plan.pdf":
+            if self.headers.get("If-None-Match") == etag:
+                self.send(304, ETag=etag)
+            else:
+                self.send(200, server.pdf, "application/pdf", ETag=etag)
+        elif self.path == "/files/dated.pdf":
+            if self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                self.send(304)
+            else:
+                self.send(200, server.pdf, "application/pdf", Last_Modified=LAST_MODIFIED)
+        elif self.path == "/files/moved.pdf":
+            self.send(301, Location="/files/plan.pdf")
+        elif self.path == "/files/html.pdf":
+            self.send(200, b"<html>login required</html>")
+        else:
+            self.send(500, b"server error")
+
+
+@pytest.fixture
+def server():
+    server = FixtureServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session():
+    with create_session() as session:
+        yield session
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_plan_linked_from_the_page(server, session, tmp_path):
+    output = str(tmp_path / "plan.pdf")
+    assert fetch_study_plan(f"{server.url}/program/link", output, session) == output
+    assert read(output) == PDF_V1
+
+
+def test_plan_in_page_data(server, session, tmp_path):
+    output = str(tmp_path / "plan.pdf")
+    assert fetch_study_plan(f"{server.url}/program/next", output, session) == output
+    assert read(output) == PDF_V1
+
+
+def test_redirected_page_resolves_links_against_the_final_url(server, session, tmp_path):
+    output = str(tmp_path / "plan.pdf")
+    assert fetch_study_plan(f"{server.url}/program/moved", output, session) == output
+    assert read(output) == PDF_V1
+
+
+def test_redirected_pdf(server, session, tmp_path):
+    output = str(tmp_path / "plan.pdf")
+    assert download_pdf(f"{server.url}/files/moved.pdf", output, session) == (output, True)
+    assert read(output) == PDF_V1
+
+
+def test_etag_makes_unchanged_plan_a_304(server, session, tmp_path):
+    output = str(tmp_path / "plan.pdf")
+    url = f"{server.url}/files/plan.pdf"
+    assert download_pdf(url, output, session) == (output, True)
+    modified = os.stat(output).st_mtime_ns
+
+    assert download_pdf(url, output, session) == (output, False)
+    assert server.requests[-1][1].get("If-None-Match")
+    assert os.stat(output).st_mtime_ns == modified
+
+    server.pdf = PDF_V2
+    assert download_pdf(url, output, session) == (output, True)
+    assert read(output) == PDF_V2
+
+
+def test_last_modified_makes_unchanged_plan_a_304(server, session, tmp_path):
+    output = str(tmp_path / "plan.pdf")
+    url = f"{server.url}/files/dated.pdf"
+    assert download_pdf(url, output, session) == (output, True)
+    assert download_pdf(url, output, session) == (output, False)
+    assert server.requests[-1][1].get("If-Modified-Since") == LAST_MODIFIED
+
+
+def test_validators_are_not_sent_without_the_file(server, session, tmp_path):
+    output = str(tmp_path / "plan.pdf")
+    url = f"{server.url}/files/plan.pdf"
+    download_pdf(url, output, session)
+    os.remove(output)
+    assert download_pdf(url, output, session) == (output, True)
+    assert "If-None-Match" not in server.requests[-1][1]
+
+
+@pytest.mark.parametrize("path", ["/program/no-link", "/program/gone", "/program/broken"])
+def test_page_errors_return_none(server, session, tmp_path, path):
+    assert fetch_study_plan(f"{server.url}{path}", str(tmp_path / "plan.pdf"), session) is None
+
+
+def test_pdf_server_error_raises(server, session, tmp_path):
+    with pytest.raises(requests.HTTPError):
+        download_pdf(f"{server.url}/files/broken.pdf", str(tmp_path / "plan.pdf"), session)
+
+
+def test_non_pdf_response_keeps_the_old_file(server, session, tmp_path):
+    output = tmp_path / "plan.pdf"
+    output.write_bytes(PDF_V1)
+    assert download_pdf(f"{server.url}/files/html.pdf", str(output), session) is None
+    assert output.read_bytes() == PDF_V1
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import time
+
+import study_plan_refresh
+
+PROGRAMS = {f"https://example.org/{i}": {"path_to_study_plan": f"plan_{i}.pdf"} for i in range(6)}
+
+
+def test_downloads_are_bounded_and_changes_reported(monkeypatch):
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def refresh_study_plan(url, path):
+        with lock:
+            running.append(url)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(url)
+        if url.endswith("3"):
+            raise RuntimeError("site down")
+        return url.endswith(("1", "2"))
+
+    monkeypatch.setattr(study_plan_refresh, "refresh_study_plan", refresh_study_plan)
+    monkeypatch.setattr(study_plan_refresh, "_close_browsers", lambda: None)
+    changed = asyncio.run(study_plan_refresh.refresh_study_plans(PROGRAMS, max_workers=2))
+
+    assert sorted(changed) == ["https://example.org/1", "https://example.org/2"]
+    assert max(peak) == 2
+
+
+def test_cancelling_a_refresh_does_not_wait_for_downloads(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(study_plan_refresh, "refresh_study_plan", lambda url, path: release.wait(5))
+    monkeypatch.setattr(study_plan_refresh, "_close_browsers", lambda: None)
+
+    async def scenario():
+        task = asyncio.create_task(study_plan_refresh.refresh_study_plans(PROGRAMS))
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        elapsed = time.perf_counter() - started
+        # Let the downloads finish, asyncio.run waits for them on shutdown
+        release.set()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.5
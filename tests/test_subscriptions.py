@@ -0,0 +1,113 @@
+import asyncio
+
+from telegram.error import BadRequest, Forbidden
+
+from subscriptions import DONE, PAUSED, Broadcaster, SubscriptionStore
+
+CHATS = [101, 102, 103, 104, 105, 106]
+
+
+def subscribed_store(tmp_path, chats=CHATS):
+    store = SubscriptionStore(str(tmp_path / "subscriptions.sqlite3"))
+    for chat_id in chats:
+        store.subscribe(chat_id, "ai")
+    return store
+
+
+async def finished(store, broadcast_id, timeout=10):
+    """Wait until a broadcast has gone through all its chats."""
+    async with asyncio.timeout(timeout):
+        while store.broadcast(broadcast_id)["status"] != DONE:
+            await asyncio.sleep(0.01)
+
+
+def test_paused_broadcast_continues_from_its_checkpoint(tmp_path):
+    store = subscribed_store(tmp_path)
+    sent = []
+
+    async def scenario():
+        first_batch = asyncio.Event()
+        release = asyncio.Event()
+
+        async def send(chat_id, program, kind):
+            first_batch.set()
+            await release.wait()
+            sent.append(chat_id)
+
+        broadcaster = Broadcaster(store, send, batch_size=2)
+        broadcast_id = await broadcaster.start("ai", "description")
+        await first_batch.wait()
+        pause = asyncio.create_task(broadcaster.pause(broadcast_id))
+        await asyncio.sleep(0.05)
+        release.set()
+        await pause
+
+        paused = store.broadcast(broadcast_id)
+        assert paused["status"] == PAUSED
+        assert paused["last_chat_id"] == 102
+        assert sent == [101, 102]
+
+        await broadcaster.resume(broadcast_id)
+        await finished(store, broadcast_id)
+        return broadcast_id
+
+    broadcast_id = asyncio.run(scenario())
+    assert sent == CHATS
+    done = store.broadcast(broadcast_id)
+    assert done["status"] == DONE
+    assert (done["total"], done["sent"], done["failed"], done["dead"]) == (6, 6, 0, 0)
+
+
+def test_resume_during_a_pause_restarts_the_broadcast(tmp_path):
+    store = subscribed_store(tmp_path)
+    sent = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def send(chat_id, program, kind):
+            await release.wait()
+            sent.append(chat_id)
+
+        broadcaster = Broadcaster(store, send, batch_size=2)
+        broadcast_id = await broadcaster.start("ai", "description")
+        await asyncio.sleep(0.05)
+        pause = asyncio.create_task(broadcaster.pause(broadcast_id))
+        await asyncio.sleep(0.05)
+        # The pause is still waiting for the batch in flight
+        resume = asyncio.create_task(broadcaster.resume(broadcast_id))
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(pause, resume)
+        await finished(store, broadcast_id)
+        return broadcast_id
+
+    broadcast_id = asyncio.run(scenario())
+    assert sent == CHATS
+    assert store.broadcast(broadcast_id)["status"] == DONE
+
+
+def test_undeliverable_chats_are_unsubscribed_and_counted(tmp_path):
+    store = subscribed_store(tmp_path)
+
+    async def send(chat_id, program, kind):
+        if chat_id == 102:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if chat_id == 103:
+            raise BadRequest("Chat not found")
+        if chat_id == 104:
+            raise BadRequest("Message is too long")
+
+    async def scenario():
+        broadcaster = Broadcaster(store, send, batch_size=4)
+        broadcast_id = await broadcaster.start("ai", "study_plan")
+        await finished(store, broadcast_id)
+        return broadcast_id
+
+    broadcast = store.broadcast(asyncio.run(scenario()))
+    assert broadcast["status"] == DONE
+    counters = (broadcast["total"], broadcast["sent"], broadcast["failed"], broadcast["dead"])
+    assert counters == (6, 3, 1, 2)
+    assert [c for c in CHATS if store.is_subscribed(c, "ai")] == [101, 104, 105, 106]
+    # A chat writing to the bot again can subscribe again
+    assert store.subscribe(102, "ai")
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def make_update(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+
+
+def build(bot_api, limit):
+    return (
+        Application.builder()
+        .token("1:test")
+        .request(bot_api)
+        .get_updates_request(bot_api)
+        .concurrent_updates(ChatOrderedUpdateProcessor(limit))
+        .build()
+    )
+
+
+def test_busy_chat_does_not_hold_other_chats(bot_api):
+    async def scenario():
+        app = build(bot_api, limit=8)
+        finished = {}
+
+        async def handle(update, context):
+            if update.effective_chat.id == 1:
+                await asyncio.sleep(0.05)
+            finished[update.update_id] = time.perf_counter()
+
+        app.add_handler(TypeHandler(Update, handle))
+        async with app:
+            started = time.perf_counter()
+            busy = [
+                app.update_processor.process_update(
+                    update, app.process_update(update)
+                )
+                for update in (
+                    Update.de_json(make_update(i, 1, "spam"), app.bot) for i in range(20)
+                )
+            ]
+            tasks = [asyncio.create_task(c) for c in busy]
+            await asyncio.sleep(0)
+            other = Update.de_json(make_update(100, 2, "hi"), app.bot)
+            await app.update_processor.process_update(other, app.process_update(other))
+            other_done = finished[100] - started
+            await asyncio.gather(*tasks)
+        return other_done, [finished[i] for i in range(20)]
+
+    other_done, busy_finished = asyncio.run(scenario())
+    # 20 updates of 50 ms in one chat take a second; the other chat waits for none of them
+    assert other_done < 0.05
+    assert busy_finished == sorted(busy_finished)
+
+
+def test_updates_of_one_chat_run_in_order(bot_api):
+    async def scenario():
+        app = build(bot_api, limit=4)
+        seen = []
+
+        async def handle(update, context):
+            # Later updates are quicker, so they'd overtake earlier ones if not ordered
+            await asyncio.sleep(0.01 * (5 - update.update_id))
+            seen.append(update.update_id)
+
+        app.add_handler(TypeHandler(Update, handle))
+        async with app:
+            updates = [Update.de_json(make_update(i, 1, str(i)), app.bot) for i in range(5)]
+            await asyncio.gather(
+                *(app.update_processor.process_update(u, app.process_update(u)) for u in updates)
+            )
+        return seen
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+
+def test_slots_are_bounded(bot_api):
+    async def scenario():
+        app = build(bot_api, limit=3)
+        running = peak = 0
+
+        async def handle(update, context):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        app.add_handler(TypeHandler(Update, handle))
+        async with app:
+            updates = [Update.de_json(make_update(i, i, "x"), app.bot) for i in range(10)]
+            await asyncio.gather(
+                *(app.update_processor.process_update(u, app.process_update(u)) for u in updates)
+            )
+        return peak
+
+    assert asyncio.run(scenario()) == 3
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates concurrently while keeping them ordered within each chat.
+
+    Updates from different chats run in parallel (up to max_concurrent_updates),
+    but updates from the same chat wait for the previous one to finish, so the
+    ConversationHandler always sees a chat's messages one at a time and in order.
+    An update only takes one of the max_concurrent_updates slots once it is
+    next in its chat, so a chat with a backlog holds one slot, not all of them.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # chat id -> [lock, number of updates holding or waiting for it]
+        self._chat_locks: dict[int, list] = {}
+
+    @staticmethod
+    def _chat_key(update: object):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def process_update(self, update: object, coroutine) -> None:  # type: ignore[misc]
+        """
+        Process an update, taking a slot only in do_process_update.
+
+        BaseUpdateProcessor.process_update takes the slot before calling
+        do_process_update, where updates wait for their chat.
+        """
+        await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        """Run the update's coroutine after earlier updates of the same chat."""
+        key = self._chat_key(update)
+        if key is None:
+            async with self._semaphore:
+                await self._run(coroutine)
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        received = time.perf_counter()
+        metrics.UPDATES_WAITING.inc()
+        waiting = True
+        try:
+            async with entry[0]:
+                metrics.UPDATES_WAITING.dec()
+                waiting = False
+                metrics.UPDATE_WAIT.observe(time.perf_counter() - received)
+                async with self._semaphore:
+                    await self._run(coroutine)
+        finally:
+            if waiting:
+                metrics.UPDATES_WAITING.dec()
+            entry[1] -= 1
+            # Drop locks of idle chats so the dict doesn't grow with every chat seen
+            if entry[1] == 0:
+                del self._chat_locks[key]
+
+    @staticmethod
+    async def _run(coroutine) -> None:
+        """Run an update's coroutine, recording its duration and the in-flight gauge."""
+        profiler = metrics.profiler
+        if profiler is not None:
+            profiler.update_started(id(coroutine))
+        metrics.UPDATES_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await coroutine
+        finally:
+            metrics.UPDATE_DURATION.observe(time.perf_counter() - started)
+            metrics.UPDATES_IN_FLIGHT.dec()
+            if profiler is not None:
+                profiler.update_finished(id(coroutine))
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass